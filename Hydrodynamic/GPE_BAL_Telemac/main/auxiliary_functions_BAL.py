@@ -8,7 +8,7 @@ Contact: eduae94@gmail.com
 import numpy as np
 import math
 
-def compute_fast_likelihood(prediction, observations, error_variance):
+def compute_fast_likelihood(prediction, observations, error_variance, block_size=2**24):
     """
     Calculates the multivariate Gaussian likelihood between model predictions and measured/observed data, taking
     independent errors (diagonal covariance matrix)
@@ -17,10 +17,12 @@ def compute_fast_likelihood(prediction, observations, error_variance):
     ----------
     prediction : array [MC, n_points]
         predicted / modelled values
-    observations: array [1, n_points]
-        observed / measured values
+    observations: array [1, n_points] or [n_points]
+        observed / measured values (e.g. a time series flattened with flatten_time_series)
     error variance : array [n_points]]
         error of the observations
+    block_size : int
+        maximum number of values of the differences computed at the same time
 
     Returns
     -------
@@ -32,30 +34,25 @@ def compute_fast_likelihood(prediction, observations, error_variance):
     * const_mvn is the constant outside the exponent of the multivariate Gaussian likelihood. In some cases this can be
     ignored
     * Method is faster than using stats module.
+    * As the covariance matrix is diagonal, the exponent is a sum of squared differences weighted by the inverse
+    variances, so the [n_points, n_points] matrix is never built. The model runs are processed in blocks, so the
+    memory is bounded by block_size regardless of MC and n_points (which are large for time series)
     """
 
-    cov_mat = np.diag(error_variance)
-    invR = np.linalg.inv(cov_mat)
+    observations = np.atleast_2d(observations)
+    inv_variance = 1 / np.ravel(error_variance)
 
     # Calculate constants:
     #n_points = observations.shape[1]
-    #det_R = np.linalg.det(cov_mat)
+    #det_R = np.prod(error_variance)
     #const_mvn = pow(2 * math.pi, -n_points / 2) * (1 / math.sqrt(det_R))
 
-    # Vectorize means:
-    means_vect = observations[:, np.newaxis]
-
-    # Calculate differences and convert to 4D array (and its transpose):
-    diff = means_vect - prediction  # Shape: # means
-    diff_4d = diff[:, :, np.newaxis]
-    transpose_diff_4d = diff_4d.transpose(0, 1, 3, 2)
-
-    # Calculate values inside the exponent
-    inside_1 = np.einsum("abcd, dd->abcd", diff_4d, invR)
-    inside_2 = np.einsum("abcd, abdc->abc", inside_1, transpose_diff_4d)
-    total_inside_exponent = inside_2.transpose(2, 1, 0)
-    total_inside_exponent = np.reshape(total_inside_exponent,
-                                       (total_inside_exponent.shape[1], total_inside_exponent.shape[2]))
+    # Calculate values inside the exponent, a block of model runs at a time
+    total_inside_exponent = np.zeros((prediction.shape[0], observations.shape[0]))
+    step = max(1, block_size // (observations.shape[0] * observations.shape[1]))
+    for start in range(0, prediction.shape[0], step):
+        diff = observations[:, np.newaxis, :] - prediction[np.newaxis, start:start + step, :]
+        total_inside_exponent[start:start + step] = np.einsum("omn, n, omn->mo", diff, inv_variance, diff)
 
     #likelihood = const_mvn * np.exp(-0.5 * total_inside_exponent)
     likelihood = np.exp(-0.5 * total_inside_exponent)
@@ -74,8 +71,8 @@ def compute_bayesian_scores(prediction, observations, error_variance):
     ----------
     prediction : array [MC, n_points]
         predicted / modelled values
-    observations: array [1, n_points]
-        observed / measured values
+    observations: array [1, n_points] or [n_points]
+        observed / measured values (e.g. a time series flattened with flatten_time_series)
     error_variance : array [n_points]]
         error of the observations
 
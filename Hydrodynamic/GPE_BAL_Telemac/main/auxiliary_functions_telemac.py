@@ -8,18 +8,27 @@ Contact: iamakash0123@gmail.com
 
 # Import libraries
 import sys, os
+import hashlib
+import json
+import multiprocessing
 import subprocess
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED, ALL_COMPLETED
 import numpy as np
 import math
 from datetime import datetime
 import init
 from ppmodules.selafin_io_pp import *
-import pandas as pd
-import rasterio as rio
-from osgeo import gdal
-from osgeo import ogr
-import bea as pp
+from ppmodules.selafin_partitioned import openResults
+from ppmodules.selafin_stats import reduceFrames
+from ppmodules.selafin_derived import resolveVariables, computeVariables, extractDerived
+from ppmodules.selafin_compact import compactSelafin
+from ppmodules.point_location import locatePoints, samplePoints
+from ppmodules.mesh_boundary import boundaryRings, boundaryMask, saveBoundaryMask, loadBoundaryMask
+# The geospatial stack (pandas, rasterio, gdal and bea, which loads geopandas, alphashape, mapclassify and pyproj) and
+# the mesh rasterization are only imported by the functions that make rasters, so that the calibration and the worker
+# processes that only read result files start quickly
 
 def update_steering_file(prior_distribution, parameters_name, friction_name,
                          telemac_name, result_name_telemac, n_simulation):
@@ -214,15 +223,17 @@ def run_telemac(telemac_file_name, number_processors):
 
 
 def get_variable_value(file_name,x_mesh, y_mesh, save_name_xyz="", save_raster="",
-                       save_name = ""):
+                       save_name = "", statistic="", mesh_cache=None, sampling="raster",
+                       variables=("SCALAR VELOCITY", "WATER DEPTH"), derived_params=None, threshold=0.0):
 
     """
-    Function extracts the velocity and water depth variables from the .slf file
+    Function extracts the velocity and water depth variables (or any other variables) from the .slf file
     and arranged in proper format for further processing.
     Parameters
     ----------
-    file_name : String
-    Result file name to extract the calibrated variable
+    file_name : String or list of strings
+    Result file name to extract the calibrated variable, or list of the partition files of a parallel run (read
+    without merging them, see ppmodules.selafin_partitioned)
     x_mesh : Numpy array
     Latitude of the calibration points
     y_mesh : Numpy array
@@ -233,90 +244,764 @@ def get_variable_value(file_name,x_mesh, y_mesh, save_name_xyz="", save_raster="
     Path of the file to save the generated raster from the .xyz file data
     save_name: String
     Path of the file .txt file to save the extracted hydraulic variable data
+    statistic: String
+    Temporal statistic of the variables to use instead of the last time step (min, max, mean, argmax, tmax or
+    duration, see ppmodules.selafin_stats). All the time steps are read in a single pass over the file
+    mesh_cache: String
+    Path of the folder caching the mesh geometry shared by all the result files (see ppSELAFIN.readHeader)
+    sampling: String
+    "raster" interpolates the results to a 1 m raster (cubic) and reads the raster cells of the calibration points,
+    saving the .xyz and .tif files. "mesh" interpolates the results linearly inside the mesh triangle of each
+    calibration point (as Telemac does), without writing any file but save_name. On a synthetic 3000 m x 120 m
+    reach (40000 nodes, 100 points, see benchmarks/point_sampling.py) both agree within 1 % of the field range
+    (0.2 % on average); the mesh sampling is exact for a linear field, and most of the raster error comes from
+    reading the cell instead of the point
+    variables: List of strings
+    Names of the variables to extract, either variables of the .slf file or derived ones computed from them
+    (FROUDE NUMBER, UNIT DISCHARGE, BED SHEAR STRESS, FREE SURFACE SLOPE, see ppmodules.selafin_derived). Each
+    variable of the file is read only once, and the same values are used for the points and the rasters
+    derived_params: Dictionary
+    Parameters of the derived variables (i.e., {"friction_coefficient": 30} for BED SHEAR STRESS)
+    threshold: Float or dictionary
+    Value that the variables exceed during the duration of statistic="duration", either one number for all of them
+    or one per variable (i.e., {"WATER DEPTH": 0.01, "SCALAR VELOCITY": 0.5}); 0 gives the wet duration of the water
+    depth only
     Returns
     -------
-    Numpy array with latitude, longitude, velocity and water depth data.
+    Numpy array with latitude, longitude and the variables (velocity and water depth by default) data.
     """
 
 ########################################################################################################################
-    slf = ppSELAFIN(file_name)
-    slf.readHeader()
+    slf = openResults(file_name, cache_dir=mesh_cache)
     slf.readTimes()
     # Get the printout times
     times = slf.getTimes()
-    # Read the variables names
-    variables_names = slf.getVarNames()
-    # Removed unnecessary spaces from variables_names
-    variables_names = [v.strip() for v in variables_names]
-    variables = ["WATER DEPTH", "SCALAR VELOCITY"]
-    for m in variables:
-        # Get the position of the value of interest
-        index_variable_interest = variables_names.index(m)
-        # Read the variables values in the last time step
-        slf.readVariables(len(times) - 1)
-        # Get the values (for each node) for the variable of interest in the last time step
-        modelled_results = slf.getVarValues()[index_variable_interest, :]
-        x = slf.getMeshX()
-        y = slf.getMeshY()
-        B = np.array([1, 2, 3])
-        for i in range(0, len(x)):
-            if i >= 1:
-                A = np.array([x[i], y[i], modelled_results[i]])
-                B = np.vstack((B, A))
-            else:
-                A = np.array([x[i], y[i], modelled_results[i]])
-                B = A
-        if m == "SCALAR VELOCITY":
-
-            save_name_xyz = save_name_xyz.replace("Waterdepth.xyz","Velocity.xyz")
-        if m == "WATER DEPTH":
-
-            save_name_xyz = save_name_xyz + "Waterdepth.xyz"
-        if len(save_name_xyz) != 0:
-            np.savetxt(save_name_xyz, B, delimiter=",", fmt=['%1.6f', '%1.6f', '%1.8f'], header="x,y,variable")
-        #############################################################################raster generation
-        raster_create(interpol_method="cubic", raster_out_save=save_raster + m + ".tif", save_xyz=save_name_xyz)
-        d = rio.open(save_raster + m + ".tif")
-        row, col = d.index(x_mesh, y_mesh)
-        p = d.read(1)[row, col]
-        if m == "SCALAR VELOCITY":
-            n = p.reshape(-1, 1)
-        if m == "WATER DEPTH":
-            j = p.reshape(-1, 1)
-
-
-    model_result = np.hstack((y_mesh, n))
-    main_result = np.hstack((x_mesh, model_result))
-    main_results = np.hstack((main_result, j))
+    variables = list(variables)
+    if len(statistic) != 0:
+        # Reduce all the time steps of the variables of interest to the requested statistic
+        reduced = reduceFrames(slf, variables, stats=[statistic], threshold=threshold, params=derived_params)
+        selected_results = np.vstack([reduced[m][statistic] for m in variables])
+    else:
+        # Read only the variables needed in the last time step, and derive the others from them
+        selected_results = extractDerived(slf, len(times) - 1, variables, derived_params)
+    if sampling == "mesh":
+        # Sample the calibration points in their mesh triangles (located only once per mesh)
+        nodes, weights = locate_calibration_points(slf, x_mesh, y_mesh, mesh_cache)
+        sampled_results = samplePoints(selected_results, nodes, weights).T
+    else:
+        xyz_names = {"WATER DEPTH": "Waterdepth.xyz", "SCALAR VELOCITY": "Velocity.xyz"}
+        sampled_results = np.zeros((len(x_mesh), len(variables)))
+        for index_variable_interest, m in enumerate(variables):
+            # Get the values (for each node) for the variable of interest, next to the node coordinates
+            modelled_results = selected_results[index_variable_interest, :]
+            xyz = np.column_stack((slf.getMeshX(), slf.getMeshY(), modelled_results))
+            # The .xyz and .tif files are only written if their paths are given
+            xyz_name = save_name_xyz + xyz_names.get(m, m.title().replace(" ", "") + ".xyz") \
+                if len(save_name_xyz) != 0 else ""
+            raster_name = save_raster + m + ".tif" if len(save_raster) != 0 else ""
+            #############################################################################raster generation
+            memfile = raster_create(interpol_method="cubic", raster_out_save=raster_name, save_xyz=xyz_name, xyz=xyz)
+            with memfile.open() as d:
+                sampled_results[:, index_variable_interest] = np.ravel(sample_raster(d, x_mesh, y_mesh))
+            memfile.close()
+    slf.close()
+
+    main_results = np.hstack((x_mesh, y_mesh, sampled_results))
     if len(save_name) != 0:
-        np.savetxt(save_name, main_results, delimiter=" ", fmt=['%1.6f', '%1.6f', '%1.8f','%1.8f'])
+        np.savetxt(save_name, main_results, delimiter=" ", fmt=['%1.6f', '%1.6f'] + ['%1.8f'] * len(variables))
     return main_results
 
 
 
-def raster_create(interpol_method, raster_out_save="", save_xyz=""):
+def get_variable_time_series(file_name, x_mesh, y_mesh, variables=("SCALAR VELOCITY", "WATER DEPTH"),
+                             time_window=None, times_out=None, save_name="", mesh_cache=None, derived_params=None):
+    """
+    Function extracts the time series of the variables at the calibration points from the .slf file of an unsteady
+    run, in a single pass over the file. Only the values of the nodes of the mesh triangles holding the calibration
+    points are read (the file is memory mapped), and the points are sampled in their triangles as in
+    get_variable_value with sampling="mesh"
+    Parameters
+    ----------
+    file_name : String or list of strings
+    Result file name to extract the calibrated variables, or list of the partition files of a parallel run (read
+    without merging them, see ppmodules.selafin_partitioned)
+    x_mesh : Numpy array
+    Latitude of the calibration points
+    y_mesh : Numpy array
+    Longitude of the calibration points
+    variables: List of strings
+    Names of the variables to extract (variables of the .slf file or derived ones, see get_variable_value)
+    time_window: Tuple
+    Start and end time (in seconds) of the frames to extract; all the frames if None
+    times_out: Numpy array
+    Times (in seconds) where the time series are linearly interpolated (i.e., the times of the measurements). If
+    None, the values of the frames are returned
+    save_name: String
+    Path of the .txt file to save the time series, one row per time with the time followed by the values of every
+    point for the first variable, then for the second variable, etc.
+    mesh_cache: String
+    Path of the folder caching the mesh geometry shared by all the result files (see ppSELAFIN.readHeader)
+    derived_params: Dictionary
+    Parameters of the derived variables (see get_variable_value)
+
+    Returns
+    -------
+    Numpy array with the times, and numpy array [n_points, n_variables, n_times] with the time series
+    """
+    slf = openResults(file_name, cache_dir=mesh_cache)
+    slf.readMemmap()
+    times = np.asarray(slf.getTimes(), dtype=np.float64)
+
+    # Frames needed for the requested times (the ones bracketing them when interpolating)
+    first, last = 0, len(times) - 1
+    if times_out is not None:
+        time_window = (np.min(times_out), np.max(times_out))
+    if time_window is not None:
+        first = max(np.searchsorted(times, time_window[0], side="right") - 1, 0)
+        last = min(np.searchsorted(times, time_window[1], side="left"), len(times) - 1)
+        if times_out is None:
+            first = np.searchsorted(times, time_window[0], side="left")
+            last = np.searchsorted(times, time_window[1], side="right") - 1
+        if first > last:
+            raise ValueError("No frame of " + str(file_name) + " between " + str(time_window[0]) + " and " +
+                             str(time_window[1]) + " s")
+
+    # Read the nodes used by the calibration points only (all the nodes if a derived variable needs the mesh), derive
+    # the variables that are not in the file, and sample the points
+    nodes, weights = locate_calibration_points(slf, x_mesh, y_mesh, mesh_cache)
+    raw, need_mesh = resolveVariables(slf.getVarNames(), variables)
+    mesh = None
+    if need_mesh:
+        used_nodes, local_nodes = np.arange(slf.NPOIN), nodes
+        mesh = (slf.getMeshX(), slf.getMeshY(), slf.getIKLE() - 1)
+    else:
+        used_nodes, local_nodes = np.unique(nodes, return_inverse=True)
+    values = slf.extractVariablesAtNodes(used_nodes, raw, first, last)
+    values = computeVariables(dict(zip(raw, values.transpose(1, 0, 2))), variables, mesh, derived_params)
+    sampled = samplePoints(values.transpose(1, 0, 2), local_nodes.reshape(nodes.shape), weights)
+    slf.close()
+    times = times[first:last + 1]
+
+    if times_out is not None:
+        # Linear interpolation in time, with the same frames and weights for every point and variable
+        times_out = np.asarray(times_out, dtype=np.float64).ravel()
+        upper = np.clip(np.searchsorted(times, times_out), 1, max(len(times) - 1, 1))
+        lower = upper - 1
+        if len(times) == 1:
+            upper = lower = np.zeros(len(times_out), dtype=np.int64)
+            w = np.zeros(len(times_out))
+        else:
+            w = np.clip((times_out - times[lower]) / (times[upper] - times[lower]), 0, 1)
+        sampled = sampled[lower] * (1 - w[:, np.newaxis, np.newaxis]) + sampled[upper] * w[:, np.newaxis, np.newaxis]
+        times = times_out
+
+    # From [n_times, n_variables, n_points] to [n_points, n_variables, n_times]
+    series = sampled.transpose(2, 1, 0)
+    if len(save_name) != 0:
+        table = np.column_stack((times, series.transpose(1, 0, 2).reshape(-1, len(times)).T))
+        np.savetxt(save_name, table, delimiter=" ", fmt="%1.8f")
+    return times, series
+
+
+def flatten_time_series(series):
+    """
+    Function arranges the time series of the calibration points as a single vector, the same way as the observations
+    and the model outputs used by the surrogate model: all the points and times of the first variable, then those
+    of the second variable, etc., with the time running fastest
+    Parameters
+    ----------
+    series : Numpy array
+    Time series [n_points, n_variables, n_times], as returned by get_variable_time_series
+
+    Returns
+    -------
+    Numpy array [n_variables * n_points * n_times]
+    """
+    return np.asarray(series).transpose(1, 0, 2).ravel()
+
+
+def _atomic_save(file_name, writer):
+    """
+    Function saves a file through a temporary file of the same folder, which then replaces it, so that no other
+    process ever reads a half written file (i.e., the caches shared by the workers)
+    Parameters
+    ----------
+    file_name : String
+    Path of the file to save
+    writer : Function
+    Called with the path of the temporary file (with the same extension), writes the file there
+    """
+    root, extension = os.path.splitext(file_name)
+    temp_name = root + "_" + str(os.getpid()) + extension
+    writer(temp_name)
+    os.replace(temp_name, file_name)
+
+
+def locate_calibration_points(slf, x_points, y_points, mesh_cache=None):
+    """
+    Function locates the calibration points in the triangles of the mesh and returns the nodes and barycentric
+    weights used to sample the results at those points. If the mesh geometry is cached, the location is cached
+    in the same folder, so it is computed only once for all the result files sharing the mesh
+    Parameters
+    ----------
+    slf : ppSELAFIN object
+    Result file, with its header already read
+    x_points : Numpy array
+    Latitude of the calibration points
+    y_points : Numpy array
+    Longitude of the calibration points
+    mesh_cache: String
+    Path of the folder caching the mesh geometry (see ppSELAFIN.readHeader)
+
+    Returns
+    -------
+    Numpy arrays with the three nodes (zero based) and their weights for each calibration point
     """
-    Function creates rasters from .xyz file data
+    points = np.column_stack((np.ravel(x_points), np.ravel(y_points))).astype(np.float64)
+    cache_name = ""
+    if mesh_cache is not None and slf.geometry_key is not None:
+        points_key = hashlib.sha1(points.tobytes()).hexdigest()
+        cache_name = os.path.join(mesh_cache, slf.geometry_key, "points_" + points_key + ".npz")
+        if os.path.isfile(cache_name):
+            cached = np.load(cache_name)
+            return cached["nodes"], cached["weights"]
+
+    elem, nodes, weights = locatePoints(slf.getMeshX(), slf.getMeshY(), slf.getIKLE() - 1, points[:, 0], points[:, 1])
+
+    if len(cache_name) != 0:
+        _atomic_save(cache_name, lambda temp_name: np.savez(temp_name, nodes=nodes, weights=weights))
+    return nodes, weights
+
+
+def raster_create(interpol_method, raster_out_save="", save_xyz="", xyz=None, ikle=None, plan_name="", save_cube="",
+                  cube_band=1, cube_count=1, cube_description="", tile_size=None, mask_name=""):
+    """
+    Function creates rasters from the node values of the mesh
     Parameters
     ----------
     interpol_method: String
-    name of the interpolation method for rasterisation
+    name of the interpolation method for rasterisation ("linear", "cubic", "nearest" to interpolate the gridded
+    nodes, or "mesh" to interpolate linearly inside the triangles of the mesh, which needs ikle)
     raster_out_save: String
-    path of the file to save the generated raster
+    path of the file to save the generated raster (not saved if empty)
     save_xyz: String
-    Path of the file .xyz file
+    Path of the .xyz file. If xyz is None, the node values are read from it, otherwise xyz is saved to it (not saved
+    if empty)
+    xyz: Numpy array
+    Node coordinates and values (x, y, variable), one row per node
+    ikle: Numpy array
+    Zero based connectivity of the mesh triangles, used by the "mesh" method (which also needs xyz). With the other
+    methods, the raster is clipped to the domain of the mesh (see mesh_domain_mask) if ikle and xyz are given
+    plan_name: String
+    Path of the .npz file caching the resampling plan of the "mesh" method for this mesh and raster grid (the plan
+    is computed and saved if the file does not exist; not cached if empty)
+    save_cube: String
+    Path of the tiled and compressed multi-band raster where the raster is saved as band cube_band (not saved if
+    empty, see bea.PreProFuzzy.array2cube)
+    cube_band: Integer
+    Band of the cube to write
+    cube_count: Integer
+    Number of bands of the cube, used if the cube does not exist yet
+    cube_description: String
+    Description of the band
+    tile_size: Integer
+    Interpolates the nodes in tiles of this size (cells) on a pool of threads, writing the tiles to raster_out_save
+    (or to a temporary raster copied to the cube) as soon as they are done, so the memory used does not grow with the
+    raster (see bea.PreProFuzzy.norm_array_tiled); all at once if None. Not used by the "mesh" method
+    mask_name: String
+    Path of the .npz file caching the mask of the domain of the mesh for the raster grid (see mesh_domain_mask)
+
+    Returns
+    -------
+    rasterio MemoryFile with the generated raster, and saves it in the defined path. None if the raster is written
+    tile by tile (tile_size given with raster_out_save or save_cube), as it is not held in memory
+    """
+    import bea as pp
+    from ppmodules.mesh_raster import buildResamplingPlan, rasterize, saveResamplingPlan, loadResamplingPlan
+    if xyz is None:
+        import pandas as pd
+        node_values = pd.read_csv(save_xyz, skip_blank_lines=True)
+        map_file = pp.PreProFuzzy(node_values, attribute="variable", crs='EPSG:4326', nodatavalue=-9999, res=1)
+    else:
+        if len(save_xyz) != 0:
+            np.savetxt(save_xyz, xyz, delimiter=",", fmt=['%1.6f', '%1.6f', '%1.8f'], header="x,y,variable")
+        # The node arrays are used as they are, without dataframes
+        map_file = pp.PreProFuzzy.from_arrays(xyz[:, 0], xyz[:, 1], xyz[:, 2], attribute="variable", crs='EPSG:4326',
+                                              nodatavalue=-9999, res=1)
+    if interpol_method == "mesh":
+        if len(plan_name) != 0 and os.path.isfile(plan_name):
+            plan = loadResamplingPlan(plan_name)
+        else:
+            # The node arrays of xyz are used (not the ones of map_file) so that they match the ikle numbering
+            plan = buildResamplingPlan(xyz[:, 0], xyz[:, 1], ikle, map_file.xmin, map_file.ymax, map_file.res,
+                                       map_file.nrow, map_file.ncol)
+            if len(plan_name) != 0:
+                _atomic_save(plan_name, lambda temp_name: saveResamplingPlan(temp_name, plan))
+        array_ = rasterize(plan, xyz[:, 2], map_file.nrow, map_file.ncol, nodatavalue=map_file.nodatavalue)
+    else:
+        mask = None
+        if ikle is not None and xyz is not None:
+            # The interpolation fills the convex hull of the nodes; clip it to the domain of the mesh
+            mask = mesh_domain_mask(xyz[:, 0], xyz[:, 1], ikle, map_file, mask_name)
+        if tile_size is not None and (len(raster_out_save) != 0 or len(save_cube) != 0):
+            # The tiles are written to the raster as soon as they are interpolated, so the raster is never held in
+            # memory; the cube band is then copied from the raster block by block
+            tile_file = raster_out_save
+            if len(tile_file) == 0:
+                tile_file = save_cube[0:-4] + "_band" + str(cube_band) + "_" + str(os.getpid()) + ".tif"
+            map_file.norm_array(method=interpol_method, tile_size=tile_size, raster_file=tile_file, mask=mask)
+            if len(save_cube) != 0:
+                map_file.array2cube(tile_file, save_cube, cube_band, cube_count, cube_description)
+            if len(raster_out_save) == 0:
+                os.remove(tile_file)
+            return None
+        array_ = map_file.norm_array(method=interpol_method, tile_size=tile_size, mask=mask)
+    if len(raster_out_save) != 0:
+        map_file.array2raster(array_, raster_out_save, save_ascii=False)
+    if len(save_cube) != 0:
+        map_file.array2cube(array_, save_cube, cube_band, cube_count, cube_description)
+    return map_file.array2memraster(array_)
+
+
+def mesh_domain_mask(x, y, ikle, map_file, mask_name=""):
+    """
+    Function computes the mask of the raster cells inside the domain of the mesh, from the boundary edges of the mesh
+    triangles (see ppmodules.mesh_boundary), instead of clipping the raster with a polygon
+    Parameters
+    ----------
+    x, y : Numpy arrays
+    Coordinates of the mesh nodes
+    ikle : Numpy array
+    Zero based connectivity of the mesh triangles
+    map_file : bea.PreProFuzzy object
+    Defines the raster grid
+    mask_name : String
+    Path of the .npz file caching the mask for this mesh and grid (computed and saved if the file does not exist; not
+    cached if empty)
+
+    Returns
+    -------
+    Boolean numpy array [nrow, ncol], True in the cells inside the domain
+    """
+    if len(mask_name) != 0 and os.path.isfile(mask_name):
+        return loadBoundaryMask(mask_name)
+    mask = boundaryMask(x, y, ikle, map_file.xmin, map_file.ymax, map_file.res, map_file.nrow, map_file.ncol)
+    if len(mask_name) != 0:
+        _atomic_save(mask_name, lambda temp_name: saveBoundaryMask(temp_name, mask))
+    return mask
+
+
+def export_mesh_boundary(file_name, shape_polygon, crs="EPSG:4326", mesh_cache=None):
+    """
+    Function saves the outline of the mesh of a result file as a polygon (with the islands as holes), from the boundary
+    edges of the mesh triangles instead of an alpha shape of the nodes (bea.PreProFuzzy.create_polygon)
+    Parameters
+    ----------
+    file_name : String or list of strings
+    Result file name, or list of the partition files of a parallel run (see get_variable_value)
+    shape_polygon : String
+    Path of the shapefile (.shp) to save
+    crs : String
+    Coordinate reference system
+    mesh_cache : String
+    Path of the folder caching the mesh geometry, where the boundary rings are cached too
+
+    Returns
+    -------
+    Saves the polygon in the defined path
+    """
+    import bea as pp
+    slf = openResults(file_name, cache_dir=mesh_cache)
+    x, y = slf.getMeshX(), slf.getMeshY()
+    cache_name = ""
+    if mesh_cache is not None:
+        # v2: rings chained edge by edge, so that the rings cached before by node (wrong at pinch nodes) are not used
+        cache_name = os.path.join(mesh_cache, slf.geometry_key, "boundary_rings_v2.npz")
+    if len(cache_name) != 0 and os.path.isfile(cache_name):
+        cached = np.load(cache_name)
+        rings = np.split(cached["nodes"], cached["offsets"])
+        areas = cached["areas"]
+    else:
+        rings, areas = boundaryRings(x, y, slf.getIKLE() - 1)
+        if len(cache_name) != 0:
+            nodes, offsets = np.concatenate(rings), np.cumsum([len(r) for r in rings])[:-1]
+            _atomic_save(cache_name, lambda temp_name: np.savez(temp_name, nodes=nodes, offsets=offsets, areas=areas))
+    slf.close()
+    pp.rings2polygon(shape_polygon, x, y, rings, areas, crs)
+
+
+def sample_raster(dataset, x_points, y_points):
+    """
+    Function reads the raster values at the given points, reading only the window of the raster that contains them
+    Parameters
+    ----------
+    dataset: rasterio dataset
+    Raster opened for reading
+    x_points : Numpy array
+    Latitude of the points
+    y_points : Numpy array
+    Longitude of the points
+
+    Returns
+    -------
+    Numpy array with the raster value at each point
+    """
+    import rasterio.windows
+    row, col = dataset.index(np.ravel(x_points), np.ravel(y_points))
+    row = np.asarray(row)
+    col = np.asarray(col)
+    window = rasterio.windows.Window.from_slices((row.min(), row.max() + 1), (col.min(), col.max() + 1))
+    block = dataset.read(1, window=window, boundless=True, fill_value=dataset.nodata)
+    return block[row - row.min(), col - col.min()]
+
+
+def export_raster(file_name, variable, save_name_xyz="", save_raster="", interpol_method="cubic", mesh_cache=None,
+                  save_cube="", cube_band=1, cube_count=1, derived_params=None):
+    """
+    Function creates the raster (and optionally the .xyz file) of one variable in the last time step of a result
+    file. It reads the result file itself, so it can run in a worker process (see RasterExportPool)
+    Parameters
+    ----------
+    file_name : String or list of strings
+    Result file name, or list of the partition files of a parallel run (see get_variable_value)
+    variable : String
+    Name of the variable to rasterise (a variable of the file or a derived one, see get_variable_value)
+    save_name_xyz: String
+    Path of the .xyz file to save (not saved if empty)
+    save_raster: String
+    Path of the raster to save
+    interpol_method: String
+    name of the interpolation method for rasterisation (see raster_create)
+    mesh_cache: String
+    Path of the folder caching the mesh geometry, where the resampling plan of the "mesh" method is cached too
+    save_cube, cube_band, cube_count:
+    Multi-band raster where the raster is saved as a band instead of (or as well as) save_raster (see raster_create)
+    derived_params: Dictionary
+    Parameters of the derived variables (see get_variable_value)
+
+    Returns
+    -------
+    List with the paths of the saved files
+    """
+    slf = openResults(file_name, cache_dir=mesh_cache)
+    values = extractDerived(slf, len(slf.frameOffsets) - 1, [variable], derived_params)[0]
+    xyz = np.column_stack((slf.getMeshX(), slf.getMeshY(), values))
+    plan_name = ""
+    mask_name = ""
+    if mesh_cache is not None:
+        # One plan and one mask per mesh, for the 1 m grid of raster_create
+        plan_name = os.path.join(mesh_cache, slf.geometry_key, "raster_plan_res1.npz")
+        mask_name = os.path.join(mesh_cache, slf.geometry_key, "domain_mask_res1.npz")
+    ikle = slf.getIKLE() - 1
+    slf.close()
+    description = os.path.basename(file_name if isinstance(file_name, str) else file_name[0]) + " " + variable
+    memfile = raster_create(interpol_method=interpol_method, raster_out_save=save_raster, save_xyz=save_name_xyz,
+                            xyz=xyz, ikle=ikle, plan_name=plan_name, save_cube=save_cube, cube_band=cube_band,
+                            cube_count=cube_count, cube_description=description, mask_name=mask_name)
+    memfile.close()
+    return [name for name in (save_name_xyz, save_raster, save_cube) if len(name) != 0]
+
+
+class RasterExportPool:
+    """
+    Runs export_raster jobs in a pool of worker processes, so that the rasters are generated while the calibration
+    goes on. At most max_pending jobs are queued or running; submitting more waits for one of them to finish. Every
+    finished job is recorded (one json line per job) in the manifest file.
+    Parameters
+    ----------
+    manifest_name : String
+    Path of the manifest file
+    max_workers : Integer
+    Number of worker processes
+    max_pending : Integer
+    Maximum number of jobs queued or running at the same time
+    """
+
+    def __init__(self, manifest_name, max_workers=2, max_pending=4):
+        self.manifest_name = manifest_name
+        self.max_pending = max(max_pending, 1)
+        # The calibration script has no main guard, so the workers are forked instead of spawned (which would
+        # run the whole script again in each worker)
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork"))
+        # Start the workers now, before other threads (e.g. the compaction) are busy, so no lock is forked taken
+        self.pool.submit(os.getpid).result()
+        self.pending = {}
+
+    def submit(self, iteration, file_name, variable, save_name_xyz="", save_raster="", interpol_method="cubic",
+               mesh_cache=None, save_cube="", cube_band=1, cube_count=1):
+        """
+        Function queues the raster of one variable of a result file, waiting first if the queue is full
+        Parameters
+        ----------
+        iteration : Integer
+        Bayesian iteration of the result file
+        file_name, variable, save_name_xyz, save_raster, interpol_method, mesh_cache, save_cube, cube_band, cube_count :
+        Same as in export_raster
+
+        Returns
+        -------
+        Future of the job, finished once the raster is saved (see compact_simulation)
+        """
+        while len(self.pending) >= self.max_pending:
+            self.collect(FIRST_COMPLETED)
+        job = {"iteration": iteration, "file": file_name, "variable": variable, "submitted": time.time()}
+        future = self.pool.submit(export_raster, file_name, variable, save_name_xyz, save_raster, interpol_method,
+                                  mesh_cache, save_cube, cube_band, cube_count)
+        self.pending[future] = job
+        return future
+
+    def collect(self, return_when):
+        """
+        Function waits for pending jobs (the first one, or all of them) and records the finished ones in the manifest
+        """
+        done, not_done = wait(list(self.pending), return_when=return_when)
+        with open(self.manifest_name, "a") as manifest:
+            for future in done:
+                job = self.pending.pop(future)
+                job["finished"] = time.time()
+                if future.exception() is None:
+                    job["status"] = "done"
+                    job["outputs"] = future.result()
+                else:
+                    job["status"] = "failed"
+                    job["error"] = repr(future.exception())
+                    print("Raster generation failed for " + job["variable"] + " of " + job["file"] + ": " +
+                          job["error"])
+                manifest.write(json.dumps(job) + "\n")
+
+    def flush(self):
+        """
+        Function waits for all the pending jobs, records them in the manifest and stops the worker processes
+        """
+        if len(self.pending) != 0:
+            self.collect(ALL_COMPLETED)
+        self.pool.shutdown()
+
+
+def finish_raster_cube(cube_name):
+    """
+    Function adds the overviews to a multi-band raster once all its bands are written, so that it can be read
+    quickly at coarse resolutions
+    Parameters
+    ----------
+    cube_name : String
+    Path of the multi-band raster
+
+    Returns
+    -------
+    The multi-band raster with overviews
+    """
+    import bea as pp
+    if os.path.isfile(cube_name):
+        pp.build_overviews(cube_name)
+
+
+def compact_simulation(file_name, variables, frames=None, single_precision=True, save_dropped=False, wait_for=()):
+    """
+    Function replaces a Telemac result file by a trimmed copy that keeps only the variables and time steps used
+    for the calibration, to save disk space in the simulations folder
+    Parameters
+    ----------
+    file_name : String
+    Path of the .slf result file to be compacted
+    variables : List of strings
+    Names of the variables to keep
+    frames : List of integers
+    Indices of the time steps to keep, negative values count from the end (all time steps if None)
+    single_precision : Boolean
+    True to store the trimmed file in single precision
+    save_dropped : Boolean
+    True to keep the left out data in a compressed .npz file next to the result file
+    wait_for : List of futures
+    Jobs still reading the result file (i.e., its rasters, see RasterExportPool.submit). The file is compacted once
+    they are all finished (failed or not), so that they read the original file and it is not replaced while they
+    hold it open (which fails on Windows)
+
+    Returns
+    -------
+    Path of the compacted result file
+    """
+    if len(wait_for) != 0:
+        wait(wait_for, return_when=ALL_COMPLETED)
+    compact_name = file_name[0:-4] + "_compact.slf"
+    sidecar_name = file_name[0:-4] + "_dropped.npz" if save_dropped else None
+    compactSelafin(file_name, compact_name, variables, frames, single_precision, sidecar_name)
+    # Replace the original file only once the trimmed one is complete
+    os.replace(compact_name, file_name)
+    return file_name
+
+
+def file_hash(file_name, block_size=2**24):
+    """
+    Function computes the sha1 hash of the content of a file, reading it in blocks
+    Parameters
+    ----------
+    file_name : String
+    Path of the file
+    block_size : Integer
+    Number of bytes read at a time
+
+    Returns
+    -------
+    String with the hexadecimal hash
+    """
+    digest = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_simulation(file_name, save_name, x_points, y_points, variables, mesh_cache=None, derived_params=None,
+                       previous_hash=None, sampling="raster", times_out=None):
+    """
+    Function extracts the calibration variables of one archived result file (see reextract_simulations), unless its
+    content is the same as when it was last extracted. It can run in a worker process
+    Parameters
+    ----------
+    file_name : String
+    Path of the .slf result file
+    save_name : String
+    Path of the .txt file to save the extracted variables (as in get_variable_value)
+    x_points, y_points, variables, mesh_cache, derived_params :
+    Same as in get_variable_value
+    previous_hash : String
+    Hash of the file when it was last extracted with the same points and variables (None to always extract)
+    sampling : String
+    Sampling of the calibration points (see get_variable_value)
+    times_out : Numpy array
+    Times (in seconds) of the time series to extract instead of the last time step (see get_variable_time_series,
+    which samples the points in the mesh whatever sampling is)
 
     Returns
-    Rasters and saves them in defined path.
     -------
+    Dictionary with the hash of the file and the status ("extracted" or "skipped")
+    """
+    digest = file_hash(file_name)
+    if digest == previous_hash:
+        return {"hash": digest, "status": "skipped"}
+    if times_out is not None:
+        get_variable_time_series(file_name, x_points, y_points, variables=variables, times_out=times_out,
+                                 save_name=save_name, mesh_cache=mesh_cache, derived_params=derived_params)
+    else:
+        get_variable_value(file_name, x_points, y_points, save_name=save_name, mesh_cache=mesh_cache,
+                           sampling=sampling, variables=variables, derived_params=derived_params)
+    return {"hash": digest, "status": "extracted"}
+
 
+def reextract_simulations(simulation_names, path_simulations, path_results, x_points, y_points,
+                          result_name_telemac="res_tel_PC", calibration_variable="VELOCITY",
+                          variables=("SCALAR VELOCITY", "WATER DEPTH"), mesh_cache=None, derived_params=None,
+                          max_workers=None, matrix_name="", sampling="raster", times_out=None):
     """
-    map_file = pp.PreProFuzzy(pd.read_csv(save_xyz, skip_blank_lines=True), attribute="variable", crs='EPSG:4326',
-                              nodatavalue=-9999, res=1)
-    array_ = map_file.norm_array(method=interpol_method)
-    map_file.array2raster(array_, raster_out_save, save_ascii=False)
+    Function extracts again the calibration variables of all the archived result files (i.e., after the calibration
+    points or variables changed), in a pool of worker processes, and writes the training matrix of the surrogate
+    model. The hash of each file and the points and variables used are kept in extraction_manifest.json in
+    path_results (extraction_series_manifest.json for time series), and files whose content and extraction are
+    unchanged are not extracted again; files whose size and modification time are also unchanged are not even hashed
+    Parameters
+    ----------
+    simulation_names : List of strings
+    Names of the simulations (PC1, PC2, ..., as in the parameter file)
+    path_simulations : String
+    Folder of the archived .slf result files
+    path_results : String
+    Folder of the extracted .txt files (<name>_<calibration_variable>.txt, or <name>_<calibration_variable>_series.txt
+    for time series)
+    x_points, y_points : Numpy arrays
+    Coordinates of the calibration points
+    result_name_telemac : String
+    Name of the result files without the simulation number (res_tel_PC for res_tel_PC12.slf)
+    calibration_variable : String
+    Name used in the .txt files
+    variables, mesh_cache, derived_params :
+    Same as in get_variable_value
+    max_workers : Integer
+    Number of worker processes (number of CPUs by default)
+    matrix_name : String
+    Path of the .txt file to save the training matrix (not saved if empty)
+    sampling : String
+    Sampling of the calibration points (see get_variable_value); it must be the one used in the calibration loop
+    (point_sampling in main_GPE_BAL_telemac.py), so that all the rows of the training matrix are comparable
+    times_out : Numpy array
+    Times (in seconds) of the measurements, to extract the time series of the unsteady runs at these times instead of
+    the last time step (calibration_mode = "time_series" in main_GPE_BAL_telemac.py, see get_variable_time_series)
+
+    Returns
+    -------
+    Numpy array [n_simulations, n_variables * n_points] with the training matrix, one row per simulation with the
+    values of all the points for the first variable, then for the second variable, etc. ([n_simulations,
+    n_variables * n_points * n_times] for time series, see flatten_time_series)
+    """
+    # Key of the extraction; files extracted with another key are always extracted again
+    points = np.column_stack((np.ravel(x_points), np.ravel(y_points))).astype(np.float64)
+    key = [list(variables), derived_params, sampling]
+    manifest_name = os.path.join(path_results, "extraction_manifest.json")
+    suffix = ".txt"
+    if times_out is not None:
+        times_out = np.asarray(times_out, dtype=np.float64).ravel()
+        key.append(times_out.tolist())
+        manifest_name = os.path.join(path_results, "extraction_series_manifest.json")
+        suffix = "_series.txt"
+    spec = hashlib.sha1(points.tobytes() + json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    manifest = {}
+    if os.path.isfile(manifest_name):
+        with open(manifest_name) as f:
+            manifest = json.load(f)
+
+    save_names = {}
+    tasks = []
+    for name in simulation_names:
+        # Simulation names are PC<number>, and the result files <result_name_telemac><number>.slf
+        file_name = os.path.join(path_simulations, result_name_telemac + name[2:] + ".slf")
+        save_names[name] = os.path.join(path_results, name + "_" + calibration_variable + suffix)
+        file_stat = os.stat(file_name)
+        entry = manifest.get(name, {})
+        previous_hash = None
+        if entry.get("spec") == spec and os.path.isfile(save_names[name]):
+            if entry.get("size") == file_stat.st_size and entry.get("mtime") == file_stat.st_mtime_ns:
+                continue
+            previous_hash = entry.get("hash")
+        job = {"file": file_name, "size": file_stat.st_size, "mtime": file_stat.st_mtime_ns, "spec": spec}
+        tasks.append((name, job, previous_hash))
+
+    jobs = {}
+    failed = []
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork"))
+    for name, job, previous_hash in tasks:
+        jobs[pool.submit(extract_simulation, job["file"], save_names[name], x_points, y_points, list(variables),
+                         mesh_cache, derived_params, previous_hash, sampling, times_out)] = (name, job)
+    n_extracted = 0
+    for future in as_completed(jobs):
+        name, job = jobs[future]
+        if future.exception() is not None:
+            failed.append(name)
+            print("Extraction failed for " + job["file"] + ": " + repr(future.exception()))
+            continue
+        result = future.result()
+        job["hash"] = result["hash"]
+        manifest[name] = job
+        n_extracted += result["status"] == "extracted"
+    pool.shutdown()
+
+    def write_manifest(temp_name):
+        with open(temp_name, "w") as f:
+            json.dump(manifest, f, indent=1)
 
+    _atomic_save(manifest_name, write_manifest)
+    print("Extracted " + str(n_extracted) + " of " + str(len(simulation_names)) + " result files")
+    if len(failed) != 0:
+        raise RuntimeError("Extraction failed for " + ", ".join(failed))
 
+    # Training matrix, in the order of the simulation names (the time series files have the time in the first column
+    # instead of the coordinates in the first two)
+    columns = 1 if times_out is not None else 2
+    model_results = np.vstack([np.loadtxt(save_names[name], ndmin=2)[:, columns:].T.ravel()
+                               for name in simulation_names])
+    if len(matrix_name) != 0:
+        np.savetxt(matrix_name, model_results)
+    return model_results
 
 
 def append_new_line(file_name, text_to_append):
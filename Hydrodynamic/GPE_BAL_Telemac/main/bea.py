@@ -3,19 +3,32 @@ try:
     # import ogr
     # import gdal
     import rasterio as rio
+    import rasterio.io
+    import rasterio.windows
+    from rasterio.enums import Resampling
     import numpy as np
     import pandas as pd
     import alphashape
     import mapclassify.classifiers as mc
     from pathlib import Path
     from pyproj import CRS
+    from shapely.geometry import Polygon
+    from shapely.ops import unary_union
     from scipy import interpolate
+    from scipy import spatial
     # gdal > v3.10 and ogr, osr then import this way
     from osgeo import gdal
     from osgeo import ogr
 except ImportError:
     print('ModuleNotFoundError: Missing fundamental packages (required: geopandas, ogr, gdal, rasterio, numpy, pandas, '
         'alphashape, mapclassify, pathlib, pyproj, scipy and pykrige).')
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+try:
+    import fcntl
+except ImportError:
+    # not available on windows, where raster cubes are written without file locking
+    fcntl = None
 
 
 def clip_raster(polygon, in_raster, out_raster):
@@ -30,6 +43,36 @@ def clip_raster(polygon, in_raster, out_raster):
     gdal.Warp(out_raster, in_raster, cutlineDSName=polygon)
 
 
+def rings2polygon(shape_polygon, x, y, rings, areas, crs):
+    """ Saves the outline of a mesh (see ppmodules.mesh_boundary.boundaryRings) as a polygon, with the islands as holes
+
+    :param shape_polygon: string, path to save the shapefile (*.shp)
+    :param x: numpy array, x coordinates of the nodes
+    :param y: numpy array, y coordinates of the nodes
+    :param rings: list of numpy arrays, nodes of each closed ring of the boundary
+    :param areas: numpy array, signed area of each ring (the islands have the opposite sign of the largest ring)
+    :param crs: string, coordinate reference system
+    :return: no output, saves the polygon (*.shp) with the selected filename
+    """
+    outer = np.sign(areas[np.argmax(np.abs(areas))])
+    shells = [Polygon(np.column_stack((x[r], y[r]))) for r, a in zip(rings, areas) if np.sign(a) == outer]
+    holes = [Polygon(np.column_stack((x[r], y[r]))) for r, a in zip(rings, areas) if np.sign(a) != outer]
+    polygon = unary_union(shells).difference(unary_union(holes))
+    geopandas.GeoDataFrame(geometry=[polygon], crs=CRS(crs)).to_file(shape_polygon)
+
+
+def build_overviews(raster, factors=(2, 4, 8, 16)):
+    """ Builds the overviews (reduced resolution copies) of every band of a raster, for fast reading at coarse scales
+
+    :param raster: string, file and path of the raster (*.tif)
+    :param factors: tuple of integers, decimation factors of the overviews
+    :return: no output, adds the overviews to the raster
+    """
+    with rio.open(raster, 'r+') as dst:
+        dst.build_overviews(list(factors), Resampling.average)
+        dst.update_tags(ns='rio_overview', resampling='average')
+
+
 class PreProFuzzy:
     """Parent pre-processing structure for the comparison of numeric maps
 
@@ -57,20 +100,53 @@ class PreProFuzzy:
         new_names = {df.columns[0]: 'x', df.columns[1]: 'y', df.columns[2]: self.attribute}
         self.df = df.rename(columns=new_names)
 
-        # Create geodataframe from the dataframe
-        gdf = geopandas.GeoDataFrame(self.df, geometry=geopandas.points_from_xy(self.df.x, self.df.y))
-        gdf.crs = self.crs
-        self.gdf = gdf
-        self.x = gdf.geometry.x.values
-        self.y = gdf.geometry.y.values
-        self.z = gdf[attribute].values
+        self.set_points(self.df.x.values, self.df.y.values, self.df[attribute].values, res)
 
+    @classmethod
+    def from_arrays(cls, x, y, z, attribute, crs, nodatavalue, res=None):
+        """Creates the object from numpy arrays of the points (i.e., the nodes of a mesh), without building any
+        dataframe; the geodataframe of the points is only built if needed (see gdf)
 
+        :param x: numpy array, x coordinates of the points
+        :param y: numpy array, y coordinates of the points
+        :param z: numpy array, values of the attribute at the points
+        :param attribute: string, name of the attribute (ex.: deltaZ, Z)
+        :param crs: string, coordinate reference system
+        :param nodatavalue: float, value to indicate nodata cells
+        :param res: float, resolution of the cell (cell size), is the same for x and y
 
-        self.xmax = self.gdf.geometry.x.max()
-        self.xmin = self.gdf.geometry.x.min()
-        self.ymax = self.gdf.geometry.y.max()
-        self.ymin = self.gdf.geometry.y.min()
+        :returns: PreProFuzzy object
+        """
+        obj = cls.__new__(cls)
+        obj.crs = CRS(crs)
+        obj.attribute = attribute
+        obj.nodatavalue = nodatavalue
+        obj.df = None
+
+        # drop the points with any nan, as for the dataframe
+        x, y, z = (np.asarray(a, dtype=np.float64) for a in (x, y, z))
+        keep = ~(np.isnan(x) | np.isnan(y) | np.isnan(z))
+        obj.set_points(x[keep], y[keep], z[keep], res)
+        return obj
+
+    def set_points(self, x, y, z, res):
+        """Stores the points as contiguous arrays and defines the grid covering them
+
+        :param x: numpy array, x coordinates of the points
+        :param y: numpy array, y coordinates of the points
+        :param z: numpy array, values of the attribute at the points
+        :param res: float, resolution of the cell (cell size), is the same for x and y
+        """
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.z = np.ascontiguousarray(z)
+        # geodataframe of the points, see gdf
+        self.geo_df = None
+
+        self.xmax = self.x.max()
+        self.xmin = self.x.min()
+        self.ymax = self.y.max()
+        self.ymin = self.y.min()
 
         self.extent = (self.xmin, self.xmax, self.ymin, self.ymax)
 
@@ -83,36 +159,141 @@ class PreProFuzzy:
         self.ncol = int(np.ceil((self.xmax - self.xmin) / self.res))  # delx
         self.nrow = int(np.ceil((self.ymax - self.ymin) / self.res))  # dely
 
-    def points_to_grid(self):
-        """Creates a grid of new points in the target resolution
+        # cell of each point and number of points of each cell, see bin_points
+        self.bins = None
+        self.counts = None
+
+    @property
+    def gdf(self):
+        """Geodataframe of the points, with a point geometry per point; built the first time it is needed (i.e., by
+        create_polygon), as it is much larger and slower to build than the arrays of the points
 
-        :returns: array of size nrow, ncol
+        :returns: geopandas GeoDataFrame with the columns x, y and the attribute
+        """
+        if self.geo_df is None:
+            df = self.df
+            if df is None:
+                df = pd.DataFrame({'x': self.x, 'y': self.y, self.attribute: self.z})
+            gdf = geopandas.GeoDataFrame(df, geometry=geopandas.points_from_xy(self.x, self.y))
+            gdf.crs = self.crs
+            self.geo_df = gdf
+        return self.geo_df
+
+    def bin_points(self):
+        """Assigns the points to the cells of the grid, once; the assignment is kept for the next calls, so gridding
+        other attributes of the same points (see points_to_grid) does not compute it again. The cells are the bins
+        of np.histogram2d over the extent of the points (nrow x ncol), numbered row by row from the upper left corner
+
+        :returns: array of the cell of each point (-1 for the points outside of the extent), and array of the number
+            of points of each cell
+        """
+        if self.bins is None:
+            row = self.uniform_bins(self.y, self.ymin, self.ymax, int(self.nrow))
+            col = self.uniform_bins(self.x, self.xmin, self.xmax, int(self.ncol))
+            inside = (row >= 0) & (col >= 0)
+            # the first row of the grid is the northernmost one (computed in place, the arrays are as long as the
+            # points)
+            bins = row
+            np.subtract(self.nrow - 1, bins, out=bins)
+            bins *= self.ncol
+            bins += col
+            del col
+            bins[~inside] = -1
+            self.bins = bins
+            self.counts = np.bincount(bins[inside], minlength=self.nrow * self.ncol).astype(np.int32)
+        return self.bins, self.counts
+
+    @staticmethod
+    def uniform_bins(values, vmin, vmax, n):
+        """Bin of each value among n equal bins between vmin and vmax, as in np.histogram (a value equal to vmax
+        belongs to the last bin)
+
+        :returns: integer array, bin of each value (-1 if outside of [vmin, vmax])
+        """
+        edges = np.linspace(vmin, vmax, n + 1)
+        index = values - vmin
+        index *= n / (vmax - vmin)
+        index = np.floor(index, out=index).astype(np.int64)
+        index[values == vmax] = n - 1
+        index[(values < vmin) | (values > vmax)] = -1
+        # the multiplication can be off by one bin next to an edge; the edges decide, as in np.histogram
+        valid = index >= 0
+        index[valid & (values < edges[np.clip(index, 0, n)])] -= 1
+        index[valid & (index < n - 1) & (values >= edges[np.clip(index + 1, 0, n)])] += 1
+        return index
+
+    def points_to_grid(self, z=None, dtype='float64'):
+        """Creates a grid of new points in the target resolution, with the mean of the points in each cell
+
+        :param z: numpy array, values of the points to grid (optional, the attribute by default)
+        :param dtype: string, numpy dtype of the grid ('float32' halves its size)
+
+        :returns: array of size nrow, ncol (nan in the cells without points)
 
         Hints:
             Read more at http://chris35wills.github.io/gridding_data/
         """
-        hrange = ((self.ymin, self.ymax),
-                  (self.xmin, self.xmax))  # any points outside of this will be condisdered outliers and not used
-
-        zi, yi, xi = np.histogram2d(self.y, self.x, bins=(int(self.nrow), int(self.ncol)), weights=self.z, normed=False,
-                                    range=hrange)
-        counts, _, _ = np.histogram2d(self.y, self.x, bins=(int(self.nrow), int(self.ncol)), range=hrange)
-        np.seterr(divide='ignore', invalid='ignore')  # ignores errors if dividing by zero
-        zi = np.divide(zi, counts)
-        np.seterr(divide=None, invalid=None)  # set it back now
-        zi = np.ma.masked_invalid(zi)
-        array = np.flipud(np.array(zi))  # flips each column upside down
-
-        return array
-
-    def norm_array(self, method='linear'):
+        if z is None:
+            z = self.z
+        bins, counts = self.bin_points()
+        z = np.asarray(z, dtype=np.float64)
+        if bins.min() < 0:
+            # any points outside of the extent will be considered outliers and not used
+            inside = bins >= 0
+            bins, z = bins[inside], z[inside]
+
+        # sums in a single pass (the counts are kept from bin_points), then the mean in place
+        array = np.bincount(bins, weights=z, minlength=self.nrow * self.ncol)
+        np.divide(array, counts, out=array, where=counts > 0)
+        array[counts == 0] = np.nan
+
+        return array.astype(dtype, copy=False).reshape(int(self.nrow), int(self.ncol))
+
+    def tile_points(self, tile_size):
+        """Sorts the points by the tile of the grid they fall in (cells as in bin_points, tiles of tile_size cells
+        numbered row by row from the upper left corner), so that a tile can grid its own points and those of the tiles
+        around it without gridding the whole raster (see norm_array_tiled). The points keep their order inside each
+        tile, so a cell gets the same mean as in points_to_grid
+
+        :param tile_size: integer, size of the square tiles (cells)
+
+        :returns: row and column of the cell of each point (points outside of the extent dropped), value of each point,
+            all sorted by tile, and the index of the first point of each tile (with the number of points at the end)
+        """
+        nrow, ncol = int(self.nrow), int(self.ncol)
+        row = self.uniform_bins(self.y, self.ymin, self.ymax, nrow)
+        col = self.uniform_bins(self.x, self.xmin, self.xmax, ncol)
+        inside = (row >= 0) & (col >= 0)
+        # the first row of the grid is the northernmost one
+        row = (nrow - 1 - row[inside]).astype(np.int32)
+        col = col[inside].astype(np.int32)
+        z = np.asarray(self.z, dtype=np.float64)[inside]
+
+        tile_cols = -(-ncol // tile_size)
+        tile = (row // tile_size) * tile_cols + col // tile_size
+        order = np.argsort(tile, kind='stable')
+        starts = np.searchsorted(tile[order], np.arange(-(-nrow // tile_size) * tile_cols + 1))
+        return row[order], col[order], z[order], starts
+
+    def norm_array(self, method='linear', tile_size=None, buffer=32, max_workers=None, raster_file=None, mask=None):
         """ Normalizes the raw data in equally distanced points depending on the selected resolution
 
-        :returns: interpolated and normalized array with selected resolution
+        :param method: string, interpolation method of scipy.interpolate.griddata (linear, cubic or nearest)
+        :param tile_size: integer, interpolates the raster in square tiles of this size (cells) instead of all at once,
+            so that the memory used is bounded by the size of the tiles (see norm_array_tiled)
+        :param buffer: integer, cells around each tile whose points are also used to interpolate it
+        :param max_workers: integer, number of threads interpolating tiles
+        :param raster_file: string, path of a raster (*.tif) where the tiles are written as soon as they are
+            interpolated, instead of returning the whole array (tiled mode only)
+        :param mask: boolean array of size nrow, ncol, the cells set to False are nodata (optional)
+
+        :returns: interpolated and normalized array with selected resolution (None if saved to raster_file)
 
         Hint:
             Read more at https://github.com/rosskush/skspatial
         """
+        if tile_size is not None:
+            return self.norm_array_tiled(method, tile_size, buffer, max_workers, raster_file, mask)
         array = self.points_to_grid()
         x = np.arange(0, self.ncol)  # creates 1d array with values [0, ncol[
         y = np.arange(0, self.nrow)
@@ -127,9 +308,115 @@ class PreProFuzzy:
         newarr = array[~array.mask]
 
         out_array = interpolate.griddata((x1, y1), newarr.ravel(), (xx, yy), method=method, fill_value=self.nodatavalue)
+        if mask is not None:
+            out_array[~mask] = self.nodatavalue
 
         return out_array
 
+    def norm_array_tiled(self, method, tile_size=512, buffer=32, max_workers=None, raster_file=None, mask=None):
+        """ Interpolates the points in square tiles, on a pool of threads. Each tile grids (as points_to_grid) only the
+        points inside its extent enlarged by buffer cells, found with tile_points, and interpolates them, so neither
+        the whole grid nor the whole output is held in memory when writing to raster_file. Finished tiles are
+        written to raster_file (a tiled and compressed GeoTIFF) right away, or copied to the output array
+
+        :param method: string, interpolation method of scipy.interpolate.griddata (linear, cubic or nearest)
+        :param tile_size: integer, size of the tiles (cells), multiple of 16 when writing to raster_file
+        :param buffer: integer, cells around each tile whose points are also used to interpolate it
+        :param max_workers: integer, number of threads interpolating tiles
+        :param raster_file: string, path of the raster (*.tif) to write (optional)
+        :param mask: boolean array of size nrow, ncol, the cells set to False are nodata (optional)
+
+        :returns: interpolated array (None if saved to raster_file)
+
+        Hints:
+            The tiles do not give exactly the array of norm_array, which triangulates all the gridded points at once:
+            - the cells of the grid are a regular lattice, whose Delaunay triangulation is not unique (four cells
+              on a circle), and each buffered tile breaks these ties on its own; the cubic method also estimates
+              the gradients from the points of the buffered tile only. The values differ by the order of the
+              interpolation error itself, a few percent of the variation of the values between neighbouring points
+              at most.
+            - a cell is nodata when it is outside of the convex hull of the points of its buffered tile, while
+              norm_array fills the convex hull of all the points. Along the edges of the points (e.g. the first and
+              last rows and columns of the raster) norm_array stretches long and thin triangles between points far
+              apart, where the tiles leave cells nodata. These cells are outside of the mesh and masked anyway when
+              the points are mesh nodes (see mask). Elsewhere, the buffer must be larger than the gaps between the
+              points (and than the reach of the cubic method).
+        """
+        nrow, ncol = int(self.nrow), int(self.ncol)
+        rows, cols, values, starts = self.tile_points(tile_size)
+        tile_cols = -(-ncol // tile_size)
+
+        def grid_window(b0, b1, a0, a1):
+            # mean of the points of each cell of rows b0:b1 and columns a0:a1, from the tiles overlapping them (the
+            # tiles of a row of tiles are contiguous in the sorted points)
+            s0, s1 = a0 // tile_size, (a1 - 1) // tile_size
+            spans = [slice(starts[t * tile_cols + s0], starts[t * tile_cols + s1 + 1])
+                     for t in range(b0 // tile_size, (b1 - 1) // tile_size + 1)]
+            r = np.concatenate([rows[s] for s in spans])
+            c = np.concatenate([cols[s] for s in spans])
+            keep = (r >= b0) & (r < b1) & (c >= a0) & (c < a1)
+            cell = (r[keep] - b0).astype(np.int64) * (a1 - a0) + (c[keep] - a0)
+            size = (b1 - b0) * (a1 - a0)
+            counts = np.bincount(cell, minlength=size)
+            sums = np.bincount(cell, weights=np.concatenate([values[s] for s in spans])[keep], minlength=size)
+            valid = np.flatnonzero(counts)
+            y1, x1 = np.divmod(valid, a1 - a0)
+            return x1 + a0, y1 + b0, sums[valid] / counts[valid]
+
+        def interpolate_tile(r0, c0):
+            r1 = min(r0 + tile_size, nrow)
+            c1 = min(c0 + tile_size, ncol)
+            # gridded points of the buffered tile, in the coordinates of the whole grid as in norm_array
+            x1, y1, z1 = grid_window(max(r0 - buffer, 0), min(r1 + buffer, nrow), max(c0 - buffer, 0),
+                                     min(c1 + buffer, ncol))
+            yy, xx = np.mgrid[r0:r1, c0:c1]
+
+            tile = np.full((r1 - r0, c1 - c0), self.nodatavalue, dtype=np.float64)
+            if len(x1) >= 3:
+                try:
+                    tile = interpolate.griddata((x1, y1), z1, (xx, yy), method=method, fill_value=self.nodatavalue)
+                except spatial.QhullError:
+                    # all the points of the buffered tile are aligned, so there is nothing to interpolate
+                    pass
+            if mask is not None:
+                tile[~mask[r0:r1, c0:c1]] = self.nodatavalue
+            return r0, c0, tile
+
+        out_array = None
+        dst = None
+        if raster_file is None:
+            out_array = np.empty((nrow, ncol), dtype=np.float64)
+        else:
+            transform = rio.transform.from_origin(self.xmin, self.ymax, self.res, self.res)
+            dst = rio.open(raster_file, 'w', driver='GTiff', height=nrow, width=ncol, count=1, dtype='float64',
+                           crs=self.crs, transform=transform, nodata=self.nodatavalue, tiled=True,
+                           blockxsize=tile_size, blockysize=tile_size, compress='deflate', bigtiff='if_safer')
+
+        def save_tiles(done):
+            for future in done:
+                r0, c0, tile = future.result()
+                if dst is None:
+                    out_array[r0:r0 + tile.shape[0], c0:c0 + tile.shape[1]] = tile
+                else:
+                    dst.write(tile, 1, window=rio.windows.Window(c0, r0, tile.shape[1], tile.shape[0]))
+
+        # at most two tiles per thread are pending, so finished tiles do not pile up in memory
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = set()
+            for r0 in range(0, nrow, tile_size):
+                for c0 in range(0, ncol, tile_size):
+                    if len(pending) >= 2 * max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        save_tiles(done)
+                    pending.add(pool.submit(interpolate_tile, r0, c0))
+            save_tiles(wait(pending)[0])
+
+        if dst is not None:
+            dst.close()
+        return out_array
+
     def random_raster(self, raster_file, save_ascii=True, **kwargs):
         """ Creates a raster of randomly generated values
 
@@ -218,6 +505,64 @@ class PreProFuzzy:
 
         return new_dataset
 
+    def array2memraster(self, array):
+        """Saves the array as a GeoTIFF held in memory, so that it can be read with rasterio without touching the disk
+
+        :param array: numpy array, raster values (e.g. from norm_array)
+
+        :returns: rasterio.io.MemoryFile, use its open() method to read the raster
+        """
+        transform = rio.transform.from_origin(self.xmin, self.ymax, self.res, self.res)
+        memfile = rio.io.MemoryFile()
+        with memfile.open(driver='GTiff', height=array.shape[0], width=array.shape[1], count=1, dtype=array.dtype,
+                          crs=self.crs, transform=transform, nodata=self.nodatavalue) as new_dataset:
+            new_dataset.write(array, 1)
+
+        return memfile
+
+    def array2cube(self, array, cube_file, band, count, description='', block_size=256):
+        """Writes the array as one band of a tiled and compressed (deflate) multi-band raster, the cube, which is created
+        with count empty bands if it does not exist. The array is written block by block, in single precision, and the
+        cube is locked while writing so that several processes can fill different bands of the same cube
+
+        :param array: numpy array, raster values (e.g. from norm_array), or string, path of a raster of the same grid
+            (e.g. written tile by tile by norm_array_tiled), which is read block by block instead of as a whole
+        :param cube_file: string, path of the cube (*.tif)
+        :param band: integer, band to write (1 to count)
+        :param count: integer, number of bands of the cube
+        :param description: string, description of the band (e.g. iteration and variable)
+        :param block_size: integer, size of the square tiles of the cube (multiple of 16)
+
+        :returns: saves the band in the cube
+        """
+        if isinstance(array, str):
+            with rio.open(array) as src:
+                return self.array2cube(src, cube_file, band, count, description, block_size)
+        with open(cube_file + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if not os.path.isfile(cube_file):
+                transform = rio.transform.from_origin(self.xmin, self.ymax, self.res, self.res)
+                with rio.open(cube_file, 'w', driver='GTiff', height=array.shape[0], width=array.shape[1],
+                              count=count, dtype='float32', crs=self.crs, transform=transform,
+                              nodata=self.nodatavalue, tiled=True, blockxsize=block_size, blockysize=block_size,
+                              compress='deflate', predictor=3, interleave='band', sparse_ok=True,
+                              bigtiff='if_safer'):
+                    pass
+
+            with rio.open(cube_file, 'r+') as cube:
+                if (cube.height, cube.width) != array.shape or not 1 <= band <= cube.count:
+                    raise ValueError('Band ' + str(band) + ' of shape ' + str(array.shape) + ' does not fit the cube ' +
+                                     cube_file)
+                for _, window in cube.block_windows(band):
+                    if isinstance(array, np.ndarray):
+                        block = array[window.toslices()]
+                    else:
+                        block = array.read(1, window=window)
+                    cube.write(block.astype(np.float32), band, window=window)
+                cube.set_band_description(band, description)
+
     def create_polygon(self, shape_polygon, alpha=np.nan):
         """ Creates a polygon surrounding a cloud of shapepoints
 
@@ -254,53 +599,201 @@ class PreProCategorization:
         self.raster = raster
 
         with rio.open(self.raster) as src:
-            raster_np = src.read(1, masked=True)
             self.nodatavalue = src.nodata  # storing nodatavalue of raster
             self.meta = src.meta.copy()
-        self.array = raster_np
+        self.raster_np = None
+
+    @property
+    def array(self):
+        """Masked array of the raster, read on first use (categorize_raster reads the raster by blocks instead)"""
+        if self.raster_np is None:
+            with rio.open(self.raster) as src:
+                self.raster_np = src.read(1, masked=True)
+        return self.raster_np
 
-    def nb_classes(self, n_classes):
+    def nb_classes(self, n_classes, method='full', sample_size=100000, n_bins=2048, seed=0):
         """ Generates class bins based on the Natural Breaks method
 
         :param n_classes: integer, number of classes
+        :param method: string, 'full' classifies all the cells with mapclassify.NaturalBreaks (slow for millions of
+            cells), 'sample' a stratified sample of them and 'histogram' a fine histogram of them
+        :param sample_size: integer, number of cells of the 'sample' method
+        :param n_bins: integer, number of bins of the 'histogram' method
+        :param seed: integer, seed of the 'sample' method (the same seed gives the same sample)
 
         :returns: list of optimized bins
+
+        Hints:
+            'sample' sorts the cells, splits them into sample_size strata of equal count and takes one cell at random
+            from each, so the sample follows the quantiles of the cells to 1 / sample_size.
+            'histogram' finds the optimal breaks (least squared deviations of all the cells from their class means,
+            as Fisher-Jenks) among the edges of n_bins equal bins between the min and the max, so the breaks are
+            optimal up to a resolution of (max - min) / n_bins.
+            Both report the goodness of variance fit (GVF) of the breaks on all the cells; 'sample' also reports the
+            GVF on the sample and the largest difference between the share of a class in the sample and in all cells.
         """
-        # Classification based on Natural Breaks
         array_values = self.array[~self.array.mask].ravel()
-        breaks = mc.NaturalBreaks(array_values, k=n_classes)
-        print('The upper bound of the classes are:', breaks.bins)  # bins being (], (], (]....(] always including the right
-        print('Number of counts for each class, respectively:', breaks.counts)
+        if method == 'full':
+            # Classification based on Natural Breaks
+            breaks = mc.NaturalBreaks(array_values, k=n_classes)
+            bins, counts = breaks.bins, breaks.counts
+        elif method == 'sample':
+            sorted_values = np.sort(array_values)
+            n = len(sorted_values)
+            if n > sample_size:
+                rng = np.random.default_rng(seed)
+                strata = np.arange(sample_size) + rng.random(sample_size)
+                sample = sorted_values[(strata * (n / sample_size)).astype(np.int64)]
+            else:
+                sample = sorted_values
+            bins = np.array(mc.NaturalBreaks(sample, k=n_classes).bins, dtype=np.float64)
+            bins[-1] = sorted_values[-1]  # the max of the sample may be below the max of all the cells
+            counts = np.diff(np.concatenate(([0], np.searchsorted(sorted_values, bins, side='right'))))
+            sample_counts = np.bincount(np.digitize(sample, bins, right=True), minlength=len(bins))[:len(bins)]
+            print('GVF of the sample: ', self.goodness_of_fit(sample, bins), 'of all cells: ',
+                  self.goodness_of_fit(array_values, bins))
+            print('Largest deviation of the class shares (sample vs all cells): ',
+                  np.abs(sample_counts / len(sample) - counts / n).max())
+        elif method == 'histogram':
+            vmin, vmax = array_values.min(), array_values.max()
+            index = PreProFuzzy.uniform_bins(array_values, vmin, vmax, n_bins)
+            # sums of the deviations from the mean, which keeps the sums of squares accurate
+            deviation = array_values - array_values.mean()
+            bin_counts = np.bincount(index, minlength=n_bins)
+            bin_sums = np.bincount(index, weights=deviation, minlength=n_bins)
+            bin_squares = np.bincount(index, weights=deviation * deviation, minlength=n_bins)
+            bin_max = np.full(n_bins, -np.inf)
+            np.maximum.at(bin_max, index, array_values)
+            full = bin_counts > 0
+            if full.sum() < n_classes:
+                print('Warning: only ' + str(full.sum()) + ' bins have cells, which is the number of classes used')
+            last = self.fisher_jenks_binned(bin_counts[full], bin_sums[full], bin_squares[full],
+                                            min(n_classes, full.sum()))
+            bins = bin_max[full][last]
+            counts = np.diff(np.concatenate(([0], np.cumsum(bin_counts[full])[last])))
+            print('GVF of all cells: ', self.goodness_of_fit(array_values, bins), 'with breaks resolution: ',
+                  (vmax - vmin) / n_bins)
+        else:
+            raise ValueError("method must be 'full', 'sample' or 'histogram'")
+        print('The upper bound of the classes are:', bins)  # bins being (], (], (]....(] always including the right
+        print('Number of counts for each class, respectively:', counts)
         print('max: ', array_values.max(), 'min: ', array_values.min())
-        return breaks.bins
+        return bins
 
-    def categorize_raster(self, class_bins, map_out, save_ascii=True):
-        """Classifies the raster according to the classification bins
-
-        :param map_out: path of the project directory
-        :param class_bins: list of floats
-        :param save_ascii: bool
+    @staticmethod
+    def classify_block(block, class_bins, nodatavalue):
+        """Classifies a block (masked array) of the raster according to the classification bins
 
-        :returns: saves the classified raster in the chosen directory
+        :returns: numpy array (float64) of the classes, with nodatavalue in the masked cells
         """
         # Classify the original image array (digitize makes nodatavalues take the class 0)
-        raster_fi = np.ma.filled(self.array, fill_value=-np.inf)
+        raster_fi = np.ma.filled(block, fill_value=-np.inf)
         raster_class = np.digitize(raster_fi, class_bins, right=True)  # bins[i-1] < array <= bins[i]
 
         # Assigns nodatavalues back to array
         raster_ma = np.ma.masked_where(raster_class == 0,
                                        raster_class,
-                                       copy=True)
+                                       copy=False)
 
         # Fill nodatavalues into array
-        raster_ma_fi = np.ma.filled(raster_ma, fill_value=self.nodatavalue)
-        # raster_ma_fi = np.ma.filled(raster_class, fill_value=self.nodatavalue)
+        return np.ma.filled(raster_ma, fill_value=nodatavalue).astype(rio.float64)
 
-        if raster_ma_fi.min() == self.nodatavalue or type(raster_ma_fi) != np.ma.MaskedArray:
-            with rio.open(map_out, 'w', **self.meta) as outf:
-                outf.write(raster_ma_fi.astype(rio.float64), 1)
-        else:
-            raise TypeError("Error filling NoDataValue to raster file")
+    @staticmethod
+    def goodness_of_fit(values, class_bins):
+        """Goodness of variance fit (GVF) of a classification: 1 - sum of the squared deviations from the class means /
+        sum of the squared deviations from the mean (1 is a perfect fit)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        deviation = values - values.mean()
+        classes = np.digitize(values, class_bins, right=True)
+        counts = np.bincount(classes)
+        sums = np.bincount(classes, weights=deviation)
+        total = np.dot(deviation, deviation)
+        within = total - np.sum(sums[counts > 0] ** 2 / counts[counts > 0])
+        return 1.0 - within / total if total > 0 else 1.0
+
+    @staticmethod
+    def fisher_jenks_binned(counts, sums, squares, n_classes, chunk_size=2 ** 21):
+        """Optimal classification (least squared deviations from the class means) of the cells of a histogram, with
+        the cells of a bin always in the same class (Fisher-Jenks dynamic programming over the bins)
+
+        :param counts: numpy array, number of cells of each (non empty) bin
+        :param sums: numpy array, sum of the values of the cells of each bin
+        :param squares: numpy array, sum of the squared values of the cells of each bin
+        :param n_classes: integer, number of classes
+        :param chunk_size: integer, number of (bin, bin) pairs evaluated at once (bounds the memory)
+
+        :returns: integer array, index of the last bin of each class
+        """
+        n = len(counts)
+        c = np.concatenate(([0], np.cumsum(counts)))
+        s = np.concatenate(([0.0], np.cumsum(sums)))
+        q = np.concatenate(([0.0], np.cumsum(squares)))
+        i = np.arange(n + 1)
+
+        # squared deviations of one class made of the bins 0 to j - 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cost = q - q[0] - (s - s[0]) ** 2 / (c - c[0])
+        cost[0] = np.inf
+        first = np.zeros((n_classes, n + 1), dtype=np.int64)
+        rows = max(1, chunk_size // (n + 1))
+        for k in range(1, n_classes):
+            # best split of the bins 0 to j - 1 into k + 1 classes, the last one made of the bins i to j - 1
+            new_cost = np.full(n + 1, np.inf)
+            for j0 in range(k + 1, n + 1, rows):
+                j = np.arange(j0, min(j0 + rows, n + 1))[:, np.newaxis]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    total = cost + (q[j] - q - (s[j] - s) ** 2 / (c[j] - c))
+                total[i >= j] = np.inf
+                best = np.argmin(total, axis=1)
+                first[k, j[:, 0]] = best
+                new_cost[j[:, 0]] = total[np.arange(len(best)), best]
+            cost = new_cost
+
+        last = [n - 1]
+        j = n
+        for k in range(n_classes - 1, 0, -1):
+            j = first[k, j]
+            last.append(j - 1)
+        return np.array(last[::-1])
+
+    def categorize_raster(self, class_bins, map_out, save_ascii=True, max_workers=None):
+        """Classifies the raster according to the classification bins, block by block (the blocks of the raster), so
+        that only a few blocks are in memory whatever the size of the raster
+
+        :param map_out: path of the project directory
+        :param class_bins: list of floats
+        :param save_ascii: bool
+        :param max_workers: integer, number of threads classifying blocks (blocks are classified one after the other
+            if None)
+
+        :returns: saves the classified raster in the chosen directory
+        """
+        def classify(window, block):
+            return window, self.classify_block(block, class_bins, self.nodatavalue)
+
+        def save_blocks(done):
+            for future in done:
+                window, block = future.result()
+                outf.write(block, 1, window=window)
+
+        with rio.open(self.raster) as src, rio.open(map_out, 'w', **self.meta) as outf:
+            if max_workers is None:
+                for _, window in src.block_windows(1):
+                    outf.write(self.classify_block(src.read(1, window=window, masked=True), class_bins,
+                                                   self.nodatavalue), 1, window=window)
+            else:
+                # blocks are read and written here, as a dataset can not be shared by threads; at most two blocks
+                # per thread are pending
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    pending = set()
+                    for _, window in src.block_windows(1):
+                        if len(pending) >= 2 * max_workers:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            save_blocks(done)
+                        block = src.read(1, window=window, masked=True)
+                        pending.add(pool.submit(classify, window, block))
+                    save_blocks(wait(pending)[0])
 
         if save_ascii:
             map_asc = str(Path(map_out[0:-4] + '.asc'))
@@ -0,0 +1,100 @@
+'''
+Benchmark of the two samplings of get_variable_value on a synthetic river reach: "mesh" (locatePoints and samplePoints,
+linear inside the triangle of each point) and "raster" (the nodes gridded to 1 m cells as in bea.PreProFuzzy, cubic
+interpolation of the empty cells and the value of the cell of each point). Both are compared with the exact smooth
+field, and the mesh sampling with a linear field, which it must reproduce exactly.
+
+Example (from the main folder):
+python benchmarks/point_sampling.py -n 40000 -p 100
+
+Contact: iamakash0123@gmail.com
+'''
+
+# Import libraries
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from scipy import interpolate, spatial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ppmodules.point_location import locatePoints, samplePoints
+
+LENGTH = 3000.0
+WIDTH = 120.0
+
+
+def field(x, y):
+    """Smooth field of the reach (water depth like, between about 0.5 and 1.7)"""
+    return 1.0 + 0.5 * np.sin(x / 150.0) * np.cos(y / 40.0) + 0.2 * (y / WIDTH)
+
+
+def raster_sampling(x, y, z, px, py, resolution=1.0):
+    """
+    Function to sample the points as the raster path of get_variable_value does
+
+    Parameters
+    ----------
+    x, y, z : Arrays
+    Coordinates and values of the nodes
+    px, py : Arrays
+    Coordinates of the points
+    resolution : Float
+    Size of the cells
+
+    Returns
+    -------
+    Array of the value of the cell of each point
+    """
+    xmin, xmax, ymin, ymax = x.min(), x.max(), y.min(), y.max()
+    ncol = int(np.ceil((xmax - xmin) / resolution))
+    nrow = int(np.ceil((ymax - ymin) / resolution))
+    # mean of the nodes of each cell (the bins of bea.PreProFuzzy.bin_points), first row northernmost
+    extent = ((ymin, ymax), (xmin, xmax))
+    sums = np.histogram2d(y, x, bins=(nrow, ncol), weights=z, range=extent)[0]
+    counts = np.histogram2d(y, x, bins=(nrow, ncol), range=extent)[0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grid = np.ma.masked_invalid(np.flipud(sums / counts))
+    # cubic interpolation of the empty cells, over the cell indices (bea.PreProFuzzy.norm_array)
+    xx, yy = np.meshgrid(np.arange(ncol), np.arange(nrow))
+    grid = interpolate.griddata((xx[~grid.mask], yy[~grid.mask]), grid[~grid.mask].ravel(), (xx, yy),
+                                method="cubic", fill_value=-9999)
+    col = np.minimum(np.floor((px - xmin) / resolution).astype(int), ncol - 1)
+    row = np.minimum(np.floor((ymax - py) / resolution).astype(int), nrow - 1)
+    return grid[row, col]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy of the mesh and raster samplings of get_variable_value")
+    parser.add_argument("-n", type=int, default=40000, help="number of nodes")
+    parser.add_argument("-p", type=int, default=100, help="number of points")
+    parser.add_argument("-s", type=int, default=0, help="seed of the random nodes and points")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.s)
+    x = rng.random(args.n) * LENGTH
+    y = rng.random(args.n) * WIDTH
+    ikle = spatial.Delaunay(np.column_stack((x, y))).simplices
+    z = field(x, y)
+    # points away from the banks, where the raster has no empty border cells
+    px = rng.random(args.p) * (LENGTH - 100.0) + 50.0
+    py = rng.random(args.p) * (WIDTH - 20.0) + 10.0
+    truth = field(px, py)
+    span = z.max() - z.min()
+
+    start = time.perf_counter()
+    elem, nodes, weights = locatePoints(x, y, ikle, px, py)
+    mesh = samplePoints(z, nodes, weights)
+    t_mesh = time.perf_counter() - start
+    start = time.perf_counter()
+    raster = raster_sampling(x, y, z, px, py)
+    t_raster = time.perf_counter() - start
+    linear = samplePoints(2.0 * x + 3.0 * y, nodes, weights) - (2.0 * px + 3.0 * py)
+
+    print("%d nodes, %d points: mesh %.3f s, raster %.3f s" % (args.n, args.p, t_mesh, t_raster))
+    for name, diff in (("mesh - field", mesh - truth), ("raster - field", raster - truth),
+                       ("mesh - raster", mesh - raster)):
+        print("%-15s max %.3f %%, mean %.3f %% of the field range"
+              % (name, 100 * np.abs(diff).max() / span, 100 * np.abs(diff).mean() / span))
+    print("linear field: max error of the mesh sampling %.1e" % np.abs(linear).max())
@@ -0,0 +1,118 @@
+'''
+Benchmark of ppSELAFIN.readHeader(): decodes the geometry (IKLE, IPOBO, x and y) of a synthetic mesh with the bulk
+reads of readRecord(), and with the previous reader that unpacked one value at a time, and checks that both give the
+same arrays.
+
+Example (from the main folder):
+python benchmarks/read_header.py -e 1000000 -n 500000
+
+Contact: iamakash0123@gmail.com
+'''
+
+# Import libraries
+import argparse
+import os
+import sys
+import tempfile
+import time
+from struct import unpack
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ppmodules.selafin_io_pp import ppSELAFIN
+
+
+class PerValueSELAFIN(ppSELAFIN):
+    """ppSELAFIN with the geometry reader used before readRecord(): one unpack per value"""
+    def readGeometry(self):
+        self.IKLE = np.zeros((self.NELEM, self.NDP), dtype=np.int32)
+        garbage = unpack('>i', self.f.read(4))[0]
+        for i in range(self.NELEM):
+            for j in range(self.NDP):
+                self.IKLE[i, j] = unpack('>l', self.f.read(4))[0]
+        garbage = unpack('>i', self.f.read(4))[0]
+
+        self.IPOBO = np.zeros(self.NPOIN, dtype=np.int32)
+        garbage = unpack('>i', self.f.read(4))[0]
+        for i in range(self.NPOIN):
+            self.IPOBO[i] = unpack('>l', self.f.read(4))[0]
+        garbage = unpack('>i', self.f.read(4))[0]
+
+        self.x = np.zeros(self.NPOIN)
+        garbage = unpack('>i', self.f.read(4))[0]
+        if garbage != self.float_size * self.NPOIN:
+            self.float_type = 'd'
+            self.float_size = 8
+        for i in range(self.NPOIN):
+            self.x[i] = unpack('>' + self.float_type, self.f.read(self.float_size))[0]
+        garbage = unpack('>i', self.f.read(4))[0]
+
+        self.y = np.zeros(self.NPOIN)
+        garbage = unpack('>i', self.f.read(4))[0]
+        for i in range(self.NPOIN):
+            self.y[i] = unpack('>' + self.float_type, self.f.read(self.float_size))[0]
+        garbage = unpack('>i', self.f.read(4))[0]
+
+
+def write_mesh(slf_file, n_elements, n_nodes, seed=0):
+    """
+    Function writes a *.slf file with a random mesh of n_elements triangles and n_nodes nodes, and one frame
+    Parameters
+    ----------
+    slf_file : String
+    Path of the file to write
+    n_elements, n_nodes : Integers
+    Size of the mesh
+    seed : Integer
+    Seed of the random mesh
+
+    Returns
+    -------
+    Writes the file
+    """
+    rng = np.random.default_rng(seed)
+    slf = ppSELAFIN(slf_file)
+    slf.setPrecision('f', 4)
+    slf.setTitle('read_header benchmark')
+    slf.setVarNames(['WATER DEPTH'])
+    slf.setVarUnits(['M'])
+    slf.setIPARAM([1, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+    ipobo = np.zeros(n_nodes, dtype=np.int32)
+    ipobo[:100] = np.arange(1, 101)
+    slf.setMesh(n_elements, n_nodes, 3, rng.integers(1, n_nodes + 1, size=(n_elements, 3)).astype(np.int32), ipobo,
+                rng.random(n_nodes) * 1000, rng.random(n_nodes) * 1000)
+    slf.writeHeader()
+    slf.writeVariables(0.0, rng.random((1, n_nodes)))
+    slf.close()
+
+
+def time_read(reader, slf_file, repeat):
+    """Returns the best time of repeat calls to readHeader(), and the object of the last call"""
+    best = np.inf
+    for _ in range(repeat):
+        slf = reader(slf_file)
+        start = time.perf_counter()
+        slf.readHeader()
+        best = min(best, time.perf_counter() - start)
+        slf.close()
+    return best, slf
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the bulk geometry reader of ppSELAFIN.readHeader()")
+    parser.add_argument("-e", type=int, default=1000000, help="number of elements")
+    parser.add_argument("-n", type=int, default=500000, help="number of nodes")
+    parser.add_argument("-r", type=int, default=3, help="repetitions (the best time is kept)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        slf_file = os.path.join(folder, "mesh.slf")
+        write_mesh(slf_file, args.e, args.n)
+        t_bulk, bulk = time_read(ppSELAFIN, slf_file, args.r)
+        t_value, value = time_read(PerValueSELAFIN, slf_file, 1)
+
+    for name in ("IKLE", "IPOBO", "x", "y"):
+        if not np.array_equal(getattr(bulk, name), getattr(value, name)):
+            raise ValueError(name + " differs between the two readers")
+    print("%d elements, %d nodes: per value %.3f s, bulk %.3f s (%.0fx faster), same IKLE, IPOBO, x and y"
+          % (args.e, args.n, t_value, t_bulk, t_value / t_bulk))
@@ -16,6 +16,7 @@ Contact: iamakash0123@gmail.com
 import sys, os
 import numpy as np
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.gaussian_process import GaussianProcessRegressor
 from sklearn.gaussian_process.kernels import RBF
 import init
@@ -50,6 +51,16 @@ observations = np.zeros((n_points * 2,1))
 observations[0:n_points,0] = temp[:, 2]
 observations[n_points:n_points*2,0] = temp[:, 3]
 observations = observations.reshape(-1,1)
+# Calibration with the last time step of the results ("last"), or with the time series of the unsteady run at the
+# measurement times ("time_series"). The measured time series are in observations_time_series, one row per time with
+# the time (in seconds) followed by the velocity of every calibration point and then their water depth
+calibration_mode = "last"
+observations_time_series = "calibration_time_series.csv"
+if calibration_mode == "time_series":
+    temp = np.loadtxt(observations_time_series, skiprows=1, delimiter=",")
+    observation_times = temp[:, 0]
+    observations = temp[:, 1:].T.reshape(-1, 1)
+n_outputs = observations.shape[0]
 
 
 
@@ -73,6 +84,13 @@ n_processors = "4"
 #
 # # Calibration parameters
 calibration_variable = "VELOCITY"
+# Sampling of the calibration points in the result files: "mesh" interpolates linearly inside the mesh triangle of
+# each point, "raster" reads the cell of each point in a 1 m cubic raster of the results (the method first used to
+# extract the initial runs), which rasterizes the whole reach in the loop. The two differ by about 1 % of the range
+# of the variables, so every row of the training matrix must come from the same method: the initial runs (archived
+# in path_simulations) are extracted again with point_sampling before the loop, only if they were extracted with
+# another method or changed (see reextract_simulations)
+point_sampling = "mesh"
 #
 #
 # Paths
@@ -80,6 +98,31 @@ path_results = "../results"
 path_simulations = "../simulations"
 path_xyz = "../xyz/"
 path_tif = "../Tif/"
+path_mesh_cache = "../mesh_cache/"
+#
+# Rasters of each iteration are generated in the background (number of worker processes and maximum number of
+# raster jobs queued at the same time)
+raster_workers = 2
+raster_max_pending = 4
+# Interpolation of the rasters: "mesh" uses the triangles of the Telemac mesh (with a resampling plan cached in
+# path_mesh_cache), "cubic" interpolates the gridded nodes. It follows point_sampling, so the saved rasters hold the
+# values the surrogate model is trained on
+raster_method = "mesh" if point_sampling == "mesh" else "cubic"
+# "cube" saves the rasters of all the iterations as the bands of one tiled and compressed raster per variable,
+# "tif" saves one raster per iteration and variable
+raster_output = "cube"
+#
+# Compaction of the result files moved to path_simulations (variables and time steps to keep, single precision
+# storage and whether the left out data is kept in a compressed .npz next to each file). The compacted file replaces
+# the original one, so the variables that are not kept can only be recovered from the .npz: with
+# compact_save_dropped = False they are lost for good, and the archived runs can not be extracted again
+# (reextract_calibration.py) for other variables. BOTTOM is kept because the free surface and the derived variables
+# that use it (i.e., FREE SURFACE SLOPE) are computed from it; set compact_save_dropped = False only to save the
+# most disk space once the calibration variables are final
+compact_variables = ["WATER DEPTH", "SCALAR VELOCITY", "BOTTOM"]
+compact_frames = None
+compact_single_precision = True
+compact_save_dropped = True
 #
 # #
 # # END OF USER INPUT  --------------------------------------------------------------------------------------------------
@@ -91,6 +134,11 @@ BME = np.zeros((iteration_limit, 1))
 RE = np.zeros((iteration_limit, 1))
 al_BME = np.zeros((d_size_AL, 1))
 al_RE = np.zeros((d_size_AL, 1))
+# Result files are compacted in the background while the next iteration runs
+compaction_pool = ThreadPoolExecutor(max_workers=1)
+compaction_jobs = []
+# Rasters are generated in the background, only the calibration points are extracted in the loop
+raster_pool = RasterExportPool(path_tif + "raster_manifest.jsonl", raster_workers, raster_max_pending)
 #
 #
 # Part 2. Read initial collocation points  ----------------------------------------------------------------------------
@@ -101,23 +149,20 @@ n_simulation = collocation_points.shape[0]
 print(collocation_points)
 #
 #Part 3. Read the previously computed simulations of the numerical model in the initial collocation points -----------
-temp = np.loadtxt(os.path.abspath(os.path.expanduser(path_results)) + "/" + simulation_names[0] + "_" +
-                  calibration_variable + ".txt")
-model_results = np.zeros((collocation_points.shape[0], temp.shape[0] * 2))
-
-
-for i, name in enumerate(simulation_names):
-    model_results[i, 0: temp.shape[0]] = np.loadtxt(os.path.abspath(os.path.expanduser(path_results))+"/" + name + "_" +
-                                     calibration_variable + ".txt")[:, 2]
-    model_results[i, temp.shape[0]: temp.shape[0] * 2] = np.loadtxt(os.path.abspath(os.path.expanduser(path_results))+"/" + name + "_" +
-                                     calibration_variable + ".txt")[:, 3]
+# The initial runs are sampled as in the loop (point_sampling, or the time series at the observation times); the
+# files already extracted that way are kept
+model_results = reextract_simulations(simulation_names, path_simulations, path_results, x, y,
+                                      result_name_telemac=result_name_telemac,
+                                      calibration_variable=calibration_variable, mesh_cache=path_mesh_cache,
+                                      sampling=point_sampling,
+                                      times_out=observation_times if calibration_mode == "time_series" else None)
 print(model_results.shape)
 
 # Loop for bayesian iterations
 for iter in range(0, iteration_limit):
     #Part 4. Computation of surrogate model prediction in MC points using gaussian processes --------------------------
-    surrogate_prediction = np.zeros((n_points * 2, prior_distribution.shape[0]))
-    surrogate_std = np.zeros((n_points * 2, prior_distribution.shape[0]))
+    surrogate_prediction = np.zeros((n_outputs, prior_distribution.shape[0]))
+    surrogate_std = np.zeros((n_outputs, prior_distribution.shape[0]))
 
     for i, model in enumerate(model_results.T):
         kernel = RBF(length_scale=[7, 2.5, 7, 2.5, 7, 2.5, 7, 2.5], length_scale_bounds=[(6, 8), (1, 4), (6, 8), (1, 4), (6, 8), (1, 4),( 6, 8), (1, 4)]) * np.var(model)
@@ -129,6 +174,9 @@ for iter in range(0, iteration_limit):
     # Part 5. Read or compute the other errors to incorporate in the likelihood function
     loocv_error = np.loadtxt("Error.txt")
     total_error = (loocv_error)
+    if calibration_mode == "time_series":
+        # Same error for all the times of a point and variable
+        total_error = np.repeat(loocv_error, len(observation_times))
     print(surrogate_prediction.shape)
     print(prior_distribution.shape)
 
@@ -148,7 +196,7 @@ for iter in range(0, iteration_limit):
 
     for iAL in range(0, len(al_unique_index)):
         # Exploration of output subspace associated with a defined prior combination.
-        al_exploration = np.random.normal(size=(mc_size_AL, n_points*2))*surrogate_std[:, al_unique_index[iAL]] + \
+        al_exploration = np.random.normal(size=(mc_size_AL, n_outputs))*surrogate_std[:, al_unique_index[iAL]] + \
                          surrogate_prediction[:, al_unique_index[iAL]]
         # BAL scores computation
         al_BME[iAL], al_RE[iAL] = compute_bayesian_scores(al_exploration, observations.T, total_error)
@@ -176,15 +224,35 @@ for iter in range(0, iteration_limit):
     save_name = path_results + "/PC" + str(n_simulation+1+iter) + "_" + calibration_variable + ".txt"
     save_name_xyz = path_xyz + str(iter)
     save_name_tif = path_tif + str(iter)
-    results = get_variable_value(updated_string, x, y, save_name_xyz,
-                             save_name_tif, save_name)
-    model_sort = np.hstack((results[:, 2], results[:, 3]))
-    model_results = np.vstack((model_results, model_sort.reshape(1,n_points * 2)))
+    if calibration_mode == "time_series":
+        times, series = get_variable_time_series(updated_string, x, y, times_out=observation_times,
+                                                 save_name=save_name[0:-4] + "_series.txt",
+                                                 mesh_cache=path_mesh_cache)
+        model_sort = flatten_time_series(series)
+    else:
+        results = get_variable_value(updated_string, x, y, save_name=save_name, mesh_cache=path_mesh_cache,
+                                     sampling=point_sampling)
+        model_sort = np.hstack((results[:, 2], results[:, 3]))
+    model_results = np.vstack((model_results, model_sort.reshape(1, n_outputs)))
     print(model_results)
 
     # Move the created files to their respective folders
 
     shutil.move(result_name_telemac[0:] + str(n_simulation+1+iter) + ".slf", path_simulations)
+    raster_jobs = []
+    for m, xyz_name in [("WATER DEPTH", "Waterdepth.xyz"), ("SCALAR VELOCITY", "Velocity.xyz")]:
+        if raster_output == "cube":
+            raster_jobs.append(raster_pool.submit(iter, path_simulations + "/" + updated_string, m,
+                                                  save_name_xyz + xyz_name, "", raster_method, path_mesh_cache,
+                                                  path_tif + m + "_cube.tif", iter + 1, iteration_limit))
+        else:
+            raster_jobs.append(raster_pool.submit(iter, path_simulations + "/" + updated_string, m,
+                                                  save_name_xyz + xyz_name, save_name_tif + m + ".tif",
+                                                  raster_method, path_mesh_cache))
+    # The compaction replaces the result file, so it waits (on its own thread) for the rasters read from it
+    compaction_jobs.append(compaction_pool.submit(compact_simulation, path_simulations + "/" + updated_string,
+                                                  compact_variables, compact_frames, compact_single_precision,
+                                                  compact_save_dropped, raster_jobs))
 
     # Append the parameter used to a file
     new_line = "; ".join(map('{:.3f}'.format, collocation_points[-1, :]))
@@ -194,4 +262,12 @@ for iter in range(0, iteration_limit):
     # Progress report
     print("Bayesian iteration: " + str(iter+1) + "/" + str(iteration_limit))
 
-
+# Wait for the pending rasters and compactions
+raster_pool.flush()
+if raster_output == "cube":
+    finish_raster_cube(path_tif + "WATER DEPTH_cube.tif")
+    finish_raster_cube(path_tif + "SCALAR VELOCITY_cube.tif")
+# Wait for the pending compactions (raises the error of any compaction that failed)
+for job in compaction_jobs:
+    job.result()
+compaction_pool.shutdown()
@@ -1 +1 @@
-__all__ = ["readMesh","writeMesh","utilities","selafin_io_pp"]
+__all__ = ["readMesh","writeMesh","utilities","selafin_io_pp","selafin_stats","selafin_partitioned","selafin_compact","point_location","mesh_raster","selafin_derived","mesh_boundary"]
@@ -0,0 +1,157 @@
+#
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#                                                                       #
+#                                 mesh_boundary.py                      #
+#                                                                       #
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#
+# Date: Oct 18, 2026
+#
+# Purpose: Outline of the domain of a TELEMAC mesh taken from its topology,
+# instead of from a concave hull (alpha shape) of the nodes. The boundary
+# edges are the edges of the triangles (IKLE) that belong to one triangle
+# only; they are chained into closed rings (the outer boundary and one ring
+# per island), and burnt into a raster mask of the cells whose centre is
+# inside the domain, with an even-odd scanline over the boundary edges.
+# The edges are found from IKLE rather than from IPOBO, as IPOBO holds the
+# local to global numbering (KNOLG) in the files of a parallel run.
+#
+# The grid is defined as in bea.PreProFuzzy and mesh_raster.py: the upper
+# left corner is (xmin, ymax), cells are square of size res, and row 0 is
+# the top row.
+#
+# Uses: Python 2 or 3, Numpy
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global Imports
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import numpy as np
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def boundaryEdges(ikle):
+  # ikle is the zero based connectivity of the triangles (NELEM, 3). Returns
+  # the (nedges, 2) boundary edges, each oriented as in its triangle
+  ikle = np.asarray(ikle, dtype=np.int64)
+  edges = np.concatenate((ikle[:,[0,1]], ikle[:,[1,2]], ikle[:,[2,0]]))
+
+  # an interior edge appears twice (once in each direction)
+  key = np.sort(edges, axis=1)
+  key = key[:,0] * (ikle.max() + 1) + key[:,1]
+  uniq, inverse, counts = np.unique(key, return_inverse=True,
+    return_counts=True)
+
+  return edges[counts[inverse.ravel()] == 1]
+
+def ringArea(x, y, ring):
+  # signed area of a closed ring of nodes (positive if counter clockwise)
+  xr = x[ring]
+  yr = y[ring]
+  return 0.5 * np.sum(xr * np.roll(yr, -1) - np.roll(xr, -1) * yr)
+
+def nextEdge(x, y, edges, order, first, used, edge, ccw):
+  # unused boundary edge leaving the end node of edge (-1 if none). At a
+  # node where the boundary touches itself (a pinch node) there are several;
+  # the one taken is the first met turning around the node from edge, on
+  # the side of the triangle of edge (clockwise for counter clockwise
+  # IKLE), so the ring stays around the same part of the domain
+  node = edges[edge,1]
+  out = order[first[node]:first[node+1]]
+  out = out[~used[out]]
+  if (len(out) < 2):
+    return out[0] if len(out) == 1 else -1
+  back = np.arctan2(y[edges[edge,0]] - y[node], x[edges[edge,0]] - x[node])
+  ahead = np.arctan2(y[edges[out,1]] - y[node], x[edges[out,1]] - x[node])
+  turn = back - ahead if ccw else ahead - back
+  return out[np.argmin(np.mod(turn, 2.0 * np.pi))]
+
+def boundaryRings(x, y, ikle):
+  # chains the boundary edges into closed rings of nodes (the first node is
+  # not repeated at the end). Returns the rings sorted by decreasing area,
+  # and their signed areas; the outer boundary has the sign of the triangles
+  # (positive for counter clockwise IKLE) and the islands the opposite one.
+  # Every boundary edge is in one ring; a pinch node (where the boundary
+  # touches itself) is in every ring passing through it
+  x = np.asarray(x, dtype=np.float64)
+  y = np.asarray(y, dtype=np.float64)
+  ikle = np.asarray(ikle, dtype=np.int64)
+  edges = boundaryEdges(ikle)
+  ccw = np.sum((x[ikle[:,1]] - x[ikle[:,0]]) * (y[ikle[:,2]] - y[ikle[:,0]]) -
+    (x[ikle[:,2]] - x[ikle[:,0]]) * (y[ikle[:,1]] - y[ikle[:,0]])) >= 0
+
+  # outgoing edges of node n: order[first[n]:first[n+1]]
+  order = np.argsort(edges[:,0], kind='stable')
+  first = np.searchsorted(edges[order,0], np.arange(len(x) + 1))
+
+  # the first edge of a ring is marked as used once the ring is closed, so
+  # that the ring can be closed with it at a pinch node
+  used = np.zeros(len(edges), dtype=bool)
+  rings = []
+  for start in order:
+    if used[start]:
+      continue
+    ring = [edges[start,0]]
+    edge = nextEdge(x, y, edges, order, first, used, start, ccw)
+    while (edge >= 0 and edge != start):
+      used[edge] = True
+      ring.append(edges[edge,0])
+      edge = nextEdge(x, y, edges, order, first, used, edge, ccw)
+    used[start] = True
+    rings.append(np.array(ring, dtype=np.int64))
+
+  areas = np.array([ringArea(x, y, ring) for ring in rings])
+  order = np.argsort(-np.abs(areas))
+  return [rings[i] for i in order], areas[order]
+
+def boundaryMask(x, y, ikle, xmin, ymax, res, nrow, ncol):
+  # (nrow, ncol) boolean raster, True in the cells whose centre is inside
+  # the mesh (and not in an island)
+  x = np.asarray(x, dtype=np.float64)
+  y = np.asarray(y, dtype=np.float64)
+  edges = boundaryEdges(ikle)
+  x1 = x[edges[:,0]]
+  y1 = y[edges[:,0]]
+  x2 = x[edges[:,1]]
+  y2 = y[edges[:,1]]
+
+  # rows whose centre line crosses each edge; the lower end is included and
+  # the upper end is not, so a vertex is never crossed twice
+  ylo = np.minimum(y1, y2)
+  yhi = np.maximum(y1, y2)
+  r0 = np.maximum(np.floor((ymax - yhi) / res - 0.5).astype(np.int64) + 1, 0)
+  r1 = np.minimum(np.floor((ymax - ylo) / res - 0.5).astype(np.int64), nrow - 1)
+  count = np.maximum(r1 - r0 + 1, 0)
+
+  # one crossing per edge and row
+  edge = np.repeat(np.arange(len(edges)), count)
+  row = np.repeat(r0, count) + np.arange(count.sum()) - \
+    np.repeat(np.cumsum(count) - count, count)
+  yc = ymax - (row + 0.5) * res
+  xc = x1[edge] + (yc - y1[edge]) * (x2[edge] - x1[edge]) / (y2[edge] - y1[edge])
+
+  # every row has an even number of crossings; the cells between the first
+  # and the second, the third and the fourth, etc. are inside
+  order = np.lexsort((xc, row))
+  row = row[order][0::2]
+  xa = xc[order][0::2]
+  xb = xc[order][1::2]
+  c0 = np.maximum(np.ceil((xa - xmin) / res - 0.5).astype(np.int64), 0)
+  c1 = np.minimum(np.floor((xb - xmin) / res - 0.5).astype(np.int64), ncol - 1)
+  keep = c0 <= c1
+
+  diff = np.zeros((nrow, ncol + 1), dtype=np.int32)
+  np.add.at(diff, (row[keep], c0[keep]), 1)
+  np.add.at(diff, (row[keep], c1[keep] + 1), -1)
+  return np.cumsum(diff[:, :ncol], axis=1) > 0
+
+def saveBoundaryMask(mask_file, mask):
+  # bit packed, one bit per cell
+  np.savez_compressed(mask_file, bits=np.packbits(mask, axis=1),
+    shape=np.array(mask.shape))
+
+def loadBoundaryMask(mask_file):
+  data = np.load(mask_file)
+  nrow, ncol = data['shape']
+  return np.unpackbits(data['bits'], axis=1, count=ncol).astype(bool)
@@ -0,0 +1,114 @@
+#
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#                                                                       #
+#                                 mesh_raster.py                        #
+#                                                                       #
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#
+# Date: Oct 18, 2026
+#
+# Purpose: Rasterizes the results of a TELEMAC mesh using the triangles of
+# the mesh (IKLE) instead of re-triangulating the nodes. For a given mesh
+# and grid, the element containing the centre of every cell and the
+# barycentric weights of its three nodes are computed once and stored as a
+# sparse resampling matrix (cells x nodes), which can be saved to disk. A
+# raster of any result is then one sparse matrix-vector product. Cells whose
+# centre is outside the mesh are set to nodata, and so are dry cells if a
+# wet/dry state of the nodes is given.
+#
+# The grid is defined as in bea.PreProFuzzy: the upper left corner is
+# (xmin, ymax), cells are square of size res, and row 0 is the top row.
+#
+# Uses: Python 2 or 3, Numpy, Scipy
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global Imports
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import numpy as np
+from scipy import sparse
+from ppmodules.point_location import barycentric
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def buildResamplingPlan(x, y, ikle, xmin, ymax, res, nrow, ncol, chunk=100000,
+  tol=1.0E-9):
+  # x, y are the node coordinates and ikle the zero based connectivity of the
+  # triangles (NELEM, 3). Returns a sparse (nrow*ncol, NPOIN) matrix; cell
+  # (r, c) is row r*ncol + c. Elements are processed chunk at a time, so
+  # memory is bounded by the number of cells covered by one chunk
+  x = np.asarray(x, dtype=np.float64)
+  y = np.asarray(y, dtype=np.float64)
+  ikle = np.asarray(ikle, dtype=np.int64)
+  npoin = len(x)
+
+  # cells covered so far; a cell on the edge between two elements is only
+  # taken from the first one
+  taken = np.zeros(nrow * ncol, dtype=bool)
+  cells = []
+  nodes = []
+  weights = []
+
+  for start in range(0, len(ikle), chunk):
+    elem = np.arange(start, min(start + chunk, len(ikle)))
+    ex = x[ikle[elem]]
+    ey = y[ikle[elem]]
+
+    # range of cell centres inside the bounding box of each element
+    c0 = np.maximum(np.ceil((ex.min(axis=1) - xmin) / res - 0.5), 0).astype(np.int64)
+    c1 = np.minimum(np.floor((ex.max(axis=1) - xmin) / res - 0.5), ncol - 1).astype(np.int64)
+    r0 = np.maximum(np.ceil((ymax - ey.max(axis=1)) / res - 0.5), 0).astype(np.int64)
+    r1 = np.minimum(np.floor((ymax - ey.min(axis=1)) / res - 0.5), nrow - 1).astype(np.int64)
+    nc = np.maximum(c1 - c0 + 1, 0)
+    nr = np.maximum(r1 - r0 + 1, 0)
+    count = nc * nr
+
+    # one candidate (element, cell) pair per cell of each bounding box
+    cand = np.repeat(elem, count)
+    local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    width = np.repeat(nc, count)
+    col = np.repeat(c0, count) + local % np.maximum(width, 1)
+    row = np.repeat(r0, count) + local // np.maximum(width, 1)
+
+    px = xmin + (col + 0.5) * res
+    py = ymax - (row + 0.5) * res
+    bary = barycentric(x, y, ikle, cand, px, py)
+    inside = (bary >= -tol).all(axis=-1)
+
+    # keep the first element of each cell, in this chunk and the previous ones
+    cell, first = np.unique((row * ncol + col)[inside], return_index=True)
+    new = ~taken[cell]
+    taken[cell[new]] = True
+    cells.append(cell[new])
+    nodes.append(ikle[cand[inside][first][new]])
+    weights.append(bary[inside][first][new])
+
+  rows = np.repeat(np.concatenate(cells), 3)
+  cols = np.concatenate(nodes).ravel()
+  data = np.concatenate(weights).ravel()
+
+  return sparse.csr_matrix((data, (rows, cols)), shape=(nrow * ncol, npoin))
+
+def rasterize(plan, values, nrow, ncol, nodatavalue=-9999, wet=None):
+  # values are the node values of one variable; wet, if given, is a boolean
+  # array telling which nodes are wet. Returns the (nrow, ncol) raster, with
+  # nodatavalue outside the mesh and in the cells that take weight from a
+  # dry node
+  array = plan.dot(np.asarray(values, dtype=np.float64))
+
+  valid = np.diff(plan.indptr) > 0
+  if wet is not None:
+    # the weights of each cell add up to 1, so all its nodes are wet only if
+    # the weighted wet fraction is 1
+    fraction = plan.dot(np.asarray(wet, dtype=np.float64))
+    valid &= fraction >= 1.0 - 1.0E-9
+
+  array[~valid] = nodatavalue
+  return array.reshape(nrow, ncol)
+
+def saveResamplingPlan(plan_file, plan):
+  sparse.save_npz(plan_file, plan)
+
+def loadResamplingPlan(plan_file):
+  return sparse.load_npz(plan_file).tocsr()
@@ -0,0 +1,117 @@
+#
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#                                                                       #
+#                                 point_location.py                     #
+#                                                                       #
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#
+# Date: Oct 18, 2026
+#
+# Purpose: Locates points (i.e., calibration points) in the triangles of a
+# TELEMAC mesh, and samples the results of a *.slf file at those points by
+# linear (barycentric) interpolation of the three nodes of the triangle,
+# which is how TELEMAC itself represents the results inside an element.
+# Locating is done once per mesh and set of points; sampling a new result
+# file is then one gather and one weighted sum.
+#
+# Uses: Python 2 or 3, Numpy, Scipy
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global Imports
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import numpy as np
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def barycentric(x, y, ikle, elem, px, py):
+  # barycentric coordinates of points (px, py) with respect to the elements
+  # elem of the mesh; elem can have one more dimension than px (candidates),
+  # and px, py can be a single point tested against a list of elements
+  x1 = x[ikle[elem,0]]
+  y1 = y[ikle[elem,0]]
+  x2 = x[ikle[elem,1]]
+  y2 = y[ikle[elem,1]]
+  x3 = x[ikle[elem,2]]
+  y3 = y[ikle[elem,2]]
+
+  if (np.ndim(px) > 0 and elem.ndim > np.ndim(px)):
+    px = px[:, np.newaxis]
+    py = py[:, np.newaxis]
+
+  # degenerate (zero area) triangles give nan, and never contain a point
+  with np.errstate(divide='ignore', invalid='ignore'):
+    det = (y2 - y3)*(x1 - x3) + (x3 - x2)*(y1 - y3)
+    l1 = ((y2 - y3)*(px - x3) + (x3 - x2)*(py - y3)) / det
+    l2 = ((y3 - y1)*(px - x3) + (x1 - x3)*(py - y3)) / det
+  l3 = 1.0 - l1 - l2
+
+  return np.stack((l1, l2, l3), axis=-1)
+
+def locatePoints(x, y, ikle, px, py, k=16, tol=1.0E-9):
+  # x, y are the node coordinates, ikle the zero based connectivity of the
+  # triangles (NELEM, 3) and px, py the points to locate. Every point is
+  # tested against the k elements with the closest centroids first, and
+  # against all the elements only if none of those contains it. Returns
+  #   elem    : element containing each point (-1 if outside the mesh)
+  #   nodes   : (npts, 3) zero based nodes used to sample each point
+  #   weights : (npts, 3) barycentric weights of those nodes
+  # Points outside the mesh take the value of the closest node.
+  # scipy is only needed here, so sampling (samplePoints) does not load it
+  from scipy import spatial
+
+  x = np.asarray(x, dtype=np.float64)
+  y = np.asarray(y, dtype=np.float64)
+  ikle = np.asarray(ikle, dtype=np.int64)
+  px = np.asarray(px, dtype=np.float64).ravel()
+  py = np.asarray(py, dtype=np.float64).ravel()
+  npts = len(px)
+
+  elem = np.full(npts, -1, dtype=np.int64)
+  weights = np.zeros((npts, 3))
+
+  # candidate elements, from the closest centroids
+  cx = x[ikle].mean(axis=1)
+  cy = y[ikle].mean(axis=1)
+  tree = spatial.cKDTree(np.column_stack((cx, cy)))
+  k = min(k, len(ikle))
+  dist, cand = tree.query(np.column_stack((px, py)), k=k)
+  cand = cand.reshape(npts, k)
+
+  bary = barycentric(x, y, ikle, cand, px, py)
+  inside = (bary >= -tol).all(axis=-1)
+  found = inside.any(axis=1)
+  first = np.argmax(inside, axis=1)
+  elem[found] = cand[found, first[found]]
+  weights[found] = bary[found, first[found]]
+
+  # brute force search for the points that were not found
+  allElem = np.arange(len(ikle))
+  for i in np.where(~found)[0]:
+    bary = barycentric(x, y, ikle, allElem, px[i], py[i])
+    inside = np.where((bary >= -tol).all(axis=-1))[0]
+    if (len(inside) > 0):
+      elem[i] = inside[0]
+      weights[i] = bary[inside[0]]
+
+  nodes = np.zeros((npts, 3), dtype=np.int64)
+  nodes[elem >= 0] = ikle[elem[elem >= 0]]
+
+  # points outside the mesh; all the weight goes to the closest node
+  outside = np.where(elem < 0)[0]
+  if (len(outside) > 0):
+    print('Warning: ' + str(len(outside)) + ' points are outside the mesh; ' +
+      'they take the value of the closest node')
+    nodeTree = spatial.cKDTree(np.column_stack((x, y)))
+    dist, closest = nodeTree.query(np.column_stack((px[outside], py[outside])))
+    nodes[outside] = closest[:, np.newaxis]
+    weights[outside] = [1.0, 0.0, 0.0]
+
+  return elem, nodes, weights
+
+def samplePoints(values, nodes, weights):
+  # values has the nodes in its last axis (i.e., (NBV1, NPOIN) as returned
+  # by ppSELAFIN.extractVariables); returns the same array with the last
+  # axis replaced by the sampled points
+  return (np.asarray(values)[..., nodes] * weights).sum(axis=-1)
@@ -0,0 +1,135 @@
+#
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#                                                                       #
+#                                 selafin_compact.py                    #
+#                                                                       #
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#
+# Date: Oct 18, 2026
+#
+# Purpose: Writes a trimmed copy of a *.slf file that keeps only some of the
+# variables and some of the frames, optionally downcast to single precision,
+# for archiving the results of many simulations. The records that are left
+# out can be kept in a compressed sidecar (a *.npz file, one array per frame
+# and variable, readable with numpy.load). The trimmed file is a normal
+# SELAFIN file, readable with ppSELAFIN. Downcasting to single precision is
+# lossy, and the lost precision is not kept in the sidecar.
+#
+# Uses: Python 3, Numpy
+#
+# Example:
+#
+# python -m ppmodules.selafin_compact -i res_tel_PC16.slf -o res_small.slf
+#   -v "WATER DEPTH" "SCALAR VELOCITY" -t -1 --single --sidecar res_rest.npz
+#
+# where:
+#
+# -i input *.slf file
+# -o output (trimmed) *.slf file
+# -v variables to keep (all by default)
+# -t indices of the frames to keep; negative counts from the end (all by default)
+# --single writes the output in single precision
+# --sidecar *.npz file where the left out records are kept
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global Imports
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import argparse
+import zipfile
+import numpy as np
+from ppmodules.selafin_io_pp import ppSELAFIN
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def compactSelafin(slf_file, out_file, names=None, frames=None, single=False,
+  sidecar=None):
+  # names is the list of variables to keep, frames the list of frame indices
+  # to keep (None keeps all of them), single True to write in single
+  # precision and sidecar the *.npz file for the left out records (or None
+  # to drop them). Returns the number of frames written
+  slf = ppSELAFIN(slf_file)
+  slf.readHeader()
+  slf.readTimes()
+  times = slf.getTimes()
+  numTimes = len(times)
+
+  vnames = [v.strip() for v in slf.getVarNames()]
+  if names is None:
+    names = vnames
+  index = slf.getVarIndex(names)
+
+  if frames is None:
+    frames = range(numTimes)
+  for t in frames:
+    if (t < -numTimes or t >= numTimes):
+      raise IndexError('Frame ' + str(t) + ' out of range; ' + slf_file +
+        ' has ' + str(numTimes) + ' frames')
+  # negative indices count from the end; duplicates are written once
+  frames = sorted(set(t % numTimes for t in frames))
+
+  out = ppSELAFIN(out_file)
+  if single:
+    out.setPrecision('f', 4)
+  else:
+    out.setPrecision(*slf.getPrecision())
+  out.setTitle(slf.title)
+  out.setVarNames([slf.getVarNames()[i] for i in index])
+  out.setVarUnits([slf.getVarUnits()[i] for i in index])
+  out.setIPARAM(slf.IPARAM)
+  out.setDATE(slf.getDATE())
+  out.setMesh(*slf.getMesh())
+  out.writeHeader()
+
+  for t in frames:
+    out.writeVariables(times[t], slf.extractVariables(t, names))
+  out.close()
+
+  if sidecar is not None:
+    writeSidecar(slf, sidecar, index, frames)
+
+  slf.close()
+  return len(frames)
+
+def writeSidecar(slf, sidecar, index, frames):
+  # stores every record of slf that is not in the kept variables (index) at
+  # the kept frames, one array per record, streamed into a compressed *.npz
+  # so only one record is in memory at a time. The arrays are named
+  # '<frame>_<variable>', and the frame times are kept in 'times'
+  vnames = [v.strip() for v in slf.getVarNames()]
+  dtype = slf.endian + slf.float_type
+
+  with zipfile.ZipFile(sidecar, 'w', compression=zipfile.ZIP_DEFLATED,
+    allowZip64=True) as zf:
+    with zf.open('times.npy', 'w', force_zip64=True) as f:
+      np.lib.format.write_array(f, np.asarray(slf.getTimes()))
+
+    for t in range(len(slf.frameOffsets)):
+      for j in range(slf.NBV1):
+        if (t in frames and j in index):
+          continue
+        values = slf.readRecordAt(slf.frameOffsets[t] + slf.time_size +
+          j*slf.var_size, dtype, slf.NPOIN)
+        name = '{:05d}_{}.npy'.format(t, vnames[j])
+        with zf.open(name, 'w', force_zip64=True) as f:
+          np.lib.format.write_array(f, values)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# MAIN
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Writes a trimmed *.slf file')
+  parser.add_argument('-i', required=True, help='input *.slf file')
+  parser.add_argument('-o', required=True, help='output *.slf file')
+  parser.add_argument('-v', nargs='+', default=None, help='variables to keep')
+  parser.add_argument('-t', nargs='+', type=int, default=None,
+    help='frames to keep')
+  parser.add_argument('--single', action='store_true',
+    help='write in single precision')
+  parser.add_argument('--sidecar', default=None,
+    help='*.npz file for the left out records')
+  args = parser.parse_args()
+
+  n = compactSelafin(args.i, args.o, args.v, args.t, args.single, args.sidecar)
+  print('Wrote ' + str(n) + ' frames to ' + args.o)
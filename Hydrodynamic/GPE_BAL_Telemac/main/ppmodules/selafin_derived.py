@@ -0,0 +1,192 @@
+#
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#                                                                       #
+#                                 selafin_derived.py                    #
+#                                                                       #
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#
+# Date: Oct 18, 2026
+#
+# Purpose: Derived variables of a TELEMAC 2d result file (i.e., the Froude
+# number, the bed shear stress or the slope of the free surface), defined
+# declaratively in DERIVED by the variables they need and the function that
+# computes them. A requested variable is read from the *.slf file if it is
+# there, and derived otherwise (recursively, so the free surface can itself
+# come from the water depth and the bottom). resolveVariables() gives the
+# raw variables to read, each of them once, and computeVariables() computes
+# all the requested variables from those raw arrays, vectorized over the
+# last (node) axis and any leading axes (i.e., time). Only the free surface
+# slope needs the mesh, and with it the values of all the nodes.
+#
+# Uses: Python 2 or 3, Numpy, Scipy
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global Imports
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import numpy as np
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# default physical parameters; any of them can be replaced through the
+# params dictionary of computeVariables()
+# gravity              : acceleration of gravity (m/s2)
+# density              : density of water (kg/m3)
+# min_depth            : nodes with a smaller depth are dry (Froude number
+#                        and shear stress set to 0)
+# friction_law         : 2 Chezy, 3 Strickler, 4 Manning (as in TELEMAC)
+# friction_coefficient : coefficient of the friction law, a number or one
+#                        value per node (no default)
+PARAMETERS = {'gravity' : 9.81, 'density' : 1000.0, 'min_depth' : 1.0E-3,
+  'friction_law' : 3, 'friction_coefficient' : None}
+
+def scalarVelocity(u, v, mesh, params):
+  return np.sqrt(u*u + v*v)
+
+def freeSurface(h, b, mesh, params):
+  return h + b
+
+def froudeNumber(vel, h, mesh, params):
+  wet = h > params['min_depth']
+  return np.where(wet, vel / np.sqrt(params['gravity'] * np.where(wet, h, 1.0)),
+    0.0)
+
+def unitDischarge(vel, h, mesh, params):
+  return vel * h
+
+def bedShearStress(vel, h, mesh, params):
+  # tau = rho * g * U^2 / C^2 (Chezy), rho * g * U^2 / (K^2 * h^(1/3))
+  # (Strickler) or rho * g * n^2 * U^2 / h^(1/3) (Manning)
+  law = params['friction_law']
+  coef = params['friction_coefficient']
+  if coef is None:
+    raise ValueError('BED SHEAR STRESS needs the friction_coefficient ' +
+      'parameter')
+  coef = np.asarray(coef, dtype=np.float64)
+
+  wet = h > params['min_depth']
+  hw = np.where(wet, h, 1.0)
+  if (law == 2):
+    cf = params['gravity'] / (coef * coef)
+  elif (law == 3):
+    cf = params['gravity'] / (coef * coef * np.cbrt(hw))
+  elif (law == 4):
+    cf = params['gravity'] * coef * coef / np.cbrt(hw)
+  else:
+    raise ValueError('Friction law ' + str(law) + ' not supported; use 2 ' +
+      '(Chezy), 3 (Strickler) or 4 (Manning)')
+
+  return np.where(wet, params['density'] * cf * vel * vel, 0.0)
+
+def freeSurfaceSlope(s, mesh, params):
+  # magnitude of the gradient of the free surface; the gradient is constant
+  # in each triangle, and the value of a node is the area weighted average
+  # of the triangles around it. scipy is only needed here, so the other
+  # variables do not load it
+  from scipy import sparse
+
+  x, y, ikle = mesh
+  x1 = x[ikle[:,0]]
+  y1 = y[ikle[:,0]]
+  x2 = x[ikle[:,1]]
+  y2 = y[ikle[:,1]]
+  x3 = x[ikle[:,2]]
+  y3 = y[ikle[:,2]]
+  det = (x2 - x1)*(y3 - y1) - (x3 - x1)*(y2 - y1)
+
+  s1 = s[..., ikle[:,0]]
+  s2 = s[..., ikle[:,1]]
+  s3 = s[..., ikle[:,2]]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    gx = np.where(det != 0, ((s2 - s1)*(y3 - y1) - (s3 - s1)*(y2 - y1)) / det, 0.0)
+    gy = np.where(det != 0, ((x2 - x1)*(s3 - s1) - (x3 - x1)*(s2 - s1)) / det, 0.0)
+
+  # (NPOIN, NELEM) averaging matrix
+  area = np.repeat(np.abs(det), 3)
+  avg = sparse.csr_matrix((area, (ikle.ravel(), np.repeat(np.arange(len(ikle)), 3))),
+    shape=(len(x), len(ikle)))
+  total = np.asarray(avg.sum(axis=1)).ravel()
+  total[total == 0] = 1.0
+  avg = sparse.diags(1.0 / total).dot(avg)
+
+  shape = gx.shape[:-1]
+  gx = avg.dot(gx.reshape(-1, len(ikle)).T).T.reshape(shape + (len(x),))
+  gy = avg.dot(gy.reshape(-1, len(ikle)).T).T.reshape(shape + (len(x),))
+  return np.sqrt(gx*gx + gy*gy)
+
+# derived variables: name, variables needed and function computing them;
+# the function is called with the arrays of the variables needed, followed
+# by the mesh (x, y, zero based ikle; None if not given) and the parameters
+DERIVED = {
+  'SCALAR VELOCITY'    : (['VELOCITY U', 'VELOCITY V'], scalarVelocity),
+  'FREE SURFACE'       : (['WATER DEPTH', 'BOTTOM'], freeSurface),
+  'FROUDE NUMBER'      : (['SCALAR VELOCITY', 'WATER DEPTH'], froudeNumber),
+  'UNIT DISCHARGE'     : (['SCALAR VELOCITY', 'WATER DEPTH'], unitDischarge),
+  'BED SHEAR STRESS'   : (['SCALAR VELOCITY', 'WATER DEPTH'], bedShearStress),
+  'FREE SURFACE SLOPE' : (['FREE SURFACE'], freeSurfaceSlope)}
+
+# derived variables that need the mesh (and all the nodes)
+MESH_VARIABLES = ['FREE SURFACE SLOPE']
+
+def resolveVariables(vnames, names):
+  # vnames are the variable names of the *.slf file and names the requested
+  # ones. Returns the variables of the file needed to compute all of them,
+  # each once and in file order, and whether the mesh is needed
+  available = [v.strip() for v in vnames]
+  raw = []
+  mesh = [False]
+
+  def visit(name):
+    if name in available:
+      if name not in raw:
+        raw.append(name)
+    elif name in DERIVED:
+      if name in MESH_VARIABLES:
+        mesh[0] = True
+      for dep in DERIVED[name][0]:
+        visit(dep)
+    else:
+      raise ValueError('Variable ' + name + ' is not in the file and can ' +
+        'not be derived from its variables; derived variables are ' +
+        str(sorted(DERIVED.keys())))
+
+  for name in names:
+    visit(name.strip())
+
+  return sorted(raw, key=available.index), mesh[0]
+
+def computeVariables(raw, names, mesh=None, params=None):
+  # raw is a dictionary with the arrays of the variables given by
+  # resolveVariables() (nodes in the last axis), mesh the tuple (x, y, zero
+  # based ikle) and params a dictionary replacing some of the PARAMETERS.
+  # Returns an array (len(names), ...) with the requested variables; each
+  # derived variable is computed once even if several others need it
+  p = dict(PARAMETERS)
+  if params is not None:
+    p.update(params)
+
+  fields = dict(raw)
+
+  def get(name):
+    if name not in fields:
+      deps, func = DERIVED[name]
+      if (name in MESH_VARIABLES and mesh is None):
+        raise ValueError(name + ' needs the mesh')
+      fields[name] = func(*[get(d) for d in deps], mesh=mesh, params=p)
+    return fields[name]
+
+  return np.stack([np.asarray(get(name.strip()), dtype=np.float64)
+    for name in names])
+
+def extractDerived(slf, t, names, params=None):
+  # reads the variables needed for names at frame t of slf (a ppSELAFIN or
+  # ppSELAFINPartitioned object on which readHeader() was called), each
+  # record once, and
+  # returns the (len(names), NPOIN) array of the requested variables
+  raw, needMesh = resolveVariables(slf.getVarNames(), names)
+  values = slf.extractVariables(t, raw)
+  mesh = None
+  if needMesh:
+    mesh = (slf.getMeshX(), slf.getMeshY(), slf.getIKLE() - 1)
+  return computeVariables(dict(zip(raw, values)), names, mesh, params)
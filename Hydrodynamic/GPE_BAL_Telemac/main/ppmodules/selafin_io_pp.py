@@ -33,13 +33,61 @@
 # Revised: Nov 24, 2019
 # Made the change recommended by Qilong Bi to work in writing 3d files.
 #
+# Revised: Oct 18, 2026
+# readHeader() now decodes IKLE, IPOBO, x and y with a single bulk read per
+# record (new readRecord() method) instead of one unpack per value. Record
+# markers are checked so that truncated or corrupt headers raise an IOError.
+#
+# Revised: Oct 18, 2026
+# Added readMemmap() which memory maps the file and exposes all results as a
+# zero-copy (time, variable, node) view through getMemmapValues().
+#
+# Revised: Oct 18, 2026
+# readHeader() computes a frame offset index from the file size (new method
+# indexFrames()), so readTimes() and readVariables() seek straight to the
+# frame instead of walking the file. Added readVariablesByName() that only
+# decodes the requested variables of a frame.
+#
+# Revised: Oct 18, 2026
+# Added readVariablesAtNodes() which extracts the history of many nodes (and
+# optionally only some variables) in a single pass over the file.
+#
+# Revised: Oct 18, 2026
+# writeHeader() and writeVariables() serialize each record in bulk (new
+# method writeRecord()). Added openAppend() to add frames to an existing
+# file and setVarSubset() to write only some of the variables. The time
+# record marker now matches the float size for double precision files.
+#
+# Revised: Oct 18, 2026
+# readHeader() takes an optional cache_dir. Files sharing a mesh then store
+# its geometry once, keyed by a hash of the geometry records, and later
+# opens memory map it from the cache instead of decoding it (new methods
+# readGeometry() and readGeometryCached()).
+#
+# Revised: Oct 18, 2026
+# Results are read with positional reads (new methods readRecordAt() and
+# readBytesAt(), based on os.pread) instead of seeking the shared file
+# object. Added extractVariables() and extractVariablesAtNodes(), which
+# return their results instead of keeping them in the object, so several
+# threads can extract from the same file at the same time.
+#
+# Revised: Oct 18, 2026
+# readVariablesAtNodes() takes an optional window of frames (first, last).
+# If the file was memory mapped with readMemmap(), only the values of the
+# requested nodes are gathered, instead of decoding whole records.
+#
 # Uses: Python 2 or 3, Numpy
 #
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Global Imports
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 from struct import unpack,pack
+import hashlib
+import os
+import shutil
 import sys
+import tempfile
+import threading
 import numpy as np
 #
 class ppSELAFIN:
@@ -72,6 +120,12 @@ class ppSELAFIN:
     # variables and units
     self.vars = []
     
+    # index of the variables to write when only a subset is kept
+    self.subset = None
+    
+    # only used by readBytesAt() where os.pread is not available
+    self.lock = threading.Lock()
+    
     self.vnames = []
     self.vunits = []
     
@@ -99,10 +153,30 @@ class ppSELAFIN:
     # for each variable in the file
     self.temp = np.zeros((self.NBV1,self.NPOIN))
     
+    # same as temp, but only for the variables asked in readVariablesByName()
+    self.tempSelected = np.zeros((0,self.NPOIN))
+    
     self.tempAtNode = np.zeros((0,0))
     
+    # (time, variable, node) results of readVariablesAtNodes()
+    self.tempAtNodes = np.zeros((0,0,0))
+    
+    # name of the geometry cache entry; only set by readGeometryCached()
+    self.geometry_key = None
+    
+    # byte offset of the results, and of each frame; set by readHeader()
+    self.data_start = 0
+    self.frameOffsets = np.zeros(0, dtype=np.int64)
+    
+    # memory map of the whole file, and the (time, variable, node) view of
+    # the results on top of it; only set by readMemmap()
+    self.mmap = None
+    self.mmapValues = np.zeros((0,self.NBV1,self.NPOIN))
+    
   # methods start here
-  def readHeader(self):
+  def readHeader(self, cache_dir=None):
+    # if cache_dir is given, the mesh geometry is taken from (or stored in)
+    # the geometry cache in that folder, see readGeometryCached()
     self.f = open(self.slf_file, 'rb')
     garbage = unpack('>i', self.f.read(4))[0]
       
@@ -176,42 +250,160 @@ class ppSELAFIN:
     dummy = unpack('>i', self.f.read(4))[0]
     garbage = unpack('>i', self.f.read(4))[0]
     
-    self.IKLE = np.zeros((self.NELEM, self.NDP), dtype=np.int32)
+    if cache_dir is None:
+      self.readGeometry()
+    else:
+      self.readGeometryCached(cache_dir)
     
-    garbage = unpack('>i', self.f.read(4))[0]
-    for i in range(self.NELEM):
-      for j in range(self.NDP):
-        self.IKLE[i,j] = unpack('>l', self.f.read(4))[0]
-    garbage = unpack('>i', self.f.read(4))[0]    
+    # the results start right after the header
+    self.data_start = self.f.tell()
+    self.indexFrames()
     
-    self.IPOBO = np.zeros(self.NPOIN, dtype=np.int32)
+  def readGeometry(self):
+    # connectivity and boundary records are read in one go each
+    self.IKLE = self.readRecord(self.endian + 'i4', self.NELEM * self.NDP)
+    self.IKLE = self.IKLE.reshape(self.NELEM, self.NDP).astype(np.int32)
     
-    garbage = unpack('>i', self.f.read(4))[0]
-    for i in range(self.NPOIN):
-      self.IPOBO[i] = unpack('>l', self.f.read(4))[0]
-    garbage = unpack('>i', self.f.read(4))[0]
+    self.IPOBO = self.readRecord(self.endian + 'i4', self.NPOIN).astype(np.int32)
       
-    # reads x
-    self.x = np.zeros(self.NPOIN)
-    garbage = unpack('>i', self.f.read(4))[0]
-    
     # this is where we decide if it is single of double precision
     # I got this from HRW's getFloatTypeFromFloat method
     # I would have never gotten this on my own!!!
+    garbage = unpack('>i', self.f.read(4))[0]
     if (garbage != self.float_size * self.NPOIN):
       self.float_type = 'd'
       self.float_size = 8  
-    
-    for i in range(self.NPOIN):
-      self.x[i] = unpack('>' + self.float_type, self.f.read(self.float_size))[0]
+    self.f.seek(-4, 1)
+    
+    # reads x and y
+    self.x = self.readRecord(self.endian + self.float_type,
+      self.NPOIN).astype(np.float64)
+    self.y = self.readRecord(self.endian + self.float_type,
+      self.NPOIN).astype(np.float64)
+    
+  def readGeometryCached(self, cache_dir):
+    # the geometry (IKLE, IPOBO, x and y) of files sharing the same mesh is
+    # stored once in cache_dir, in a folder named after the hash of the raw
+    # geometry records. Once the cache is warm the records are only hashed,
+    # never decoded, and the arrays are memory mapped from the cache, so
+    # every reader of the same mesh shares the same pages
+    geometry_start = self.f.tell()
+    ikle_size = 4 + 4*self.NELEM*self.NDP + 4
+    ipobo_size = 4 + 4*self.NPOIN + 4
+    
+    # single or double precision, same test as in readGeometry()
+    self.f.seek(geometry_start + ikle_size + ipobo_size)
     garbage = unpack('>i', self.f.read(4))[0]
+    if (garbage != self.float_size * self.NPOIN):
+      self.float_type = 'd'
+      self.float_size = 8
     
-    # reads y 
-    self.y = np.zeros(self.NPOIN)
-    garbage = unpack('>i', self.f.read(4))[0]
-    for i in range(self.NPOIN):
-      self.y[i] = unpack('>' + self.float_type, self.f.read(self.float_size))[0]
-    garbage = unpack('>i', self.f.read(4))[0]
+    geometry_size = ikle_size + ipobo_size + 2*(4 + self.float_size*self.NPOIN + 4)
+    self.f.seek(geometry_start)
+    key = hashlib.sha1(self.f.read(geometry_size)).hexdigest()
+    path = os.path.join(cache_dir, key)
+    self.geometry_key = key
+    
+    if not os.path.isdir(path):
+      self.f.seek(geometry_start)
+      self.readGeometry()
+      
+      # written to a temporary folder first, and then renamed, so that
+      # other processes never see a half written cache entry
+      if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+      tmp = tempfile.mkdtemp(dir=cache_dir)
+      np.save(os.path.join(tmp, 'IKLE.npy'), self.IKLE)
+      np.save(os.path.join(tmp, 'IPOBO.npy'), self.IPOBO)
+      np.save(os.path.join(tmp, 'x.npy'), self.x)
+      np.save(os.path.join(tmp, 'y.npy'), self.y)
+      try:
+        os.rename(tmp, path)
+      except OSError:
+        # another process filled the same entry in the meantime
+        shutil.rmtree(tmp)
+    
+    self.IKLE = np.load(os.path.join(path, 'IKLE.npy'), mmap_mode='r')
+    self.IPOBO = np.load(os.path.join(path, 'IPOBO.npy'), mmap_mode='r')
+    self.x = np.load(os.path.join(path, 'x.npy'), mmap_mode='r')
+    self.y = np.load(os.path.join(path, 'y.npy'), mmap_mode='r')
+    
+    self.f.seek(geometry_start + geometry_size)
+    
+  def indexFrames(self):
+    # computes the byte offset of every frame from the file size and the
+    # header layout, so that frames can be reached with a single seek
+    
+    # size in bytes of the time record, of one variable record, and of a
+    # whole frame; each record is wrapped by two 4 byte markers
+    self.time_size = 4 + self.float_size + 4
+    self.var_size = 4 + self.float_size * self.NPOIN + 4
+    self.frame_size = self.time_size + self.NBV1 * self.var_size
+    
+    data_size = os.fstat(self.f.fileno()).st_size - self.data_start
+    numTimes = data_size // self.frame_size
+    
+    # an incomplete last frame (i.e., from a crashed run) is ignored
+    if (data_size % self.frame_size != 0):
+      print('Warning: ' + self.slf_file + ' ends with an incomplete frame ' +
+        'after ' + str(numTimes) + ' complete frames; it will be ignored')
+    
+    self.frameOffsets = self.data_start + \
+      np.arange(numTimes, dtype=np.int64) * self.frame_size
+    
+  def getVarIndex(self, names):
+    # returns the position in the file of each variable in names; the
+    # comparison ignores the padding spaces of the variable names
+    vnames = [v.strip() for v in self.vnames]
+    index = []
+    for name in names:
+      if (name.strip() not in vnames):
+        raise ValueError('Variable ' + name.strip() + ' not found in ' +
+          self.slf_file + '; available variables are ' + str(vnames))
+      index.append(vnames.index(name.strip()))
+    return index
+    
+  def readRecord(self, dtype, count):
+    # reads a single fortran record of count values of type dtype with one
+    # bulk read at the current position of the file
+    nbytes = np.dtype(dtype).itemsize * count
+    return self.decodeRecord(self.f.read(4 + nbytes + 4), dtype, count)
+    
+  def readRecordAt(self, offset, dtype, count):
+    # same as readRecord(), but for the record starting at byte offset; it
+    # does not use nor move the position of the file, so it can be called
+    # from several threads at the same time
+    nbytes = np.dtype(dtype).itemsize * count
+    return self.decodeRecord(self.readBytesAt(offset, 4 + nbytes + 4), dtype,
+      count)
+    
+  def readBytesAt(self, offset, nbytes):
+    # positional read of nbytes at byte offset, without a shared cursor
+    if hasattr(os, 'pread'):
+      return os.pread(self.f.fileno(), nbytes, int(offset))
+    
+    # no pread (i.e., on windows); the seek and the read must happen together
+    with self.lock:
+      pos = self.f.tell()
+      self.f.seek(offset)
+      buf = self.f.read(nbytes)
+      self.f.seek(pos)
+    return buf
+    
+  def decodeRecord(self, raw, dtype, count):
+    # checks that both record markers match the payload size, and returns
+    # the payload as an array
+    nbytes = np.dtype(dtype).itemsize * count
+    
+    if (len(raw) != 4 + nbytes + 4):
+      raise IOError('Unexpected end of file in ' + self.slf_file)
+    head = unpack('>i', raw[:4])[0]
+    tail = unpack('>i', raw[-4:])[0]
+    if (head != nbytes or tail != nbytes):
+      raise IOError('Record markers ' + str(head) + '/' + str(tail) + 
+        ' do not match record size ' + str(nbytes) + ' in ' + self.slf_file)
+    
+    return np.frombuffer(raw, dtype=dtype, count=count, offset=4)
     
   def writeHeader(self):
     self.f = open(self.slf_file, 'wb')
@@ -265,28 +457,21 @@ class ppSELAFIN:
     self.f.write(pack('>i', 1)) # NPLAN???
     self.f.write(pack('>i', 16))
     
-    self.f.write(pack('>i', 4*self.NELEM*self.NDP))
-    for i in range(self.NELEM):
-      for j in range(self.NDP):
-        self.f.write(pack('>i', self.IKLE[i,j]))
-    self.f.write(pack('>i', 4*self.NELEM*self.NDP))
-    
-    self.f.write(pack('>i', 4*self.NPOIN))
-    for i in range(len(self.IPOBO)):
-      self.f.write(pack('>i', self.IPOBO[i]))
-    self.f.write(pack('>i', 4*self.NPOIN))
+    # connectivity, boundary and coordinate records are written in one go each
+    self.writeRecord(self.IKLE, self.endian + 'i4')
+    self.writeRecord(self.IPOBO, self.endian + 'i4')
     
     # this is the garbage record that determines the float size
     # I have no idea why this works, but it does!!!
-    self.f.write(pack('>i', self.float_size*self.NPOIN))
-    for i in range(len(self.x)):
-      self.f.write(pack('>'+self.float_type, self.x[i]))
-    self.f.write(pack('>i', self.float_size*self.NPOIN))
-
-    self.f.write(pack('>i', self.float_size*self.NPOIN))
-    for i in range(len(self.y)):
-      self.f.write(pack('>'+self.float_type, self.y[i]))
-    self.f.write(pack('>i', self.float_size*self.NPOIN))
+    self.writeRecord(self.x, self.endian + self.float_type)
+    self.writeRecord(self.y, self.endian + self.float_type)
+    
+  def writeRecord(self, values, dtype):
+    # writes values as a single fortran record, converted to dtype in bulk
+    buf = np.ascontiguousarray(values, dtype=dtype).tobytes()
+    self.f.write(pack('>i', len(buf)))
+    self.f.write(buf)
+    self.f.write(pack('>i', len(buf)))
     
   def writeVariables(self,time,temp):
     # appends object's time 
@@ -295,76 +480,91 @@ class ppSELAFIN:
     # keeps only the current 2d array in object's memory
     self.temp = temp
     
+    # only the variables chosen with setVarSubset() are written
+    if self.subset is not None:
+      temp = np.asarray(temp)[self.subset]
+    
     # write the time 
-    self.f.write(pack('>i', 4))
+    self.f.write(pack('>i', self.float_size))
     self.f.write(pack('>'+self.float_type, time))
-    self.f.write(pack('>i', 4))
+    self.f.write(pack('>i', self.float_size))
     
     # writes the rest of the variables
     for j in range(self.NBV1):
-      self.f.write(pack('>i', self.float_size*self.NPOIN))
-      for k in range(self.NPOIN):
-        self.f.write(pack('>'+self.float_type, self.temp[j,k]))
-      self.f.write(pack('>i', self.float_size*self.NPOIN))
+      self.writeRecord(temp[j], self.endian + self.float_type)
     
-  def readTimes(self):
-    pos_prior_to_time_reading = self.f.tell()
+  def openAppend(self):
+    # opens an existing *.slf file so that writeVariables() adds frames at
+    # its end; an incomplete last frame (i.e., from a crashed run) is dropped
+    self.readHeader()
+    self.readTimes()
+    self.f.close()
     
-    while True:
-      try:
-        # get the times
-        self.f.seek(4,1)
-        self.time.append( unpack('>'+self.float_type, self.f.read(self.float_size))[0] )
-        self.f.seek(4,1)
-        
-        # skip through the variables
-        self.f.seek(self.NBV1*(4+self.float_size*self.NPOIN+4), 1)
-        
-        # skip the variables
-        # 4 at begining and end are garbage
-        # 4*NPOIN assumes each times step there are NPOIN nodes of 
-        # size 4 bytes (i.e., single precision)
-        # f.seek(NBV1*(4+4*NPOIN+4), 1)
-      except:
-        break
-    self.f.seek(pos_prior_to_time_reading)
+    end = self.data_start + len(self.frameOffsets) * self.frame_size
+    self.f = open(self.slf_file, 'r+b')
+    self.f.truncate(end)
+    self.f.seek(end)
     
-  def readVariables(self,t_des):
-    # print('Desired time: ' + str(t_des) + '\n')
-    pos_prior_to_var_reading = self.f.tell()
+  def readTimes(self):
+    # jumps straight to the time record of each frame in the index
+    self.time = []
+    for offset in self.frameOffsets:
+      buf = self.readBytesAt(offset + 4, self.float_size)
+      self.time.append( unpack('>'+self.float_type, buf)[0] )
     
+  def readVariables(self,t_des):
     # reads data for all variables in the *.slf file at desired time t_des
     self.temp = np.zeros((self.NBV1,self.NPOIN))
     
-    # it reads the time again, but this it is not used
-    time2 = []
-    
-    # time index
-    t = -1
+    # nothing is read if t_des is not in the file
+    if (t_des < 0 or t_des >= len(self.frameOffsets)):
+      return
+    
+    self.readVariablesByName(t_des, self.vnames)
+    self.temp = self.tempSelected
+    
+  def readVariablesByName(self,t_des,names):
+    # reads only the variables listed in names (i.e., ['WATER DEPTH']) at
+    # time index t_des; all the other records of the frame are skipped
+    self.tempSelected = self.extractVariables(t_des, names)
+    
+  def extractVariables(self,t_des,names):
+    # same as readVariablesByName(), but the results are returned instead of
+    # kept in the object. It only uses positional reads and the header, so
+    # many threads can extract from the same object at the same time
+    if (t_des < 0 or t_des >= len(self.frameOffsets)):
+      raise IndexError('Time index ' + str(t_des) + ' out of range; ' +
+        self.slf_file + ' has ' + str(len(self.frameOffsets)) + ' frames')
+    
+    index = self.getVarIndex(names)
+    values = np.zeros((len(index),self.NPOIN))
+    
+    for i, j in enumerate(index):
+      values[i,:] = self.readRecordAt(self.frameOffsets[t_des] + 
+        self.time_size + j*self.var_size, self.endian + self.float_type,
+        self.NPOIN)
+    
+    return values
+    
+  def readMemmap(self):
+    # maps the *.slf file into memory and builds a (time, variable, node)
+    # view of all results without reading any of them; must be called after
+    # readHeader(). Only the pages actually indexed are ever read from disk.
+    # For 3d files the node axis holds all NPOIN nodes (NPOIN2 * NPLAN),
+    # plane by plane, as they are stored in the file.
+    self.mmap = np.memmap(self.slf_file, dtype=np.uint8, mode='r')
+    numTimes = len(self.frameOffsets)
+    
+    # the strides jump over the record markers, so no data is copied
+    dtype = np.dtype(self.endian + self.float_type)
+    self.mmapValues = np.ndarray(shape=(numTimes, self.NBV1, self.NPOIN),
+      dtype=dtype, buffer=self.mmap, offset=self.data_start + self.time_size + 4,
+      strides=(self.frame_size, self.var_size, self.float_size))
+    
+    times = np.ndarray(shape=(numTimes,), dtype=dtype, buffer=self.mmap,
+      offset=self.data_start + 4, strides=(self.frame_size,))
+    self.time = times.tolist()
     
-    while True:
-      try:
-        self.f.seek(4,1)
-        time2.append( unpack('>'+self.float_type, self.f.read(self.float_size))[0] )
-        self.f.seek(4,1)
-        
-        t = t + 1
-        
-        if (t == t_des):
-          # print('slf time: ' + str(t))
-          for i in range(self.NBV1):
-            self.f.seek(4,1)
-            for j in range(self.NPOIN):
-              self.temp[i,j] = unpack('>'+self.float_type, self.f.read(self.float_size))[0]
-            self.f.seek(4,1)
-        else:
-          self.f.seek(self.NBV1*(4+self.float_size*self.NPOIN+4), 1)
-      except:
-        break
-        
-    # need to re-set in case another variable needs to be read!
-    self.f.seek(pos_prior_to_var_reading)    
-
   def readVariablesAtNode(self,node):
     
     # node is the desired node from which to extract results for
@@ -404,6 +604,52 @@ class ppSELAFIN:
     # need to re-set in case another variable needs to be read!
     self.f.seek(pos_prior_to_var_reading)  
     
+  def readVariablesAtNodes(self,nodes,names=None,first=0,last=None):
+    # extracts the history of many nodes in one sequential pass over the
+    # file; nodes are zero based node indices, and names an optional list of
+    # variable names (all variables by default). Only frames first to last
+    # (inclusive) are read, all of them by default. The results are stored
+    # in a (time, variable, node) array, see getVarValuesAtNodes()
+    self.tempAtNodes = self.extractVariablesAtNodes(nodes, names, first, last)
+    
+  def extractVariablesAtNodes(self,nodes,names=None,first=0,last=None):
+    # same as readVariablesAtNodes(), but the results are returned instead of
+    # kept in the object; safe to call from many threads at the same time
+    nodes = np.asarray(nodes, dtype=np.int64).ravel()
+    if (len(nodes) > 0 and (nodes.min() < 0 or nodes.max() >= self.NPOIN)):
+      raise IndexError('Node indices must be between 0 and ' + 
+        str(self.NPOIN - 1))
+    
+    if names is None:
+      index = list(range(self.NBV1))
+    else:
+      index = self.getVarIndex(names)
+    
+    numTimes = len(self.frameOffsets)
+    if last is None:
+      last = numTimes - 1
+    if (first < 0 or last >= numTimes or first > last):
+      raise IndexError('Frames ' + str(first) + ' to ' + str(last) +
+        ' out of range; ' + self.slf_file + ' has ' + str(numTimes) + ' frames')
+    
+    # with the file memory mapped, only the pages holding the requested
+    # nodes are touched
+    if self.mmap is not None:
+      frames = np.arange(first, last+1)
+      return self.mmapValues[np.ix_(frames, index, nodes)].astype(np.float64)
+    
+    values = np.zeros((last - first + 1, len(index), len(nodes)))
+    
+    # each variable record is read in bulk, and the requested nodes are
+    # gathered from it; records are visited in file order
+    for t in range(first, last+1):
+      for i, j in enumerate(index):
+        record = self.readRecordAt(self.frameOffsets[t] + self.time_size + 
+          j*self.var_size, self.endian + self.float_type, self.NPOIN)
+        values[t-first,i,:] = record[nodes]
+    
+    return values
+    
   # get methods start here
   def getPrecision(self):
     return self.float_type,self.float_size
@@ -438,8 +684,17 @@ class ppSELAFIN:
   def getVarValues(self):
     return self.temp
     
+  def getSelectedVarValues(self):
+    return self.tempSelected
+    
   def getVarValuesAtNode(self):
     return self.tempAtNode
+    
+  def getVarValuesAtNodes(self):
+    return self.tempAtNodes
+    
+  def getMemmapValues(self):
+    return self.mmapValues
 
   def getIPOBO(self):
     return self.IPOBO
@@ -475,6 +730,15 @@ class ppSELAFIN:
   def setVarUnits(self, vunits):
     self.vunits = vunits
     
+  def setVarSubset(self, names):
+    # keeps only the variables in names for writing; must be called after
+    # setVarNames and setVarUnits, and before writeHeader. writeVariables()
+    # still takes the results of all the original variables
+    self.subset = self.getVarIndex(names)
+    self.vnames = [self.vnames[i] for i in self.subset]
+    self.vunits = [self.vunits[i] for i in self.subset]
+    self.NBV1 = len(self.subset)
+    
   def setIPARAM(self, IPARAM):
     self.IPARAM = IPARAM
     
@@ -489,3 +753,7 @@ class ppSELAFIN:
     
   def close(self):
     self.f.close()
+    
+    # views into the map are no longer valid once the file is closed
+    self.mmapValues = np.zeros((0,self.NBV1,self.NPOIN))
+    self.mmap = None
@@ -0,0 +1,290 @@
+#
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#                                                                       #
+#                                 selafin_partitioned.py                #
+#                                                                       #
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#
+# Date: Oct 18, 2026
+#
+# Purpose: Class that reads the partitioned result files written by each
+# processor of a parallel TELEMAC run (i.e., T2DRES00003-00000 ... 00003-00002
+# for --ncsize=4) as if they were the merged *.slf file, so that the serial
+# recombination step can be skipped or deferred. Every partition is a normal
+# SELAFIN file read with ppSELAFIN; TELEMAC stores the local to global node
+# numbering (KNOLG, one based) of each partition in place of IPOBO, and that
+# is used as the partition map unless another map is given. Partitions are
+# read in parallel by a pool of threads.
+#
+# The class has the global node API of ppSELAFIN used by the rest of the
+# code (selafin_stats, selafin_derived, auxiliary_functions_telemac): the
+# header and mesh getters, getVarIndex(), frameOffsets (whose length is the
+# number of frames), readTimes(), readVariables*(), extractVariables*() and
+# readMemmap(). The byte level methods (readRecordAt(), readBytesAt(),
+# getMemmapValues()) are not available, as their offsets are only valid
+# inside one partition. The partitions hold no global boundary numbering,
+# so getIPOBO() numbers the boundary nodes along the boundary rings of the
+# global mesh (see mesh_boundary.py). openResults() opens either a single
+# *.slf file or the list of partitions of a parallel run.
+#
+# Uses: Python 3, Numpy
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global Imports
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import numpy as np
+from ppmodules.selafin_io_pp import ppSELAFIN
+from ppmodules.mesh_boundary import boundaryRings
+#
+def openResults(slf_file, cache_dir=None):
+  # opens a result file and reads its header; slf_file is the path of a
+  # *.slf file, or a list (or tuple) with the partition files of a parallel
+  # run, which are then read without merging them
+  if isinstance(slf_file, (list, tuple)):
+    slf = ppSELAFINPartitioned(slf_file)
+  else:
+    slf = ppSELAFIN(slf_file)
+  slf.readHeader(cache_dir=cache_dir)
+  return slf
+#
+class ppSELAFINPartitioned:
+
+  # object's properties
+  def __init__(self, slf_files, knolg=None, max_workers=None):
+
+    # one ppSELAFIN object per partition file
+    self.slf_files = list(slf_files)
+    self.parts = [ppSELAFIN(f) for f in self.slf_files]
+
+    # used in the messages of the functions that take ppSELAFIN objects
+    self.slf_file = ', '.join(self.slf_files)
+
+    # optional partition map; a list with one array per partition holding
+    # the one based global node number of each local node
+    self.knolg = knolg
+
+    # number of threads reading the partitions; one per partition by default
+    if max_workers is None:
+      max_workers = len(self.parts)
+    self.max_workers = max_workers
+
+    self.vnames = []
+    self.vunits = []
+    self.NBV1 = 0
+    self.NPLAN = 0
+    self.NELEM = 0
+    self.NPOIN = 0
+    self.NDP = 0
+    self.IKLE = np.zeros((0,0), dtype=np.int32)
+    self.IPOBO = None
+    self.x = np.zeros(0)
+    self.y = np.zeros(0)
+    self.time = []
+
+    # offsets of the frames of the first partition; only their number is
+    # meaningful for the global file
+    self.frameOffsets = np.zeros(0, dtype=np.int64)
+
+    # hash of the global mesh; only set by readHeader() with a cache_dir
+    self.geometry_key = None
+    self.mmap = None
+
+    # global results, same layout as the ones of ppSELAFIN
+    self.temp = np.zeros((0,0))
+    self.tempSelected = np.zeros((0,0))
+    self.tempAtNodes = np.zeros((0,0,0))
+
+  # methods start here
+  def map(self, func):
+    # calls func(i, part) for every partition on the thread pool, and returns
+    # the results in partition order
+    with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+      return list(pool.map(func, range(len(self.parts)), self.parts))
+
+  def readHeader(self, cache_dir=None):
+    # with a cache_dir, a folder named after the hash of the global mesh is
+    # made there, so that what is cached per mesh (i.e., the location of the
+    # calibration points) is shared by all the runs on the same partitions
+    self.map(lambda i, part: part.readHeader())
+
+    first = self.parts[0]
+    for part in self.parts[1:]:
+      if (part.getVarNames() != first.getVarNames() or
+          len(part.frameOffsets) != len(first.frameOffsets)):
+        raise IOError('Partition ' + part.slf_file + ' does not have the ' +
+          'same variables and frames as ' + first.slf_file)
+
+    self.vnames = first.getVarNames()
+    self.vunits = first.getVarUnits()
+    self.NBV1 = first.NBV1
+    self.NPLAN = first.getNPLAN()
+    self.NDP = first.NDP
+
+    if self.knolg is None:
+      self.knolg = [part.getIPOBO() for part in self.parts]
+    # zero based global node of each local node
+    self.local2global = [np.asarray(k, dtype=np.int64) - 1 for k in self.knolg]
+
+    self.NPOIN = int(max(k.max() for k in self.local2global)) + 1
+
+    # nodes on the interfaces are in more than one partition, with the same
+    # values, so scattering all the partitions gives the global arrays
+    self.x = self.gather(lambda part: part.getMeshX())
+    self.y = self.gather(lambda part: part.getMeshY())
+
+    # every element belongs to only one partition
+    self.IKLE = np.vstack([(l2g[part.getIKLE() - 1] + 1).astype(np.int32)
+      for part, l2g in zip(self.parts, self.local2global)])
+    self.NELEM = self.IKLE.shape[0]
+    self.frameOffsets = first.frameOffsets
+
+    if cache_dir is not None:
+      sha = hashlib.sha1(self.IKLE.tobytes())
+      sha.update(self.x.tobytes())
+      sha.update(self.y.tobytes())
+      self.geometry_key = 'partitioned_' + sha.hexdigest()
+      path = os.path.join(cache_dir, self.geometry_key)
+      if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+
+  def getVarIndex(self, names):
+    return self.parts[0].getVarIndex(names)
+
+  def gather(self, func, shape=()):
+    # scatters func(part) of every partition (arrays whose last axis are the
+    # local nodes) into a global array whose last axis are the global nodes
+    out = np.zeros(shape + (self.NPOIN,))
+    for part, l2g in zip(self.parts, self.local2global):
+      out[..., l2g] = func(part)
+    return out
+
+  def readTimes(self):
+    self.parts[0].readTimes()
+    self.time = self.parts[0].getTimes()
+
+  def readVariables(self,t_des):
+    self.map(lambda i, part: part.readVariables(t_des))
+    self.temp = self.gather(lambda part: part.getVarValues(), (self.NBV1,))
+
+  def readVariablesByName(self,t_des,names):
+    self.tempSelected = self.extractVariables(t_des, names)
+
+  def extractVariables(self,t_des,names):
+    # same as ppSELAFIN.extractVariables(); the partitions are read on the
+    # thread pool and scattered into the global nodes
+    values = self.map(lambda i, part: part.extractVariables(t_des, names))
+    out = np.zeros((len(names), self.NPOIN))
+    for v, l2g in zip(values, self.local2global):
+      out[:, l2g] = v
+    return out
+
+  def readMemmap(self):
+    # memory maps every partition, so that extractVariablesAtNodes() only
+    # reads the pages of the requested nodes
+    self.map(lambda i, part: part.readMemmap())
+    self.mmap = True
+    self.time = self.parts[0].getTimes()
+
+  def readVariablesAtNodes(self,nodes,names=None,first=0,last=None):
+    self.tempAtNodes = self.extractVariablesAtNodes(nodes, names, first, last)
+
+  def extractVariablesAtNodes(self,nodes,names=None,first=0,last=None):
+    # nodes are zero based global node indices, and first, last the window of
+    # frames to read (all of them by default)
+    nodes = np.asarray(nodes, dtype=np.int64).ravel()
+    if (len(nodes) > 0 and (nodes.min() < 0 or nodes.max() >= self.NPOIN)):
+      raise IndexError('Node indices must be between 0 and ' +
+        str(self.NPOIN - 1))
+
+    # for every partition, which of the requested nodes it holds, and where
+    owner = []
+    for l2g in self.local2global:
+      glob2loc = np.full(self.NPOIN, -1, dtype=np.int64)
+      glob2loc[l2g] = np.arange(len(l2g))
+      local = glob2loc[nodes]
+      owner.append((np.where(local >= 0)[0], local[local >= 0]))
+
+    missing = np.ones(len(nodes), dtype=bool)
+    for found, local in owner:
+      missing[found] = False
+    if missing.any():
+      raise IndexError('Nodes ' + str(nodes[missing]) + ' are not in any ' +
+        'partition')
+
+    def read(i, part):
+      found, local = owner[i]
+      if (len(local) > 0):
+        return part.extractVariablesAtNodes(local, names, first, last)
+      return None
+    values = self.map(read)
+
+    if last is None:
+      last = len(self.frameOffsets) - 1
+    numTimes = last - first + 1
+    numVars = self.NBV1 if names is None else len(names)
+    out = np.zeros((numTimes, numVars, len(nodes)))
+    for v, (found, local) in zip(values, owner):
+      if v is not None:
+        out[:,:,found] = v
+    return out
+
+  # get methods start here, same as for ppSELAFIN
+  def getPrecision(self):
+    return self.parts[0].getPrecision()
+
+  def getIPOBO(self):
+    # boundary nodes numbered from 1 along each boundary ring, the outer
+    # boundary first; 0 for the interior nodes
+    if self.IPOBO is None:
+      rings, areas = boundaryRings(self.x, self.y, self.IKLE - 1)
+      self.IPOBO = np.zeros(self.NPOIN, dtype=np.int32)
+      boundary = np.concatenate(rings)
+      self.IPOBO[boundary] = np.arange(1, len(boundary) + 1)
+    return self.IPOBO
+
+  def getDATE(self):
+    return self.parts[0].getDATE()
+
+  def getNPOIN(self):
+    return self.NPOIN
+
+  def getNELEM(self):
+    return self.NELEM
+
+  def getTimes(self):
+    return self.time
+
+  def getVarNames(self):
+    return self.vnames
+
+  def getVarUnits(self):
+    return self.vunits
+
+  def getNPLAN(self):
+    return self.NPLAN
+
+  def getIKLE(self):
+    return self.IKLE
+
+  def getMeshX(self):
+    return self.x
+
+  def getMeshY(self):
+    return self.y
+
+  def getVarValues(self):
+    return self.temp
+
+  def getSelectedVarValues(self):
+    return self.tempSelected
+
+  def getVarValuesAtNodes(self):
+    return self.tempAtNodes
+
+  def close(self):
+    for part in self.parts:
+      part.close()
+    self.mmap = None
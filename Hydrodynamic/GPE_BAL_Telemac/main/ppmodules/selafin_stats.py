@@ -0,0 +1,120 @@
+#
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#                                                                       #
+#                                 selafin_stats.py                      #
+#                                                                       #
+#+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!+!
+#
+# Date: Oct 18, 2026
+#
+# Purpose: Temporal statistics of the results of a *.slf file (i.e., the
+# maximum water depth, the time of the peak velocity or the time averaged
+# fields of an unsteady run). The frames are read once, in file order, one
+# variable record at a time, so the memory used is bounded by one record
+# plus one array per requested statistic, regardless of the number of frames.
+# The variables can also be derived ones (see selafin_derived), computed
+# frame by frame from the records of the variables they need.
+#
+# Uses: Python 2 or 3, Numpy
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global Imports
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import numpy as np
+from ppmodules.selafin_derived import resolveVariables, computeVariables
+#
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# statistics understood by reduceFrames()
+# min, max : minimum and maximum value over all frames
+# mean     : time weighted (trapezoidal) average; plain average if one frame
+# argmax   : index of the frame where the maximum happens
+# tmax     : time (in seconds) where the maximum happens
+# duration : time (in seconds) during which the value exceeds the threshold
+STATISTICS = ['min', 'max', 'mean', 'argmax', 'tmax', 'duration']
+
+def reduceFrames(slf, names, stats=('max',), threshold=0.0, first=0, last=None,
+  params=None):
+  # slf is a ppSELAFIN (or ppSELAFINPartitioned) object on which
+  # readHeader() was already called, names is a list of variable names,
+  # stats a list of STATISTICS and threshold the value used by duration (a
+  # number, or a dictionary with one number per variable name). Only frames
+  # first to last (inclusive) are used, and params are the parameters of the
+  # derived variables. Returns
+  # a dictionary such as result['WATER DEPTH']['max'], where each entry is
+  # an array of size NPOIN
+  for stat in stats:
+    if stat not in STATISTICS:
+      raise ValueError('Unknown statistic ' + str(stat) +
+        '; use one of ' + str(STATISTICS))
+
+  # variables of the file needed, each read once per frame
+  raw, needMesh = resolveVariables(slf.getVarNames(), names)
+  mesh = None
+  if needMesh:
+    mesh = (slf.getMeshX(), slf.getMeshY(), slf.getIKLE() - 1)
+
+  numTimes = len(slf.frameOffsets)
+  if last is None:
+    last = numTimes - 1
+  if (first < 0 or last >= numTimes or first > last):
+    raise IndexError('Frames ' + str(first) + ' to ' + str(last) +
+      ' out of range; ' + slf.slf_file + ' has ' + str(numTimes) + ' frames')
+
+  # times of every frame, needed by the time weighted statistics
+  slf.readTimes()
+  times = np.asarray(slf.getTimes(), dtype=np.float64)
+
+  # duration and trapezoidal mean weights of each frame; with a single
+  # frame, or frames that all have the same time (no time span to weight
+  # with), the mean is the plain average of the frames
+  dt = np.zeros(numTimes)
+  dt[first+1:last+1] = np.diff(times[first:last+1])
+  if (times[last] > times[first]):
+    weights = np.zeros(numTimes)
+    weights[first:last] += 0.5 * dt[first+1:last+1]
+    weights[first+1:last+1] += 0.5 * dt[first+1:last+1]
+    weights = weights / (times[last] - times[first])
+  else:
+    weights = np.full(numTimes, 1.0 / (last - first + 1))
+
+  # accumulators, one array per variable and statistic
+  result = {}
+  for name in names:
+    acc = {}
+    acc['min'] = np.full(slf.NPOIN, np.inf)
+    acc['max'] = np.full(slf.NPOIN, -np.inf)
+    acc['mean'] = np.zeros(slf.NPOIN)
+    acc['argmax'] = np.zeros(slf.NPOIN, dtype=np.int64)
+    acc['duration'] = np.zeros(slf.NPOIN)
+    result[name] = acc
+
+  for t in range(first, last+1):
+    records = dict(zip(raw, slf.extractVariables(t, raw)))
+    frame = computeVariables(records, names, mesh, params)
+
+    for name, values in zip(names, frame):
+      acc = result[name]
+
+      # the first frame always sets the peak, so argmax is never undefined
+      peak = values > acc['max']
+      acc['argmax'][peak] = t
+      np.maximum(acc['max'], values, out=acc['max'])
+      np.minimum(acc['min'], values, out=acc['min'])
+      acc['mean'] += weights[t] * values
+
+      if isinstance(threshold, dict):
+        limit = threshold[name]
+      else:
+        limit = threshold
+      acc['duration'][values > limit] += dt[t]
+
+  # keep only the statistics that were asked
+  for name in names:
+    acc = result[name]
+    acc['tmax'] = times[acc['argmax']]
+    result[name] = dict((stat, acc[stat]) for stat in stats)
+
+  return result
@@ -0,0 +1,52 @@
+'''
+Extracts again the calibration variables of all the archived Telemac simulations (i.e., after new calibration points or
+variables were defined), in parallel, and writes the training matrix of the surrogate model. Result files whose content
+and extraction are unchanged since the last run are skipped.
+
+Example:
+python reextract_calibration.py -p calibration_points.csv -v "SCALAR VELOCITY" "WATER DEPTH" -m mesh -w 8
+
+and the time series of the unsteady runs at the measurement times (first column of the measured time series):
+python reextract_calibration.py -p calibration_points.csv -t calibration_time_series.csv -w 8
+
+Contact: iamakash0123@gmail.com
+'''
+
+# Import libraries
+import argparse
+import os
+import numpy as np
+from auxiliary_functions_telemac import reextract_simulations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extracts again the calibration variables of the archived simulations")
+    parser.add_argument("-p", default="calibration_points.csv", help="calibration points (.csv, x and y columns)")
+    parser.add_argument("-v", nargs="+", default=["SCALAR VELOCITY", "WATER DEPTH"], help="variables to extract")
+    parser.add_argument("-s", default="../simulations", help="folder of the archived result files")
+    parser.add_argument("-r", default="../results", help="folder of the extracted files and parameter_file.txt")
+    parser.add_argument("-c", default="../mesh_cache/", help="folder caching the mesh geometry")
+    parser.add_argument("-n", default="res_tel_PC", help="name of the result files without the simulation number")
+    parser.add_argument("-o", default="", help="training matrix (.txt), model_results.txt in the results folder "
+                                               "by default")
+    parser.add_argument("-m", default="mesh", choices=["raster", "mesh"],
+                        help="sampling of the points, the point_sampling of main_GPE_BAL_telemac.py")
+    parser.add_argument("-t", default="", help="measured time series (.csv, times in the first column), to extract the "
+                                               "time series at these times instead of the last time step")
+    parser.add_argument("-w", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    # Calibration points and simulations, as in main_GPE_BAL_telemac.py
+    temp = np.loadtxt(args.p, skiprows=1, delimiter=",")
+    x = temp[:, 0].reshape(-1, 1)
+    y = temp[:, 1].reshape(-1, 1)
+    simulation_names = np.loadtxt(os.path.join(args.r, "parameter_file.txt"), dtype=str, delimiter=";", ndmin=2)[:, 0]
+    matrix_name = args.o if len(args.o) != 0 else os.path.join(args.r, "model_results.txt")
+    times_out = None
+    if len(args.t) != 0:
+        # Observation times, as calibration_mode = "time_series" in main_GPE_BAL_telemac.py
+        times_out = np.loadtxt(args.t, skiprows=1, delimiter=",", ndmin=2)[:, 0]
+
+    model_results = reextract_simulations(simulation_names, args.s, args.r, x, y, result_name_telemac=args.n,
+                                          variables=args.v, mesh_cache=args.c, max_workers=args.w,
+                                          matrix_name=matrix_name, sampling=args.m, times_out=times_out)
+    print("Training matrix " + str(model_results.shape) + " saved in " + matrix_name)
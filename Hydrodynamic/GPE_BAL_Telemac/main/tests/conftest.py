@@ -0,0 +1,6 @@
+# The tests import the modules of the main folder (ppmodules, auxiliary_functions_telemac) as the scripts do, so the
+# main folder is put on the path whatever folder pytest is started from
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
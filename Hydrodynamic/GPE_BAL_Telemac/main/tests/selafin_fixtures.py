@@ -0,0 +1,106 @@
+'''
+Synthetic *.slf files for the tests, written with ppSELAFIN itself
+'''
+
+import numpy as np
+from ppmodules.selafin_io_pp import ppSELAFIN
+
+VARIABLES = ["VELOCITY U", "VELOCITY V", "WATER DEPTH", "FREE SURFACE", "BOTTOM"]
+UNITS = ["M/S", "M/S", "M", "M", "M"]
+
+
+def make_mesh(nx=6, ny=5):
+    """
+    Function builds a structured triangular mesh of nx by ny nodes
+    Returns
+    -------
+    Tuple of IKLE (one based), IPOBO, x and y
+    """
+    x, y = np.meshgrid(np.arange(nx, dtype=np.float64) * 10.0, np.arange(ny, dtype=np.float64) * 5.0)
+    node = np.arange(nx * ny).reshape(ny, nx)
+    a, b, c, d = node[:-1, :-1].ravel(), node[:-1, 1:].ravel(), node[1:, 1:].ravel(), node[1:, :-1].ravel()
+    ikle = np.vstack((np.column_stack((a, b, c)), np.column_stack((a, c, d)))) + 1
+    ipobo = np.zeros(nx * ny, dtype=np.int32)
+    border = np.concatenate((node[0, :], node[1:, -1], node[-1, -2::-1], node[-2:0:-1, 0]))
+    ipobo[border] = np.arange(1, len(border) + 1)
+    return ikle.astype(np.int32), ipobo, x.ravel(), y.ravel()
+
+
+def make_results(n_times, n_nodes, ftype="f", seed=0):
+    """Returns times and (time, variable, node) values, exactly representable in the precision ftype"""
+    rng = np.random.default_rng(seed)
+    dtype = np.float32 if ftype == "f" else np.float64
+    times = (np.arange(n_times) * 0.5).astype(dtype).astype(np.float64)
+    values = rng.random((n_times, len(VARIABLES), n_nodes)).astype(dtype).astype(np.float64)
+    return times, values
+
+
+def write_selafin(slf_file, times, values, ftype="f", fsize=4, mesh=None, subset=None):
+    """
+    Function writes a synthetic 2d *.slf file with the VARIABLES
+    Parameters
+    ----------
+    slf_file : String
+    Path of the file
+    times : Numpy array
+    Times of the frames
+    values : Numpy array
+    (time, variable, node) results of all the VARIABLES
+    ftype, fsize : String, Integer
+    Precision ('f', 4 or 'd', 8)
+    mesh : Tuple
+    IKLE (one based), IPOBO, x and y; make_mesh() by default
+    subset : List
+    Names of the variables to write (all by default)
+
+    Returns
+    -------
+    The ppSELAFIN object used to write, closed
+    """
+    ikle, ipobo, x, y = make_mesh() if mesh is None else mesh
+    slf = ppSELAFIN(slf_file)
+    slf.setPrecision(ftype, fsize)
+    slf.setTitle("synthetic test file")
+    slf.setVarNames(list(VARIABLES))
+    slf.setVarUnits(list(UNITS))
+    if subset is not None:
+        slf.setVarSubset(subset)
+    slf.setIPARAM([1, 0, 0, 0, 0, 0, 0, 0, 0, 1])
+    slf.setDATE([2026, 10, 18, 12, 0, 0])
+    slf.setMesh(len(ikle), len(x), 3, ikle, ipobo, x, y)
+    slf.writeHeader()
+    for t, frame in zip(times, values):
+        slf.writeVariables(t, frame)
+    slf.close()
+    return slf
+
+
+def write_partitions(slf_files, times, values, ftype="f", fsize=4, mesh=None):
+    """
+    Function writes the same results as write_selafin, split in partitions as a parallel Telemac run does: every
+    element belongs to one partition (by the x of its centroid), the nodes on the interfaces are in all the
+    partitions around them, and the IPOBO record of each partition holds its local to global node numbering (KNOLG)
+    Parameters
+    ----------
+    slf_files : List of strings
+    Paths of the partition files, one per partition
+    times, values, ftype, fsize, mesh :
+    Same as in write_selafin
+
+    Returns
+    -------
+    List with the zero based global node of each local node, one array per partition
+    """
+    ikle, ipobo, x, y = make_mesh() if mesh is None else mesh
+    centroid = x[ikle - 1].mean(axis=1)
+    edges = np.quantile(centroid, np.linspace(0, 1, len(slf_files) + 1)[1:-1])
+    part_of = np.searchsorted(edges, centroid)
+    local2global = []
+    for i, slf_file in enumerate(slf_files):
+        part_ikle = ikle[part_of == i] - 1
+        l2g = np.unique(part_ikle)
+        local_ikle = np.searchsorted(l2g, part_ikle) + 1
+        write_selafin(slf_file, times, values[:, :, l2g], ftype, fsize,
+                      mesh=(local_ikle.astype(np.int32), (l2g + 1).astype(np.int32), x[l2g], y[l2g]))
+        local2global.append(l2g)
+    return local2global
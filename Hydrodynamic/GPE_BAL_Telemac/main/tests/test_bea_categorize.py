@@ -0,0 +1,69 @@
+'''
+PreProCategorization.categorize_raster block by block (serial and threaded) against the former classification of the
+whole array at once (digitize, masked_where and filled), on a tiled GeoTIFF with nodata cells and partial blocks
+'''
+
+import numpy as np
+import pytest
+
+for module in ("geopandas", "rasterio", "pandas", "alphashape", "mapclassify", "pyproj", "shapely", "scipy", "osgeo"):
+    pytest.importorskip(module)
+import rasterio
+import rasterio.transform
+import bea
+
+NODATA = -9999.0
+CLASS_BINS = [0.2, 0.5, 1.0, 2.0, 5.0]
+
+
+@pytest.fixture
+def raster_file(tmp_path):
+    """Tiled raster of 100 by 70 cells (blocks of 32, so the last ones are partial) with nodata cells"""
+    rng = np.random.default_rng(0)
+    values = (rng.random((70, 100)) * 6.0 - 0.5).astype(np.float32)
+    values[rng.random(values.shape) < 0.2] = NODATA
+    values[:, :7] = NODATA
+    # values on the bins, which belong to the lower class
+    values[10, 10:15] = CLASS_BINS
+    name = str(tmp_path / "values.tif")
+    with rasterio.open(name, "w", driver="GTiff", height=70, width=100, count=1, dtype="float32", crs="EPSG:4326",
+                       transform=rasterio.transform.from_origin(0, 70, 1, 1), nodata=NODATA, tiled=True,
+                       blockxsize=32, blockysize=32) as dst:
+        dst.write(values, 1)
+    return name
+
+
+def categorize_whole(raster, class_bins, map_out):
+    """The former categorize_raster, which classified the whole array at once"""
+    with rasterio.open(raster) as src:
+        array = src.read(1, masked=True)
+        meta = src.meta.copy()
+        nodatavalue = src.nodata
+    raster_fi = np.ma.filled(array, fill_value=-np.inf)
+    raster_class = np.digitize(raster_fi, class_bins, right=True)
+    raster_ma = np.ma.masked_where(raster_class == 0, raster_class, copy=True)
+    raster_ma_fi = np.ma.filled(raster_ma, fill_value=nodatavalue)
+    with rasterio.open(map_out, "w", **meta) as outf:
+        outf.write(raster_ma_fi.astype(rasterio.float64), 1)
+
+
+def read(name):
+    with rasterio.open(name) as src:
+        return src.read(1), src.meta
+
+
+@pytest.mark.parametrize("max_workers", [None, 4])
+def test_same_as_whole_array(tmp_path, raster_file, max_workers):
+    expected_name = str(tmp_path / "whole.tif")
+    categorize_whole(raster_file, CLASS_BINS, expected_name)
+    expected, expected_meta = read(expected_name)
+
+    out_name = str(tmp_path / ("blocks_" + str(max_workers) + ".tif"))
+    bea.PreProCategorization(raster_file).categorize_raster(CLASS_BINS, out_name, save_ascii=False,
+                                                            max_workers=max_workers)
+    classified, meta = read(out_name)
+    assert meta == expected_meta
+    np.testing.assert_array_equal(classified, expected)
+    # the nodata cells and the values below the first bin are nodata, the others have a class
+    assert np.all(classified[:, :7] == NODATA)
+    assert set(np.unique(classified)) <= {NODATA, 1.0, 2.0, 3.0, 4.0, 5.0}
@@ -0,0 +1,99 @@
+'''
+PreProFuzzy.norm_array in tiles (norm_array_tiled) against the whole raster at once: the tiles grid only the points of
+their buffered extent, and give the untiled raster within the tolerance documented in norm_array_tiled
+'''
+
+import numpy as np
+import pytest
+
+for module in ("geopandas", "rasterio", "pandas", "alphashape", "mapclassify", "pyproj", "shapely", "scipy", "osgeo"):
+    pytest.importorskip(module)
+import bea
+
+NODATA = -9999
+TILE = 64
+BUFFER = 16
+
+
+def make_points(n, width=300, height=200, seed=0):
+    """Random points of a raster of width by height cells of 1 m, with a smooth field and a linear one"""
+    rng = np.random.default_rng(seed)
+    x = rng.random(n) * width
+    y = rng.random(n) * height
+    # points on the corners, so the extent (and the grid) is exactly width by height
+    x[:4] = [0, width, 0, width]
+    y[:4] = [0, 0, height, height]
+    smooth = 1 + 0.5 * np.sin(x / 25) * np.cos(y / 15)
+    linear = 2 + 0.01 * x - 0.03 * y
+    return x, y, smooth, linear
+
+
+def raster(x, y, z):
+    return bea.PreProFuzzy.from_arrays(x, y, z, attribute="variable", crs="EPSG:4326", nodatavalue=NODATA, res=1)
+
+
+def test_tile_points():
+    x, y, smooth, linear = make_points(5000)
+    grid = raster(x, y, smooth)
+    rows, cols, values, starts = grid.tile_points(TILE)
+    tile_cols = -(-grid.ncol // TILE)
+    assert starts[-1] == len(x)
+    # every point is in its tile, and the cells are those of points_to_grid
+    tile = np.repeat(np.arange(len(starts) - 1), np.diff(starts))
+    np.testing.assert_array_equal(rows // TILE * tile_cols + cols // TILE, tile)
+    bins, counts = grid.bin_points()
+    np.testing.assert_array_equal(np.sort(rows.astype(np.int64) * grid.ncol + cols), np.sort(bins))
+
+
+@pytest.mark.parametrize("method", ["linear", "cubic"])
+def test_dense_points(method):
+    # one point per cell: the tiles and the whole raster cover the same cells and give the same values
+    width, height = 300, 200
+    rng = np.random.default_rng(1)
+    yy, xx = np.mgrid[0:height, 0:width]
+    x = (xx + 0.05 + 0.9 * rng.random(xx.shape)).ravel()
+    y = (yy + 0.05 + 0.9 * rng.random(yy.shape)).ravel()
+    x = np.concatenate(([0, width], x))
+    y = np.concatenate(([0, height], y))
+    linear = 2 + 0.01 * x - 0.03 * y
+    grid = raster(x, y, linear)
+    whole = grid.norm_array(method)
+    tiled = grid.norm_array(method, tile_size=TILE, buffer=BUFFER, max_workers=4)
+    np.testing.assert_array_equal(tiled == NODATA, whole == NODATA)
+    np.testing.assert_allclose(tiled, whole, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("method", ["linear", "cubic"])
+def test_random_points(method):
+    x, y, smooth, linear = make_points(40000)
+    for z in (smooth, linear):
+        grid = raster(x, y, z)
+        whole = grid.norm_array(method)
+        tiled = grid.norm_array(method, tile_size=TILE, buffer=BUFFER, max_workers=4)
+        valid = tiled != NODATA
+        # the tiles leave nodata only cells filled by long triangles along the edges of the points
+        assert np.all(whole[valid] != NODATA)
+        missing = np.argwhere(valid != (whole != NODATA))
+        on_edge = (missing[:, 0] == 0) | (missing[:, 0] == grid.nrow - 1) | (missing[:, 1] == 0) | \
+            (missing[:, 1] == grid.ncol - 1)
+        assert np.all(on_edge)
+        assert len(missing) < 0.01 * whole.size
+        # the values differ by less than a few percent of their range (see norm_array_tiled)
+        np.testing.assert_allclose(tiled[valid], whole[valid], rtol=0, atol=0.05 * (z.max() - z.min()))
+
+
+def test_mask_and_raster_file(tmp_path):
+    import rasterio
+    x, y, smooth, linear = make_points(40000)
+    grid = raster(x, y, smooth)
+    mask = np.zeros((grid.nrow, grid.ncol), dtype=bool)
+    mask[20:150, 30:280] = True
+    tiled = grid.norm_array("linear", tile_size=TILE, buffer=BUFFER, mask=mask)
+    assert np.all(tiled[~mask] == NODATA)
+    np.testing.assert_array_equal(tiled[mask], grid.norm_array("linear", tile_size=TILE, buffer=BUFFER)[mask])
+
+    raster_file = str(tmp_path / "tiled.tif")
+    assert grid.norm_array("linear", tile_size=TILE, buffer=BUFFER, raster_file=raster_file, mask=mask) is None
+    with rasterio.open(raster_file) as src:
+        assert src.nodata == NODATA
+        np.testing.assert_array_equal(src.read(1), tiled)
@@ -0,0 +1,36 @@
+'''
+compact_simulation replaces a result file only once the jobs still reading it (its rasters) are finished
+'''
+
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from ppmodules.selafin_io_pp import ppSELAFIN
+from auxiliary_functions_telemac import compact_simulation
+from selafin_fixtures import make_mesh, make_results, write_selafin
+
+
+def test_compaction_waits_for_readers(tmp_path):
+    slf_file = str(tmp_path / "res_tel_PC1.slf")
+    times, values = make_results(3, make_mesh()[2].size, "d")
+    write_selafin(slf_file, times, values, "d", 8)
+
+    raster_job = Future()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        compaction = pool.submit(compact_simulation, slf_file, ["WATER DEPTH"], None, True, True, [raster_job])
+        # the reader still gets the original file, however long it takes
+        time.sleep(0.2)
+        assert not compaction.done()
+        slf = ppSELAFIN(slf_file)
+        slf.readHeader()
+        assert slf.getPrecision() == ("d", 8)
+        assert len(slf.getVarNames()) == values.shape[1]
+        slf.close()
+        raster_job.set_exception(RuntimeError("raster failed"))
+        assert compaction.result(timeout=30) == slf_file
+
+    slf = ppSELAFIN(slf_file)
+    slf.readHeader()
+    assert slf.getPrecision() == ("f", 4)
+    assert [v.strip() for v in slf.getVarNames()] == ["WATER DEPTH"]
+    slf.close()
+    assert (tmp_path / "res_tel_PC1_dropped.npz").is_file()
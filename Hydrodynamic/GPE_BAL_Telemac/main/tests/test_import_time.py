@@ -0,0 +1,30 @@
+'''
+Importing auxiliary_functions_telemac (as the calibration script and every raster worker do) must stay fast: the heavy
+packages are only imported by the functions that need them
+'''
+
+import json
+import os
+import subprocess
+import sys
+
+MAIN = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# seconds, the target is well under a second (about 0.15 s measured, most of it numpy)
+BUDGET = 0.5
+HEAVY = ["scipy", "pandas", "rasterio", "osgeo", "geopandas", "bea"]
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import auxiliary_functions_telemac
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % HEAVY
+
+
+def test_import_time():
+    # a fresh interpreter, so nothing is imported yet
+    out = subprocess.run([sys.executable, "-c", SCRIPT], cwd=MAIN, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    assert result["loaded"] == []
+    assert result["elapsed"] < BUDGET
@@ -0,0 +1,79 @@
+'''
+Boundary rings and domain mask of a mesh taken from its topology, including pinch nodes (where the boundary touches
+itself) and islands
+'''
+
+import numpy as np
+import pytest
+from ppmodules.mesh_boundary import boundaryEdges, boundaryRings, boundaryMask
+from selafin_fixtures import make_mesh
+
+
+def square_blocks(blocks, n=3):
+    """Mesh of the squares (i, j) of blocks, each of n by n cells of two triangles, sharing the nodes where they meet"""
+    nodes = {}
+    ikle = []
+
+    def node(i, j):
+        return nodes.setdefault((i, j), len(nodes))
+
+    for bi, bj in blocks:
+        for i in range(bi * n, (bi + 1) * n):
+            for j in range(bj * n, (bj + 1) * n):
+                a, b, c, d = node(i, j), node(i + 1, j), node(i + 1, j + 1), node(i, j + 1)
+                ikle += [(a, b, c), (a, c, d)]
+    xy = np.array(sorted(nodes, key=nodes.get), dtype=np.float64)
+    return xy[:, 0], xy[:, 1], np.array(ikle)
+
+
+def check_rings(ikle, rings):
+    # every boundary edge is in one ring, once
+    edges = boundaryEdges(ikle)
+    chained = np.concatenate([np.column_stack((r, np.roll(r, -1))) for r in rings])
+    assert len(chained) == len(edges)
+    assert set(map(tuple, chained)) == set(map(tuple, edges))
+
+
+@pytest.mark.parametrize("flip", [False, True])
+def test_bowtie(flip):
+    # two triangles touching at node 2 only
+    x = np.array([-2.0, -2.0, 0.0, 2.0, 2.0])
+    y = np.array([-1.0, 1.0, 0.0, -1.0, 1.0])
+    ikle = np.array([[0, 2, 1], [2, 3, 4]])
+    if flip:
+        ikle = ikle[:, ::-1]
+    rings, areas = boundaryRings(x, y, ikle)
+    check_rings(ikle, rings)
+    assert sorted(sorted(r) for r in map(list, rings)) == [[0, 1, 2], [2, 3, 4]]
+    np.testing.assert_allclose(areas, [-2.0, -2.0] if flip else [2.0, 2.0])
+
+
+def test_pinched_blocks():
+    # three blocks touching at corners: a chain of two pinch nodes
+    x, y, ikle = square_blocks([(0, 0), (1, 1), (2, 0)])
+    rings, areas = boundaryRings(x, y, ikle)
+    check_rings(ikle, rings)
+    assert len(rings) == 3
+    assert all(len(r) == 12 for r in rings)
+    np.testing.assert_allclose(areas, [9.0, 9.0, 9.0])
+
+
+def test_island_touching_the_boundary():
+    # a ring of blocks around a missing one, and a block touching the outside at a corner
+    blocks = [(i, j) for i in range(3) for j in range(3) if (i, j) != (1, 1)] + [(3, 3)]
+    x, y, ikle = square_blocks(blocks)
+    rings, areas = boundaryRings(x, y, ikle)
+    check_rings(ikle, rings)
+    np.testing.assert_allclose(areas, [81.0, -9.0, 9.0])
+
+
+def test_mask():
+    ikle, ipobo, x, y = make_mesh(12, 8)
+    ikle = ikle - 1
+    rings, areas = boundaryRings(x, y, ikle)
+    assert len(rings) == 1
+    np.testing.assert_allclose(areas, [110.0 * 35.0])
+    # cells of 1 m over the mesh, with one row and column of cells outside of it all around
+    mask = boundaryMask(x, y, ikle, -1.0, 36.0, 1.0, 37, 112)
+    assert mask.sum() == 110 * 35
+    assert not mask[0].any() and not mask[-1].any() and not mask[:, 0].any() and not mask[:, -1].any()
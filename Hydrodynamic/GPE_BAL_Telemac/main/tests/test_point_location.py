@@ -0,0 +1,71 @@
+'''
+locatePoints and samplePoints (the "mesh" sampling of get_variable_value): the element containing each point, linear
+fields reproduced exactly inside the triangles, on their nodes and edges, and the closest node outside the mesh
+'''
+
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+from ppmodules.point_location import locatePoints, samplePoints
+from selafin_fixtures import make_mesh
+
+IKLE, IPOBO, X, Y = make_mesh(12, 8)
+IKLE = IKLE - 1
+
+
+def linear(x, y):
+    return 2.0 * x - 3.0 * y + 1.5
+
+
+def inside_triangle(elem, px, py):
+    # the point is on the inner side of the three edges (the triangles of make_mesh are counterclockwise)
+    xe, ye = X[IKLE[elem]], Y[IKLE[elem]]
+    cross = [(xe[:, (i + 1) % 3] - xe[:, i]) * (py - ye[:, i]) - (ye[:, (i + 1) % 3] - ye[:, i]) * (px - xe[:, i])
+             for i in range(3)]
+    return np.all(np.array(cross) >= -1e-9, axis=0)
+
+
+def test_linear_field_inside():
+    rng = np.random.default_rng(0)
+    px = rng.random(200) * X.max()
+    py = rng.random(200) * Y.max()
+    elem, nodes, weights = locatePoints(X, Y, IKLE, px, py, k=4)
+    assert np.all(elem >= 0)
+    assert np.all(inside_triangle(elem, px, py))
+    np.testing.assert_array_equal(nodes, IKLE[elem])
+    np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+    np.testing.assert_allclose(samplePoints(linear(X, Y), nodes, weights), linear(px, py), atol=1e-12)
+
+
+def test_nodes_and_edges():
+    # the nodes themselves, and the middle of horizontal, vertical and diagonal edges
+    px = np.concatenate((X, [15.0, 30.0, 25.0]))
+    py = np.concatenate((Y, [10.0, 12.5, 7.5]))
+    elem, nodes, weights = locatePoints(X, Y, IKLE, px, py)
+    assert np.all(elem >= 0)
+    sampled = samplePoints(linear(X, Y), nodes, weights)
+    np.testing.assert_allclose(sampled, linear(px, py), atol=1e-12)
+    np.testing.assert_allclose(sampled[:len(X)], linear(X, Y), atol=1e-12)
+
+
+def test_outside_closest_node():
+    px = np.array([-4.0, 200.0, 55.0])
+    py = np.array([-3.0, 20.0, 60.0])
+    elem, nodes, weights = locatePoints(X, Y, IKLE, px, py)
+    np.testing.assert_array_equal(elem, -1)
+    closest = np.argmin((X[:, np.newaxis] - px) ** 2 + (Y[:, np.newaxis] - py) ** 2, axis=0)
+    values = np.random.default_rng(1).random(len(X))
+    np.testing.assert_array_equal(samplePoints(values, nodes, weights), values[closest])
+
+
+def test_leading_axes():
+    # (time, variable, node) values give (time, variable, point) samples
+    rng = np.random.default_rng(2)
+    values = rng.random((3, 2, len(X)))
+    px = rng.random(5) * X.max()
+    py = rng.random(5) * Y.max()
+    elem, nodes, weights = locatePoints(X, Y, IKLE, px, py)
+    sampled = samplePoints(values, nodes, weights)
+    assert sampled.shape == (3, 2, 5)
+    np.testing.assert_allclose(sampled[1, 0], samplePoints(values[1, 0], nodes, weights))
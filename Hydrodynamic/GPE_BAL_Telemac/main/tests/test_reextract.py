@@ -0,0 +1,63 @@
+'''
+reextract_simulations on synthetic archived runs: the training matrix of the last time step and of the time series at
+the observation times, and the manifest skipping the runs already extracted the same way
+'''
+
+import os
+import numpy as np
+import pytest
+from auxiliary_functions_telemac import reextract_simulations, get_variable_value, get_variable_time_series, \
+    flatten_time_series
+from selafin_fixtures import make_mesh, make_results, write_selafin
+
+MESH = make_mesh(12, 8)
+NAMES = ["PC1", "PC2"]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Two archived runs in tmp_path/simulations, and the calibration points"""
+    simulations = tmp_path / "simulations"
+    results = tmp_path / "results"
+    simulations.mkdir()
+    results.mkdir()
+    for seed, name in enumerate(NAMES):
+        times, values = make_results(5, len(MESH[2]), "d", seed=seed)
+        write_selafin(str(simulations / ("res_tel_PC" + name[2:] + ".slf")), times, values, "d", 8, mesh=MESH)
+    rng = np.random.default_rng(3)
+    x = (rng.random(6) * 100 + 5).reshape(-1, 1)
+    y = (rng.random(6) * 30 + 2).reshape(-1, 1)
+    return str(simulations), str(results), str(tmp_path / "cache"), x, y
+
+
+def test_last_time_step(archive):
+    simulations, results, cache, x, y = archive
+    matrix = reextract_simulations(NAMES, simulations, results, x, y, mesh_cache=cache, max_workers=2,
+                                   sampling="mesh")
+    for row, name in zip(matrix, NAMES):
+        expected = get_variable_value(os.path.join(simulations, "res_tel_PC" + name[2:] + ".slf"), x, y,
+                                      sampling="mesh", mesh_cache=cache)
+        np.testing.assert_allclose(row, expected[:, 2:].T.ravel(), rtol=1e-7, atol=1e-7)
+    assert os.path.isfile(os.path.join(results, "PC1_VELOCITY.txt"))
+    assert os.path.isfile(os.path.join(results, "extraction_manifest.json"))
+
+
+def test_time_series(archive):
+    simulations, results, cache, x, y = archive
+    times_out = np.array([0.25, 1.0, 1.6])
+    matrix = reextract_simulations(NAMES, simulations, results, x, y, mesh_cache=cache, max_workers=2,
+                                   times_out=times_out)
+    assert matrix.shape == (len(NAMES), 2 * len(x) * len(times_out))
+    for row, name in zip(matrix, NAMES):
+        times, series = get_variable_time_series(os.path.join(simulations, "res_tel_PC" + name[2:] + ".slf"), x, y,
+                                                 times_out=times_out, mesh_cache=cache)
+        np.testing.assert_allclose(row, flatten_time_series(series), rtol=1e-7, atol=1e-7)
+    series_name = os.path.join(results, "PC1_VELOCITY_series.txt")
+    assert os.path.isfile(os.path.join(results, "extraction_series_manifest.json"))
+
+    # unchanged runs and times are not extracted again, other times are
+    modified = os.stat(series_name).st_mtime_ns
+    reextract_simulations(NAMES, simulations, results, x, y, mesh_cache=cache, times_out=times_out)
+    assert os.stat(series_name).st_mtime_ns == modified
+    matrix = reextract_simulations(NAMES, simulations, results, x, y, mesh_cache=cache, times_out=times_out[:2])
+    assert matrix.shape == (len(NAMES), 2 * len(x) * 2)
@@ -0,0 +1,110 @@
+'''
+Round trips of ppSELAFIN: files written with writeHeader/writeVariables (all the variables, a subset of them, and frames
+appended with openAppend) are read back with readHeader/readTimes/readVariables/readMemmap
+'''
+
+import numpy as np
+import pytest
+from ppmodules.selafin_io_pp import ppSELAFIN
+from selafin_fixtures import VARIABLES, UNITS, make_mesh, make_results, write_selafin
+
+PRECISIONS = [("f", 4), ("d", 8)]
+
+
+def read_back(slf_file):
+    """Returns the ppSELAFIN object (header and times read), the values of readVariables and those of readMemmap"""
+    slf = ppSELAFIN(slf_file)
+    slf.readHeader()
+    slf.readTimes()
+    frames = []
+    for t in range(len(slf.getTimes())):
+        slf.readVariables(t)
+        frames.append(slf.getVarValues().copy())
+    slf.readMemmap()
+    mapped = np.array(slf.getMemmapValues(), dtype=np.float64)
+    return slf, np.array(frames), mapped
+
+
+def check_header(slf, names, ftype, fsize):
+    ikle, ipobo, x, y = make_mesh()
+    assert slf.getPrecision() == (ftype, fsize)
+    assert slf.title == "{:<72}".format("synthetic test file")
+    assert slf.precision == ("SELAFIND" if ftype == "d" else "SELAFIN ")
+    assert [v.strip() for v in slf.getVarNames()] == names
+    assert [u.strip() for u in slf.getVarUnits()] == [UNITS[VARIABLES.index(n)] for n in names]
+    assert list(slf.IPARAM) == [1, 0, 0, 0, 0, 0, 0, 0, 0, 1]
+    assert list(slf.getDATE()) == [2026, 10, 18, 12, 0, 0]
+    assert (slf.getNELEM(), slf.getNPOIN(), slf.NDP) == (len(ikle), len(x), 3)
+    np.testing.assert_array_equal(slf.getIKLE(), ikle)
+    np.testing.assert_array_equal(slf.getIPOBO(), ipobo)
+    np.testing.assert_array_equal(slf.getMeshX(), x)
+    np.testing.assert_array_equal(slf.getMeshY(), y)
+
+
+@pytest.mark.parametrize("ftype, fsize", PRECISIONS)
+def test_full_write(tmp_path, ftype, fsize):
+    slf_file = str(tmp_path / "full.slf")
+    times, values = make_results(4, make_mesh()[2].size, ftype)
+    write_selafin(slf_file, times, values, ftype, fsize)
+
+    slf, frames, mapped = read_back(slf_file)
+    check_header(slf, VARIABLES, ftype, fsize)
+    np.testing.assert_array_equal(slf.getTimes(), times)
+    np.testing.assert_array_equal(frames, values)
+    np.testing.assert_array_equal(mapped, values)
+    slf.close()
+
+
+@pytest.mark.parametrize("ftype, fsize", PRECISIONS)
+def test_subset_write(tmp_path, ftype, fsize):
+    slf_file = str(tmp_path / "subset.slf")
+    names = ["WATER DEPTH", "VELOCITY U"]
+    times, values = make_results(3, make_mesh()[2].size, ftype)
+    write_selafin(slf_file, times, values, ftype, fsize, subset=names)
+
+    # the subset is written in the order of names
+    index = [VARIABLES.index(v) for v in names]
+    slf, frames, mapped = read_back(slf_file)
+    check_header(slf, names, ftype, fsize)
+    np.testing.assert_array_equal(slf.getTimes(), times)
+    np.testing.assert_array_equal(frames, values[:, index])
+    np.testing.assert_array_equal(mapped, values[:, index])
+    slf.close()
+
+
+@pytest.mark.parametrize("ftype, fsize", PRECISIONS)
+def test_append(tmp_path, ftype, fsize):
+    slf_file = str(tmp_path / "append.slf")
+    times, values = make_results(5, make_mesh()[2].size, ftype)
+    write_selafin(slf_file, times[:2], values[:2], ftype, fsize)
+
+    slf = ppSELAFIN(slf_file)
+    slf.openAppend()
+    for t, frame in zip(times[2:], values[2:]):
+        slf.writeVariables(t, frame)
+    slf.close()
+
+    slf, frames, mapped = read_back(slf_file)
+    check_header(slf, VARIABLES, ftype, fsize)
+    np.testing.assert_array_equal(slf.getTimes(), times)
+    np.testing.assert_array_equal(frames, values)
+    np.testing.assert_array_equal(mapped, values)
+    slf.close()
+
+
+def test_append_drops_incomplete_frame(tmp_path):
+    slf_file = str(tmp_path / "crashed.slf")
+    times, values = make_results(3, make_mesh()[2].size)
+    write_selafin(slf_file, times[:2], values[:2])
+    with open(slf_file, "ab") as f:
+        f.write(b"\x00" * 10)
+
+    slf = ppSELAFIN(slf_file)
+    slf.openAppend()
+    slf.writeVariables(times[2], values[2])
+    slf.close()
+
+    slf, frames, mapped = read_back(slf_file)
+    np.testing.assert_array_equal(slf.getTimes(), times)
+    np.testing.assert_array_equal(frames, values)
+    slf.close()
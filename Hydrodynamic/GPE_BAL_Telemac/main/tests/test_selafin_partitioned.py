@@ -0,0 +1,137 @@
+'''
+ppSELAFINPartitioned on synthetic partition files must give the same global results as ppSELAFIN on the merged file
+'''
+
+import numpy as np
+import pytest
+from ppmodules.selafin_io_pp import ppSELAFIN
+from ppmodules.selafin_partitioned import ppSELAFINPartitioned, openResults
+from ppmodules.selafin_stats import reduceFrames
+from ppmodules.selafin_derived import extractDerived
+from selafin_fixtures import VARIABLES, make_mesh, make_results, write_selafin, write_partitions
+
+MESH = make_mesh(12, 8)
+
+
+@pytest.fixture(params=[("f", 4), ("d", 8)])
+def results(tmp_path, request):
+    """Merged file and its three partitions, with the same results"""
+    ftype, fsize = request.param
+    times, values = make_results(4, len(MESH[2]), ftype)
+    merged = str(tmp_path / "merged.slf")
+    parts = [str(tmp_path / ("T2DRES00003-%05d" % i)) for i in range(3)]
+    write_selafin(merged, times, values, ftype, fsize, mesh=MESH)
+    write_partitions(parts, times, values, ftype, fsize, mesh=MESH)
+
+    slf = ppSELAFIN(merged)
+    slf.readHeader()
+    partitioned = ppSELAFINPartitioned(parts)
+    partitioned.readHeader()
+    yield slf, partitioned, times, values
+    slf.close()
+    partitioned.close()
+
+
+def test_partitions_are_overlapping(results):
+    slf, partitioned, times, values = results
+    sizes = [part.getNPOIN() for part in partitioned.parts]
+    assert sum(sizes) > slf.getNPOIN()
+
+
+def test_header(results):
+    slf, partitioned, times, values = results
+    assert partitioned.getNPOIN() == slf.getNPOIN()
+    assert partitioned.getNELEM() == slf.getNELEM()
+    assert partitioned.getVarNames() == slf.getVarNames()
+    assert partitioned.getPrecision() == slf.getPrecision()
+    assert partitioned.getVarIndex(["BOTTOM", "VELOCITY U"]) == slf.getVarIndex(["BOTTOM", "VELOCITY U"])
+    assert len(partitioned.frameOffsets) == len(slf.frameOffsets)
+    assert list(partitioned.getDATE()) == list(slf.getDATE())
+    np.testing.assert_array_equal(partitioned.getMeshX(), slf.getMeshX())
+    np.testing.assert_array_equal(partitioned.getMeshY(), slf.getMeshY())
+    # the elements are the same, in the order of the partitions
+    np.testing.assert_array_equal(np.unique(partitioned.getIKLE(), axis=0), np.unique(slf.getIKLE(), axis=0))
+
+
+def test_boundary_numbering(results):
+    slf, partitioned, times, values = results
+    ipobo = partitioned.getIPOBO()
+    boundary = np.asarray(slf.getIPOBO()) > 0
+    np.testing.assert_array_equal(ipobo > 0, boundary)
+    np.testing.assert_array_equal(np.sort(ipobo[boundary]), np.arange(1, boundary.sum() + 1))
+
+
+def test_frames(results):
+    slf, partitioned, times, values = results
+    partitioned.readTimes()
+    np.testing.assert_array_equal(partitioned.getTimes(), times)
+    names = ["WATER DEPTH", "VELOCITY V"]
+    for t in range(len(times)):
+        partitioned.readVariables(t)
+        np.testing.assert_array_equal(partitioned.getVarValues(), values[t])
+        partitioned.readVariablesByName(t, names)
+        np.testing.assert_array_equal(partitioned.getSelectedVarValues(), slf.extractVariables(t, names))
+        np.testing.assert_array_equal(partitioned.extractVariables(t, names), slf.extractVariables(t, names))
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+def test_nodes(results, memmap):
+    slf, partitioned, times, values = results
+    if memmap:
+        slf.readMemmap()
+        partitioned.readMemmap()
+        np.testing.assert_array_equal(partitioned.getTimes(), times)
+    nodes = np.array([0, 5, 17, 40, 41, 95, 40])
+    for names, first, last in ((None, 0, None), (["BOTTOM", "VELOCITY U"], 1, 2)):
+        expected = slf.extractVariablesAtNodes(nodes, names, first, last)
+        np.testing.assert_array_equal(partitioned.extractVariablesAtNodes(nodes, names, first, last), expected)
+        partitioned.readVariablesAtNodes(nodes, names, first, last)
+        np.testing.assert_array_equal(partitioned.getVarValuesAtNodes(), expected)
+    with pytest.raises(IndexError):
+        partitioned.extractVariablesAtNodes([len(MESH[2])])
+
+
+def test_statistics_and_derived(results):
+    slf, partitioned, times, values = results
+    names = ["WATER DEPTH", "FREE SURFACE SLOPE"]
+    expected = reduceFrames(slf, names, stats=("max", "mean"))
+    reduced = reduceFrames(partitioned, names, stats=("max", "mean"))
+    for name in names:
+        for stat in ("max", "mean"):
+            np.testing.assert_allclose(reduced[name][stat], expected[name][stat], rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(extractDerived(partitioned, 2, names), extractDerived(slf, 2, names), rtol=1e-12,
+                               atol=1e-12)
+
+
+def test_open_results(results, tmp_path):
+    slf, partitioned, times, values = results
+    cache = str(tmp_path / "cache")
+    opened = openResults(partitioned.slf_files, cache_dir=cache)
+    assert isinstance(opened, ppSELAFINPartitioned)
+    assert (tmp_path / "cache" / opened.geometry_key).is_dir()
+    opened.close()
+    opened = openResults(slf.slf_file)
+    assert isinstance(opened, ppSELAFIN)
+    opened.close()
+
+
+def test_get_variable_value(results, tmp_path):
+    from auxiliary_functions_telemac import get_variable_value
+    slf, partitioned, times, values = results
+    rng = np.random.default_rng(1)
+    x = (rng.random(20) * 100 + 5).reshape(-1, 1)
+    y = (rng.random(20) * 30 + 2).reshape(-1, 1)
+    variables = ("WATER DEPTH", "FREE SURFACE")
+    expected = get_variable_value(slf.slf_file, x, y, sampling="mesh", variables=variables)
+    sampled = get_variable_value(partitioned.slf_files, x, y, sampling="mesh", variables=variables,
+                                 mesh_cache=str(tmp_path / "cache"))
+    np.testing.assert_allclose(sampled, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_time_series_without_frames(results):
+    from auxiliary_functions_telemac import get_variable_time_series
+    slf, partitioned, times, values = results
+    x = np.array([[20.0], [60.0]])
+    y = np.array([[10.0], [20.0]])
+    with pytest.raises(ValueError, match="No frame of"):
+        get_variable_time_series(partitioned.slf_files, x, y, time_window=(times[-1] + 1, times[-1] + 2))
@@ -0,0 +1,67 @@
+'''
+Temporal statistics of reduceFrames against numpy on all the frames: the duration above a threshold (one for all the
+variables or one per variable) and the mean of frames sharing one time
+'''
+
+import warnings
+import numpy as np
+import pytest
+from ppmodules.selafin_io_pp import ppSELAFIN
+from ppmodules.selafin_stats import reduceFrames
+from selafin_fixtures import VARIABLES, make_mesh, make_results, write_selafin
+
+
+def open_file(tmp_path, times, values):
+    slf_file = str(tmp_path / "stats.slf")
+    write_selafin(slf_file, times, values, "d", 8)
+    slf = ppSELAFIN(slf_file)
+    slf.readHeader()
+    return slf
+
+
+def expected_duration(times, values, limit):
+    # time of the frames above the limit, each frame counting from the previous one
+    dt = np.concatenate(([0.0], np.diff(times)))
+    return np.sum((values > limit) * dt[:, np.newaxis], axis=0)
+
+
+@pytest.mark.parametrize("threshold", [0.5, {"WATER DEPTH": 0.2, "VELOCITY U": 0.7}])
+def test_duration(tmp_path, threshold):
+    times, values = make_results(6, make_mesh()[2].size, "d")
+    slf = open_file(tmp_path, times, values)
+    names = ["WATER DEPTH", "VELOCITY U"]
+    reduced = reduceFrames(slf, names, stats=("duration",), threshold=threshold)
+    for name in names:
+        limit = threshold[name] if isinstance(threshold, dict) else threshold
+        expected = expected_duration(times, values[:, VARIABLES.index(name)], limit)
+        np.testing.assert_allclose(reduced[name]["duration"], expected)
+    slf.close()
+
+
+def test_frames_at_one_time(tmp_path):
+    times, values = make_results(4, make_mesh()[2].size, "d")
+    slf = open_file(tmp_path, np.zeros(4), values)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        reduced = reduceFrames(slf, ["WATER DEPTH"], stats=("mean", "duration"), first=1, last=3)
+    np.testing.assert_allclose(reduced["WATER DEPTH"]["mean"], values[1:4, VARIABLES.index("WATER DEPTH")].mean(axis=0))
+    np.testing.assert_array_equal(reduced["WATER DEPTH"]["duration"], 0.0)
+    slf.close()
+
+
+def test_get_variable_value_threshold(tmp_path):
+    from auxiliary_functions_telemac import get_variable_value
+    times, values = make_results(6, make_mesh()[2].size, "d")
+    slf = open_file(tmp_path, times, values)
+    slf.close()
+    x = np.array([[12.0], [31.0]])
+    y = np.array([[7.0], [13.0]])
+    variables = ("WATER DEPTH", "VELOCITY U")
+    # the water depth (below 1) never exceeds its threshold, the velocity exceeds its own at times
+    never = get_variable_value(slf.slf_file, x, y, statistic="duration", sampling="mesh", variables=variables,
+                               threshold={"WATER DEPTH": 2.0, "VELOCITY U": 0.5})
+    always = get_variable_value(slf.slf_file, x, y, statistic="duration", sampling="mesh", variables=variables,
+                                threshold=-1.0)
+    np.testing.assert_array_equal(never[:, 2], 0.0)
+    assert np.all(never[:, 3] > 0.0)
+    np.testing.assert_allclose(always[:, 2:], times[-1] - times[0])
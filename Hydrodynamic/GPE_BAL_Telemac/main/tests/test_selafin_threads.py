@@ -0,0 +1,83 @@
+'''
+Many threads extracting from one shared ppSELAFIN must get the same results as serial reads, with os.pread and with
+the locked seek/read fallback used where os.pread is not available
+'''
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from ppmodules.selafin_io_pp import ppSELAFIN
+from selafin_fixtures import VARIABLES, make_mesh, make_results, write_selafin
+
+N_THREADS = 16
+N_TASKS = 400
+
+
+@pytest.fixture(params=["pread", "locked"])
+def shared(tmp_path, monkeypatch, request):
+    """One ppSELAFIN on a synthetic file, read with os.pread or with the locked fallback"""
+    mesh = make_mesh(40, 30)
+    times, values = make_results(12, len(mesh[2]), "d")
+    slf_file = str(tmp_path / "shared.slf")
+    write_selafin(slf_file, times, values, "d", 8, mesh=mesh)
+    if request.param == "locked":
+        monkeypatch.delattr(os, "pread")
+    slf = ppSELAFIN(slf_file)
+    slf.readHeader()
+    yield slf
+    slf.close()
+
+
+def tasks(n_times, n_nodes, seed=0):
+    """Random extraction tasks: (frame, variables) for extractVariables, (nodes, variables, first, last) otherwise"""
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(N_TASKS):
+        names = list(rng.choice(VARIABLES, size=rng.integers(1, len(VARIABLES) + 1), replace=False))
+        if i % 2 == 0:
+            out.append(("frame", int(rng.integers(n_times)), names))
+        else:
+            first = int(rng.integers(n_times))
+            last = int(rng.integers(first, n_times))
+            nodes = rng.integers(0, n_nodes, size=rng.integers(1, 50))
+            out.append(("nodes", (nodes, names, first, last), None))
+    return out
+
+
+def run(slf, task):
+    kind, args, names = task
+    if kind == "frame":
+        return slf.extractVariables(args, names)
+    return slf.extractVariablesAtNodes(*args)
+
+
+def test_threads_match_serial(shared):
+    # the position of the shared file object must not be used nor moved by the positional reads
+    if not hasattr(os, "pread"):
+        shared.f.seek(123)
+    work = tasks(len(shared.frameOffsets), shared.getNPOIN())
+    serial = [run(shared, task) for task in work]
+    with ThreadPoolExecutor(max_workers=N_THREADS) as pool:
+        threaded = list(pool.map(lambda task: run(shared, task), work))
+    for expected, value in zip(serial, threaded):
+        np.testing.assert_array_equal(value, expected)
+    if not hasattr(os, "pread"):
+        assert shared.f.tell() == 123
+
+
+def test_threads_match_file(shared):
+    # a fresh object reading frame by frame gives the reference values
+    reference = ppSELAFIN(shared.slf_file)
+    reference.readHeader()
+    frames = []
+    for t in range(len(reference.frameOffsets)):
+        reference.readVariables(t)
+        frames.append(reference.getVarValues().copy())
+    reference.close()
+    frames = np.array(frames)
+
+    with ThreadPoolExecutor(max_workers=N_THREADS) as pool:
+        threaded = list(pool.map(lambda t: shared.extractVariables(t % len(frames), VARIABLES), range(N_TASKS)))
+    for t, value in enumerate(threaded):
+        np.testing.assert_array_equal(value, frames[t % len(frames)])